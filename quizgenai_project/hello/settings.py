@@ -10,6 +10,25 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-temporary-secret')
 DEBUG = str(os.environ.get('DEBUG', 'True')).lower() in ('1', 'true', 'yes')
 
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+# Comma-separated pool of keys; requests go to the least-loaded key with quota left.
+GEMINI_API_KEYS = [key.strip() for key in os.environ.get('GEMINI_API_KEYS', GEMINI_API_KEY).split(',') if key.strip()]
+GEMINI_KEY_REQUESTS_PER_MINUTE = int(os.environ.get('GEMINI_KEY_REQUESTS_PER_MINUTE', 10))
+GEMINI_KEY_REQUESTS_PER_DAY = int(os.environ.get('GEMINI_KEY_REQUESTS_PER_DAY', 1500))
+GEMINI_KEY_COOLDOWN = int(os.environ.get('GEMINI_KEY_COOLDOWN', 60))  # seconds, doubles on repeated quota errors
+GEMINI_KEY_MAX_WAIT = int(os.environ.get('GEMINI_KEY_MAX_WAIT', 15))  # seconds to wait for a free key
+GEMINI_MODEL_NAME = os.environ.get('GEMINI_MODEL_NAME', 'gemini-2.5-flash')
+
+# Which LLM backend generates quizzes: 'gemini', or 'fake' for offline
+# profiling and load tests (returns valid quiz JSON, no key or network needed).
+QUIZ_LLM_BACKEND = os.environ.get('QUIZ_LLM_BACKEND', 'gemini')
+# 'verbose' asks the model for keyed objects, 'compact' for positional arrays
+# (fewer output tokens); both are expanded to the same quiz_data shape.
+QUIZ_RESPONSE_FORMAT = os.environ.get('QUIZ_RESPONSE_FORMAT', 'verbose')
+FAKE_LLM_LATENCY = float(os.environ.get('FAKE_LLM_LATENCY', 0.5))  # seconds per call
+FAKE_LLM_LATENCY_PER_QUESTION = float(os.environ.get('FAKE_LLM_LATENCY_PER_QUESTION', 0.0))
+FAKE_LLM_LATENCY_PER_OUTPUT_TOKEN = float(os.environ.get('FAKE_LLM_LATENCY_PER_OUTPUT_TOKEN', 0.005))  # ~200 tokens/s
+FAKE_LLM_FAILURE_RATE = float(os.environ.get('FAKE_LLM_FAILURE_RATE', 0.0))
+FAKE_LLM_OUTPUT_TOKENS_PER_QUESTION = int(os.environ.get('FAKE_LLM_OUTPUT_TOKENS_PER_QUESTION', 0))  # 0 = estimate from response length
 
 ALLOWED_HOSTS = ['*']
 # Trust my custom domain for Forms/Logins
@@ -118,4 +137,103 @@ else:
 # Trust Cloudflare/Render's "X-Forwarded-Proto" header to know we are HTTPS
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 SESSION_COOKIE_SECURE = True
-CSRF_COOKIE_SECURE = True
\ No newline at end of file
+CSRF_COOKIE_SECURE = True
+# Generated quiz cache (repeat uploads of the same document skip the Gemini call)
+QUIZ_CACHE_ENABLED = str(os.environ.get('QUIZ_CACHE_ENABLED', 'True')).lower() in ('1', 'true', 'yes')
+QUIZ_CACHE_TTL = int(os.environ.get('QUIZ_CACHE_TTL', 7 * 24 * 60 * 60))  # seconds
+QUIZ_CACHE_MAX_ENTRIES = int(os.environ.get('QUIZ_CACHE_MAX_ENTRIES', 500))
+
+# Background quiz generation (in-process worker pool, no external broker)
+GENERATION_WORKERS = int(os.environ.get('GENERATION_WORKERS', 2))
+GENERATION_JOB_TIMEOUT = int(os.environ.get('GENERATION_JOB_TIMEOUT', 300))  # seconds
+QUIZ_MAX_QUESTIONS = int(os.environ.get('QUIZ_MAX_QUESTIONS', 25))  # matches the slider on the generate page
+# How often a worker refreshes the jobs it holds; must stay well below GENERATION_JOB_TIMEOUT.
+GENERATION_JOB_HEARTBEAT = int(os.environ.get('GENERATION_JOB_HEARTBEAT', 60))  # seconds
+# Streamed generations send a keep-alive comment this often while no question arrives,
+# so proxies that drop idle connections keep the stream open.
+SSE_KEEPALIVE_SECONDS = int(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
+# Streaming off by default: each open stream holds a web worker thread for the whole
+# generation, so the web server needs more workers/threads than concurrent streams
+# (e.g. gunicorn --threads). Otherwise the page polls the job instead.
+QUIZ_STREAMING_ENABLED = str(os.environ.get('QUIZ_STREAMING_ENABLED', 'False')).lower() in ('1', 'true', 'yes')
+
+# Documents are split into sections generated in parallel when one prompt cannot carry
+# the source text the questions are due within QUIZ_TARGET_LATENCY (see the budget planner)
+QUIZ_CHUNKED_GENERATION = str(os.environ.get('QUIZ_CHUNKED_GENERATION', 'True')).lower() in ('1', 'true', 'yes')
+QUIZ_CHUNK_WORKERS = int(os.environ.get('QUIZ_CHUNK_WORKERS', 4))
+QUIZ_CHUNK_MAX_SECTIONS = int(os.environ.get('QUIZ_CHUNK_MAX_SECTIONS', 6))
+
+# Pick the most relevant passages (BM25 ranking) when text exceeds the prompt budget
+QUIZ_PASSAGE_SELECTION = str(os.environ.get('QUIZ_PASSAGE_SELECTION', 'True')).lower() in ('1', 'true', 'yes')
+# Passages are picked from up to this many times the prompt budget of extracted text
+QUIZ_PASSAGE_POOL_FACTOR = int(os.environ.get('QUIZ_PASSAGE_POOL_FACTOR', 4))
+
+# Identical generation requests already in flight are coalesced; waiters give up after this long
+QUIZ_SINGLE_FLIGHT_TIMEOUT = int(os.environ.get('QUIZ_SINGLE_FLIGHT_TIMEOUT', 180))  # seconds
+
+# Opt-in question bank: over-generate a pool per document and sample later requests from it
+QUESTION_BANK_ENABLED = str(os.environ.get('QUESTION_BANK_ENABLED', 'False')).lower() in ('1', 'true', 'yes')
+QUESTION_BANK_SIZE = int(os.environ.get('QUESTION_BANK_SIZE', 50))
+QUESTION_BANK_BATCH_SIZE = int(os.environ.get('QUESTION_BANK_BATCH_SIZE', 25))  # questions per model call
+
+# Prompt budget planner: how much source text goes into each prompt
+QUIZ_TARGET_LATENCY = float(os.environ.get('QUIZ_TARGET_LATENCY', 30))  # seconds per model call
+QUIZ_SOURCE_TOKENS_PER_QUESTION = int(os.environ.get('QUIZ_SOURCE_TOKENS_PER_QUESTION', 1500))
+QUIZ_MIN_SOURCE_TOKENS_PER_QUESTION = int(os.environ.get('QUIZ_MIN_SOURCE_TOKENS_PER_QUESTION', 400))
+QUIZ_MAX_SOURCE_TOKENS = int(os.environ.get('QUIZ_MAX_SOURCE_TOKENS', 60000))
+QUIZ_OUTPUT_TOKENS_PER_QUESTION = int(os.environ.get('QUIZ_OUTPUT_TOKENS_PER_QUESTION', 90))
+QUIZ_MODEL_CONTEXT_TOKENS = int(os.environ.get('QUIZ_MODEL_CONTEXT_TOKENS', 1048576))
+QUIZ_MODEL_INPUT_TOKENS_PER_SECOND = float(os.environ.get('QUIZ_MODEL_INPUT_TOKENS_PER_SECOND', 5000))
+QUIZ_MODEL_OUTPUT_TOKENS_PER_SECOND = float(os.environ.get('QUIZ_MODEL_OUTPUT_TOKENS_PER_SECOND', 120))
+QUIZ_MODEL_REQUEST_OVERHEAD = float(os.environ.get('QUIZ_MODEL_REQUEST_OVERHEAD', 1.5))  # seconds
+
+# Generation latency model (online regression over GenerationTiming)
+LATENCY_MODEL_MIN_SAMPLES = int(os.environ.get('LATENCY_MODEL_MIN_SAMPLES', 20))  # use the fixed estimate until then
+LATENCY_MODEL_DECAY = float(os.environ.get('LATENCY_MODEL_DECAY', 0.995))  # per sample; older timings fade out
+
+# Upper bound on the text extracted from one document (~125k tokens)
+QUIZ_EXTRACT_MAX_CHARS = int(os.environ.get('QUIZ_EXTRACT_MAX_CHARS', 500000))
+
+# Long PDFs on disk are extracted by a pool of worker processes (0 or 1 = always serial).
+# Below PDF_PARALLEL_MIN_PAGES the pool costs more than it saves; see `manage.py benchmark_pdf_extraction`.
+PDF_EXTRACT_WORKERS = int(os.environ.get('PDF_EXTRACT_WORKERS', min(2, os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 64))
+
+# Include speaker notes when reading .pptx files
+PPTX_INCLUDE_NOTES = str(os.environ.get('PPTX_INCLUDE_NOTES', 'False')).lower() in ('1', 'true', 'yes')
+
+# Fetching pages for URL quizzes: pooled connections, a size cap and an on-disk
+# cache of the extracted text, revalidated with ETag/Last-Modified.
+URL_FETCH_MAX_BYTES = int(os.environ.get('URL_FETCH_MAX_BYTES', 5 * 1024 * 1024))
+URL_FETCH_POOL_SIZE = int(os.environ.get('URL_FETCH_POOL_SIZE', 10))  # connections kept per host
+URL_CACHE_ENABLED = str(os.environ.get('URL_CACHE_ENABLED', 'True')).lower() in ('1', 'true', 'yes')
+URL_CACHE_DIR = os.environ.get('URL_CACHE_DIR', os.path.join(BASE_DIR, 'url_cache'))
+URL_CACHE_FRESH_SECONDS = int(os.environ.get('URL_CACHE_FRESH_SECONDS', 10 * 60))  # reuse without revalidating
+URL_CACHE_MAX_ENTRIES = int(os.environ.get('URL_CACHE_MAX_ENTRIES', 1000))
+
+# Document store: extracted text of each uploaded file or URL, keyed by a hash of
+# its bytes, so later quizzes from the same source skip parsing it.
+DOCUMENT_STORE_ENABLED = str(os.environ.get('DOCUMENT_STORE_ENABLED', 'True')).lower() in ('1', 'true', 'yes')
+DOCUMENT_STORE_MAX_BYTES = int(os.environ.get('DOCUMENT_STORE_MAX_BYTES', 64 * 1024 * 1024))  # compressed text, least recently used evicted first
+
+# Strip repeated headers/footers, page numbers and extra whitespace from extracted text
+TEXT_NORMALIZATION_ENABLED = str(os.environ.get('TEXT_NORMALIZATION_ENABLED', 'True')).lower() in ('1', 'true', 'yes')
+BOILERPLATE_MIN_PAGE_FRACTION = float(os.environ.get('BOILERPLATE_MIN_PAGE_FRACTION', 0.6))  # of pages a header/footer line must repeat on
+BOILERPLATE_MIN_PAGES = int(os.environ.get('BOILERPLATE_MIN_PAGES', 3))
+
+# Uploads are streamed to temp files and stopped as soon as they pass the size
+# limit or turn out not to be a PDF/PowerPoint file (sniffed from their first bytes).
+FILE_UPLOAD_HANDLERS = ['home.uploads.QuizUploadHandler']
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 25 * 1024 * 1024))
+
+# Anonymous quizzes belong to the visitor's session and are pruned by
+# `manage.py prune_anonymous_quizzes` (run it periodically, e.g. from cron).
+ANONYMOUS_QUIZZES_PER_SESSION = int(os.environ.get('ANONYMOUS_QUIZZES_PER_SESSION', 5))
+ANONYMOUS_QUIZ_MAX_AGE = int(os.environ.get('ANONYMOUS_QUIZ_MAX_AGE', 14 * 24 * 60 * 60))  # seconds; Django's default session lifetime
+QUIZ_PRUNE_BATCH_SIZE = int(os.environ.get('QUIZ_PRUNE_BATCH_SIZE', 500))
+
+# Days of history shown in the progress page's daily chart
+PROGRESS_CHART_DAYS = int(os.environ.get('PROGRESS_CHART_DAYS', 30))
+
+# Quizzes per page on the history page
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 20))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Quiz, QuizAttempt
+from .models import ApiKeyUsage, GenerationJob, GenerationTiming, PromptBudgetRecord, QuestionBank, Quiz, QuizAttempt, QuizCacheEntry, SourceDocument, UserProgressStats
 
 # Register your models here.
 @admin.register(Quiz)
@@ -15,3 +15,51 @@ class QuizAttemptAdmin(admin.ModelAdmin):
     list_filter = ('timestamp', 'user')
     search_fields = ('quiz__title', 'user__username')
 
+
+@admin.register(QuizCacheEntry)
+class QuizCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'hits', 'created_at', 'last_used_at')
+    search_fields = ('key',)
+    readonly_fields = ('key', 'created_at')
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ('title', 'user', 'source_type', 'status', 'created_at')
+    list_filter = ('status', 'source_type', 'created_at')
+    search_fields = ('title', 'user__username')
+    readonly_fields = ('id', 'created_at', 'updated_at')
+
+@admin.register(ApiKeyUsage)
+class ApiKeyUsageAdmin(admin.ModelAdmin):
+    list_display = ('key_id', 'day', 'requests', 'quota_errors', 'cooldown_until')
+    list_filter = ('day',)
+    search_fields = ('key_id',)
+
+@admin.register(QuestionBank)
+class QuestionBankAdmin(admin.ModelAdmin):
+    list_display = ('key', 'created_at', 'updated_at')
+    search_fields = ('key',)
+    readonly_fields = ('key', 'created_at', 'updated_at')
+
+@admin.register(PromptBudgetRecord)
+class PromptBudgetRecordAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'num_questions', 'source_tokens', 'limited_by', 'expected_latency', 'duration')
+    list_filter = ('limited_by', 'created_at')
+
+@admin.register(GenerationTiming)
+class GenerationTimingAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'source_type', 'num_questions', 'text_chars', 'extract_seconds', 'generate_seconds', 'total_seconds', 'cached', 'succeeded')
+    list_filter = ('source_type', 'cached', 'succeeded', 'streamed', 'created_at')
+
+@admin.register(SourceDocument)
+class SourceDocumentAdmin(admin.ModelAdmin):
+    list_display = ('key', 'source_type', 'text_chars', 'removed_chars', 'stored_bytes', 'complete', 'extracted_at', 'last_used_at')
+    list_filter = ('source_type', 'complete')
+    search_fields = ('key',)
+    readonly_fields = ('key', 'extracted_at')
+    exclude = ('compressed_text',)
+
+@admin.register(UserProgressStats)
+class UserProgressStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'total_attempts', 'total_correct', 'total_questions', 'best_percentage', 'perfect_count', 'updated_at')
+    search_fields = ('user__username',)
@@ -0,0 +1,170 @@
+import re
+from django.conf import settings
+from .models import PromptBudgetRecord
+
+# Letters, digit groups and single punctuation marks each start a token.
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+# Letters beyond the sixth of a word split off roughly every four characters.
+_LONG_WORD_TAILS = re.compile(r"(?<=[A-Za-z]{6})[A-Za-z]{1,4}")
+# Longer texts are estimated from three samples of this size.
+_SAMPLE_CHARS = 20000
+
+# Generous characters-per-token ratio, so text extracted to a character
+# budget is never short of the token budget (English averages about 4).
+_MAX_CHARS_PER_TOKEN = 6
+
+# The compact wire format drops the key names (see benchmark_wire_format).
+_COMPACT_OUTPUT_RATIO = 0.75
+
+def _count_tokens(text):
+    return len(_TOKEN_PIECES.findall(text)) + len(_LONG_WORD_TAILS.findall(text))
+
+def estimate_tokens(text):
+    """
+    Fast local approximation of the model's token count. Common words are
+    one token, long words one more per ~4 extra letters, numbers one per
+    three digits and punctuation one each. Long texts are sampled at the
+    start, middle and end and the count scaled up, so this stays cheap for
+    whole books.
+    """
+    if not text:
+        return 0
+    if len(text) <= 3 * _SAMPLE_CHARS:
+        return _count_tokens(text)
+
+    middle = (len(text) - _SAMPLE_CHARS) // 2
+    samples = (text[:_SAMPLE_CHARS], text[middle:middle + _SAMPLE_CHARS], text[-_SAMPLE_CHARS:])
+    sampled_tokens = sum(_count_tokens(sample) for sample in samples)
+    return round(sampled_tokens * len(text) / (3 * _SAMPLE_CHARS))
+
+class PromptBudget:
+    """
+    How much of a document goes into one prompt. `limited_by` says which
+    constraint decided it: 'document' (it all fits), 'questions' (the
+    per-question allowance), 'latency' (the target latency), 'floor' (the
+    per-question minimum won over latency) or 'context' (the model limit).
+    """
+
+    def __init__(self, num_questions, document_chars, document_tokens, source_chars, source_tokens,
+                 fixed_tokens, output_tokens, limited_by):
+        self.num_questions = num_questions
+        self.document_chars = document_chars
+        self.document_tokens = document_tokens
+        self.source_chars = source_chars
+        self.source_tokens = source_tokens
+        # The prompt without the document: format rules and custom instructions.
+        self.fixed_tokens = fixed_tokens
+        self.output_tokens = output_tokens
+        self.limited_by = limited_by
+
+    @property
+    def prompt_tokens(self):
+        return self.fixed_tokens + self.source_tokens
+
+    @property
+    def truncated(self):
+        return self.source_chars < self.document_chars
+
+    @property
+    def expected_latency(self):
+        return (settings.QUIZ_MODEL_REQUEST_OVERHEAD
+                + self.prompt_tokens / settings.QUIZ_MODEL_INPUT_TOKENS_PER_SECOND
+                + self.output_tokens / settings.QUIZ_MODEL_OUTPUT_TOKENS_PER_SECOND)
+
+def _output_tokens(num_questions, compact):
+    return round(num_questions * settings.QUIZ_OUTPUT_TOKENS_PER_QUESTION * (_COMPACT_OUTPUT_RATIO if compact else 1))
+
+def _source_allowance(num_questions, fixed_tokens, output_tokens):
+    """Source tokens one prompt may carry, and the constraint that decided it."""
+    source_tokens = num_questions * settings.QUIZ_SOURCE_TOKENS_PER_QUESTION
+    limited_by = 'questions'
+
+    seconds_for_input = (settings.QUIZ_TARGET_LATENCY - settings.QUIZ_MODEL_REQUEST_OVERHEAD
+                         - output_tokens / settings.QUIZ_MODEL_OUTPUT_TOKENS_PER_SECOND)
+    latency_tokens = int(seconds_for_input * settings.QUIZ_MODEL_INPUT_TOKENS_PER_SECOND) - fixed_tokens
+    if latency_tokens < source_tokens:
+        source_tokens = latency_tokens
+        limited_by = 'latency'
+
+    floor_tokens = num_questions * settings.QUIZ_MIN_SOURCE_TOKENS_PER_QUESTION
+    if source_tokens < floor_tokens:
+        source_tokens = floor_tokens
+        limited_by = 'floor'
+
+    context_tokens = min(settings.QUIZ_MAX_SOURCE_TOKENS,
+                         settings.QUIZ_MODEL_CONTEXT_TOKENS - fixed_tokens - output_tokens)
+    if context_tokens < source_tokens:
+        source_tokens = context_tokens
+        limited_by = 'context'
+
+    return source_tokens, limited_by
+
+def plan_prompt_budget(text, num_questions, fixed_prompt="", compact=False):
+    """
+    Size the document section of a prompt for `num_questions` questions.
+
+    Each question gets QUIZ_SOURCE_TOKENS_PER_QUESTION of source text, cut
+    back so the expected latency (request overhead + prompt processing +
+    writing the answer) stays within QUIZ_TARGET_LATENCY, but never below
+    QUIZ_MIN_SOURCE_TOKENS_PER_QUESTION or above what the model accepts.
+    """
+    num_questions = max(int(num_questions), 1)
+    fixed_tokens = estimate_tokens(fixed_prompt)
+    output_tokens = _output_tokens(num_questions, compact)
+    source_tokens, limited_by = _source_allowance(num_questions, fixed_tokens, output_tokens)
+
+    document_tokens = estimate_tokens(text)
+    if document_tokens <= source_tokens:
+        source_tokens = document_tokens
+        source_chars = len(text)
+        limited_by = 'document'
+    else:
+        source_chars = int(len(text) * source_tokens / document_tokens)
+
+    return PromptBudget(
+        num_questions=num_questions,
+        document_chars=len(text),
+        document_tokens=document_tokens,
+        source_chars=source_chars,
+        source_tokens=source_tokens,
+        fixed_tokens=fixed_tokens,
+        output_tokens=output_tokens,
+        limited_by=limited_by,
+    )
+
+def max_source_chars(num_questions):
+    """
+    Upper bound on the document characters a single prompt for
+    `num_questions` can use, for sizing extraction before the text exists.
+    """
+    num_questions = max(int(num_questions), 1)
+    source_tokens, _ = _source_allowance(num_questions, 0, _output_tokens(num_questions, compact=True))
+    return source_tokens * _MAX_CHARS_PER_TOKEN
+
+def max_chunked_source_chars(num_questions):
+    """
+    Upper bound on the document characters chunked generation can use for
+    `num_questions`: every question's full QUIZ_SOURCE_TOKENS_PER_QUESTION,
+    spread over as many prompts as that takes.
+    """
+    return max(int(num_questions), 1) * settings.QUIZ_SOURCE_TOKENS_PER_QUESTION * _MAX_CHARS_PER_TOKEN
+
+def record_prompt_budget(budget, input_tokens=None, output_tokens=None, duration=None):
+    """Store the budget chosen for one model call with what the call actually used."""
+    try:
+        PromptBudgetRecord.objects.create(
+            num_questions=budget.num_questions,
+            document_chars=budget.document_chars,
+            document_tokens=budget.document_tokens,
+            source_chars=budget.source_chars,
+            source_tokens=budget.source_tokens,
+            prompt_tokens=budget.prompt_tokens,
+            expected_output_tokens=budget.output_tokens,
+            expected_latency=budget.expected_latency,
+            limited_by=budget.limited_by,
+            input_tokens=input_tokens or None,
+            output_tokens=output_tokens or None,
+            duration=duration,
+        )
+    except Exception as e:
+        print(f"Error recording prompt budget: {e}")
@@ -0,0 +1,164 @@
+import copy
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import GenerationLock
+
+# How often a waiting process checks whether another process has finished.
+POLL_INTERVAL = 1.0
+
+class _Flight:
+    """A generation in progress in this process that other threads can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+def _begin(key):
+    """Return (flight, is_leader) for `key`, registering a new flight if none is running."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _Flight()
+        _flights[key] = flight
+        return flight, True
+
+def _finish(key, flight, result=None, error=None):
+    flight.result = result
+    flight.error = error
+    with _flights_lock:
+        _flights.pop(key, None)
+    flight.done.set()
+
+def _acquire_db_lock(key):
+    """
+    Claim `key` across worker processes with a unique lock row. A lock older
+    than the timeout belongs to a worker that died and is taken over.
+    """
+    for _ in range(2):
+        try:
+            # A savepoint, so losing the race leaves an enclosing transaction usable.
+            with transaction.atomic():
+                GenerationLock.objects.create(key=key)
+            return True
+        except IntegrityError:
+            expired_before = timezone.now() - timedelta(seconds=settings.QUIZ_SINGLE_FLIGHT_TIMEOUT)
+            deleted, _ = GenerationLock.objects.filter(key=key, created_at__lt=expired_before).delete()
+            if not deleted:
+                return False
+    return False
+
+def _release_db_lock(key):
+    try:
+        GenerationLock.objects.filter(key=key).delete()
+    except Exception as e:
+        print(f"Error releasing generation lock: {e}")
+
+def _wait_for_other_process(key, read_result):
+    """Poll for the result another worker is producing; None if it gave up or timed out."""
+    deadline = time.monotonic() + settings.QUIZ_SINGLE_FLIGHT_TIMEOUT
+    while time.monotonic() < deadline:
+        result = read_result()
+        if result is not None:
+            return result
+        if not GenerationLock.objects.filter(key=key).exists():
+            # The other worker finished; its result is there unless it failed.
+            return read_result()
+        time.sleep(POLL_INTERVAL)
+    return None
+
+def _wait_for_flight(flight):
+    """Result of another thread's flight, a copy so each caller owns its data, or None."""
+    flight.done.wait(settings.QUIZ_SINGLE_FLIGHT_TIMEOUT)
+    if flight.error is not None:
+        raise flight.error
+    return copy.deepcopy(flight.result)
+
+def _claim_or_wait(key, read_result):
+    """
+    For the leader thread: take the cross-process lock, or wait for the
+    process holding it. Returns (has_lock, result_from_other_process).
+    """
+    # Without the shared cache there is no way to hand a result across processes.
+    if not settings.QUIZ_CACHE_ENABLED:
+        return False, None
+    try:
+        if _acquire_db_lock(key):
+            return True, None
+        return False, _wait_for_other_process(key, read_result)
+    except Exception as e:
+        print(f"Error coordinating generation lock: {e}")
+        return False, None
+
+def run_single_flight(key, generate, read_result):
+    """
+    Call `generate()` unless an identical request is already in flight, in
+    this process or in another worker, in which case wait for its result.
+    `read_result()` looks the result up in the shared cache.
+    """
+    flight, is_leader = _begin(key)
+    if not is_leader:
+        result = _wait_for_flight(flight)
+        return result if result is not None else generate()
+
+    has_lock = False
+    try:
+        has_lock, result = _claim_or_wait(key, read_result)
+        if result is None:
+            result = generate()
+    except Exception as e:
+        _finish(key, flight, error=e)
+        raise
+    finally:
+        if has_lock:
+            _release_db_lock(key)
+
+    _finish(key, flight, result=result)
+    return result
+
+def run_single_flight_stream(key, stream, read_result):
+    """
+    Streaming variant of run_single_flight: the leader yields items from
+    `stream()` as they arrive, while callers that joined an identical
+    request get the complete result once it is ready.
+    """
+    flight, is_leader = _begin(key)
+    if not is_leader:
+        result = _wait_for_flight(flight)
+        if result is not None:
+            yield from result
+        else:
+            yield from stream()
+        return
+
+    has_lock = False
+    produced = []
+    try:
+        has_lock, result = _claim_or_wait(key, read_result)
+        if result is not None:
+            produced = result
+            yield from result
+        else:
+            for item in stream():
+                produced.append(item)
+                yield item
+    except GeneratorExit:
+        # The client went away mid-stream; waiters generate for themselves.
+        _finish(key, flight)
+        raise
+    except Exception as e:
+        _finish(key, flight, error=e)
+        raise
+    finally:
+        if has_lock:
+            _release_db_lock(key)
+
+    _finish(key, flight, result=produced)
@@ -0,0 +1,137 @@
+import hashlib
+import zlib
+from datetime import timedelta
+from urllib.parse import urlsplit, urlunsplit
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Sum
+from django.utils import timezone
+from .models import SourceDocument
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def file_key(uploaded_file):
+    """SHA-256 of an uploaded file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+def normalize_url(url):
+    """Lower-cased scheme and host, no default port or fragment, so trivially different spellings share a key."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.port is not None and parts.port != _DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{parts.port}"
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+def url_key(url):
+    return hashlib.sha256(b'url\x00' + normalize_url(url).encode('utf-8')).hexdigest()
+
+def join_pages(pages, separator=""):
+    """The pages joined into one text, plus the offset where each one starts."""
+    offsets = []
+    length = 0
+    for index, page_text in enumerate(pages):
+        if index:
+            length += len(separator)
+        offsets.append(length)
+        length += len(page_text)
+    return separator.join(pages), offsets
+
+def get_document(key, max_chars=None, max_age=None):
+    """
+    The stored document for `key`, marked as used. None if there is none, if
+    its extraction was cut short below `max_chars` (measured before
+    normalization, as the budget is), or if it was extracted more than
+    `max_age` seconds ago.
+    """
+    if not settings.DOCUMENT_STORE_ENABLED:
+        return None
+
+    try:
+        document = SourceDocument.objects.filter(key=key).first()
+        if document is None:
+            return None
+        if not document.complete and (max_chars is None or document.extracted_chars < max_chars):
+            return None
+        if max_age is not None and document.extracted_at < timezone.now() - timedelta(seconds=max_age):
+            return None
+
+        SourceDocument.objects.filter(pk=document.pk).update(last_used_at=timezone.now())
+        return document
+    except Exception as store_error:
+        # The store is an optimization; never fail a generation because of it.
+        print(f"Error reading document store: {store_error}")
+        return None
+
+def store_document(key, source_type, pages, separator="", complete=True, removed_chars=0, extracted_chars=None):
+    """
+    Store the extracted pages of a source under `key` and return the
+    document. When the store is disabled or fails, the document is returned
+    unsaved so the caller can still use its text.
+    """
+    text, offsets = join_pages(pages, separator)
+    if extracted_chars is None:
+        extracted_chars = len(text)
+    compressed = zlib.compress(text.encode('utf-8'))
+    document = SourceDocument(
+        key=key,
+        source_type=source_type,
+        compressed_text=compressed,
+        text_chars=len(text),
+        page_offsets=offsets,
+        complete=complete,
+        extracted_chars=extracted_chars,
+        removed_chars=removed_chars,
+        stored_bytes=len(compressed),
+    )
+    document.text = text
+
+    if not settings.DOCUMENT_STORE_ENABLED or not text.strip():
+        return document
+
+    try:
+        now = timezone.now()
+        try:
+            stored, _ = SourceDocument.objects.update_or_create(key=key, defaults={
+                'source_type': source_type,
+                'compressed_text': compressed,
+                'text_chars': len(text),
+                'page_offsets': offsets,
+                'complete': complete,
+                'extracted_chars': extracted_chars,
+                'removed_chars': removed_chars,
+                'stored_bytes': len(compressed),
+                'extracted_at': now,
+                'last_used_at': now,
+            })
+            stored.text = text
+            document = stored
+        except IntegrityError:
+            # Another worker stored the same source at the same time.
+            pass
+        evict_documents(keep=key)
+    except Exception as store_error:
+        print(f"Error writing document store: {store_error}")
+    return document
+
+def evict_documents(keep=None):
+    """
+    Drop the least recently used documents until the store fits in
+    DOCUMENT_STORE_MAX_BYTES, sparing the document under `keep`.
+    """
+    total = SourceDocument.objects.aggregate(total=Sum('stored_bytes'))['total'] or 0
+    overflow = total - settings.DOCUMENT_STORE_MAX_BYTES
+    if overflow <= 0:
+        return
+
+    stale_ids = []
+    for document_id, stored_bytes in SourceDocument.objects.exclude(key=keep).order_by('last_used_at').values_list('id', 'stored_bytes').iterator():
+        stale_ids.append(document_id)
+        overflow -= stored_bytes
+        if overflow <= 0:
+            break
+    SourceDocument.objects.filter(id__in=stale_ids).delete()
@@ -0,0 +1,135 @@
+import codecs
+import re
+from html.parser import HTMLParser
+
+# Page furniture whose whole subtree is left out of the text.
+SKIPPED_TAGS = frozenset(["script", "style", "nav", "footer", "header", "aside"])
+
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+# How far into a page its <meta charset> is looked for.
+_SNIFF_BYTES = 4096
+_DECLARED_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+
+class _BudgetReached(Exception):
+    pass
+
+class _TextCollector(HTMLParser):
+    """
+    Collects the stripped text nodes of a page as it is fed, skipping the
+    subtrees of SKIPPED_TAGS, until `max_chars` characters have been seen.
+    A text node split across two feeds arrives in pieces, so pieces are
+    joined up until the next tag, comment or declaration ends the node.
+    """
+
+    def __init__(self, max_chars=None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.pieces = []
+        self.length = 0
+        self._node = []
+        self._skipped_tag = None
+        self._skipped_depth = 0
+
+    def _end_node(self):
+        if not self._node:
+            return
+        data = "".join(self._node).strip()
+        self._node = []
+        if not data:
+            return
+        self.pieces.append(data)
+        self.length += len(data) + 1
+        if self.max_chars is not None and self.length >= self.max_chars:
+            raise _BudgetReached()
+
+    def handle_starttag(self, tag, attrs):
+        self._end_node()
+        if self._skipped_tag is None:
+            if tag in SKIPPED_TAGS:
+                self._skipped_tag = tag
+                self._skipped_depth = 1
+        elif tag == self._skipped_tag:
+            self._skipped_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # <nav/> and friends open no subtree.
+        self._end_node()
+
+    def handle_endtag(self, tag):
+        self._end_node()
+        if tag == self._skipped_tag:
+            self._skipped_depth -= 1
+            if self._skipped_depth == 0:
+                self._skipped_tag = None
+
+    def handle_data(self, data):
+        if self._skipped_tag is None:
+            self._node.append(data)
+
+    def handle_comment(self, data):
+        self._end_node()
+
+    def handle_decl(self, decl):
+        self._end_node()
+
+    def handle_pi(self, data):
+        self._end_node()
+
+    def close(self):
+        super().close()
+        self._end_node()
+
+def _lookup_encoding(name):
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+def _sniff_encoding(head, declared=None):
+    """The page's encoding, in the browsers' order: BOM, then the HTTP header's charset, then <meta>, then UTF-8."""
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    if declared and _lookup_encoding(declared):
+        return _lookup_encoding(declared)
+    match = _DECLARED_CHARSET.search(head)
+    if match and _lookup_encoding(match.group(1).decode('ascii')):
+        return _lookup_encoding(match.group(1).decode('ascii'))
+    return 'utf-8'
+
+def extract_html_text(chunks, max_chars=None, encoding=None):
+    """
+    Text of an HTML page arriving as byte `chunks`, in one pass: text nodes
+    are stripped and joined with spaces (like BeautifulSoup's
+    get_text(separator=' ', strip=True)) and script, style, nav, footer,
+    header and aside subtrees are skipped. Stops consuming `chunks` once
+    `max_chars` characters of text have been collected. `encoding` is the
+    charset from the Content-Type header, if the response had one.
+    """
+    collector = _TextCollector(max_chars)
+    decoder = None
+    # The encoding is sniffed from the first _SNIFF_BYTES, however the body was chunked.
+    head = b''
+    try:
+        for chunk in chunks:
+            if decoder is None:
+                head += chunk
+                if len(head) < _SNIFF_BYTES:
+                    continue
+                decoder = codecs.getincrementaldecoder(_sniff_encoding(head[:_SNIFF_BYTES], encoding))(errors='replace')
+                chunk = head
+            collector.feed(decoder.decode(chunk))
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(_sniff_encoding(head, encoding))(errors='replace')
+            collector.feed(decoder.decode(head))
+        collector.feed(decoder.decode(b'', final=True))
+        collector.close()
+    except _BudgetReached:
+        pass
+
+    text = " ".join(collector.pieces)
+    return text if max_chars is None else text[:max_chars]
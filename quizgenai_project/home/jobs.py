@@ -0,0 +1,210 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connection
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from . import services, telemetry
+from .models import GenerationJob, Quiz
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Ids of the jobs this process has accepted and not yet finished; the
+# heartbeat keeps their updated_at fresh so only jobs lost to a restart expire.
+_active_jobs = set()
+_active_jobs_lock = threading.Lock()
+
+def get_executor():
+    """The process-wide worker pool, created on first use so imports stay cheap."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.GENERATION_WORKERS, thread_name_prefix='quizgen')
+            threading.Thread(target=_heartbeat, name='quizgen-heartbeat', daemon=True).start()
+        return _executor
+
+def _heartbeat():
+    """Touch the jobs this process still holds, queued or running, while it is alive."""
+    while True:
+        time.sleep(settings.GENERATION_JOB_HEARTBEAT)
+        with _active_jobs_lock:
+            job_ids = list(_active_jobs)
+        if not job_ids:
+            continue
+        try:
+            close_old_connections()
+            GenerationJob.objects.filter(
+                id__in=job_ids,
+                status__in=(GenerationJob.STATUS_PENDING, GenerationJob.STATUS_RUNNING),
+            ).update(updated_at=timezone.now())
+        except Exception:
+            logger.exception("Could not refresh generation job heartbeats")
+        finally:
+            connection.close()
+
+def owner_key(user, session_key):
+    """Identifies who a quiz is generated for, so the question bank avoids repeats."""
+    if user is not None:
+        return f"user:{user.id}"
+    return f"session:{session_key}" if session_key else None
+
+def save_generated_quiz(user, title, quiz_data, source_document=None, session_key=''):
+    logger.info("Saving quiz with title: %s", title)
+
+    # Old anonymous quizzes are removed by `manage.py prune_anonymous_quizzes`, not here.
+    return Quiz.objects.create(
+        user=user,
+        session_key='' if user is not None else (session_key or ''),
+        title=title,
+        quiz_data=quiz_data,
+        question_count=len(quiz_data),
+        # Unsaved when the document store is off or failed.
+        source_document=source_document if source_document is not None and source_document.pk else None,
+    )
+
+def prune_anonymous_quizzes(keep_per_session, max_age, batch_size=500):
+    """
+    Delete anonymous quizzes beyond the newest `keep_per_session` of each
+    session, those older than `max_age` seconds (their session is gone by
+    then) and those from before quizzes were tied to a session. Deletes in
+    batches of `batch_size` so no single statement locks many rows.
+    Returns the number of quizzes deleted.
+    """
+    anonymous = Quiz.objects.filter(user__isnull=True)
+    expired = anonymous.filter(
+        Q(created_at__lt=timezone.now() - timedelta(seconds=max_age)) | Q(session_key='')
+    )
+    surplus = anonymous.annotate(
+        newest_first=Window(RowNumber(), partition_by=F('session_key'), order_by=F('created_at').desc()),
+    ).filter(newest_first__gt=keep_per_session)
+
+    deleted = 0
+    for candidates in (expired, surplus):
+        while True:
+            batch = list(candidates.values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+            Quiz.objects.filter(id__in=batch).delete()
+            deleted += len(batch)
+    return deleted
+
+def spool_upload(uploaded_file):
+    """
+    Give an upload a temp file that outlives the request; the worker deletes
+    it. Uploads already on disk are hard-linked rather than copied.
+    """
+    suffix = os.path.splitext(uploaded_file.name or '')[1]
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        path = os.path.join(tempfile.gettempdir(), f"quizgen-{uuid.uuid4().hex}{suffix}")
+        try:
+            os.link(uploaded_file.temporary_file_path(), path)
+            return path
+        except OSError:
+            # Another filesystem, or links not supported; copy instead.
+            pass
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        for chunk in uploaded_file.chunks():
+            tmp.write(chunk)
+    return tmp.name
+
+def submit_generation_job(job, num_questions, custom_instructions, upload_path=None, events=None):
+    """
+    Queue a job on the worker pool. pdf/ppt jobs read their spooled upload from `upload_path`.
+
+    With an `events` queue the quiz is streamed: each question is put on it as
+    ('question', question) as soon as it is written, then ('done', quiz) or
+    ('error', message).
+    """
+    executor = get_executor()
+    with _active_jobs_lock:
+        _active_jobs.add(job.id)
+    executor.submit(run_generation_job, job.id, num_questions, custom_instructions, upload_path, events)
+
+def _finish_job(job_id, **fields):
+    """Record a job's outcome unless it was already expired."""
+    return GenerationJob.objects.filter(id=job_id, status=GenerationJob.STATUS_RUNNING).update(
+        updated_at=timezone.now(), **fields,
+    )
+
+def run_generation_job(job_id, num_questions, custom_instructions, upload_path=None, events=None):
+    close_old_connections()
+    outcome = ('error', "The quiz generation was interrupted. Please try again.")
+    try:
+        # Claim the job; one that was expired while it waited in the queue stays failed.
+        claimed = GenerationJob.objects.filter(id=job_id, status=GenerationJob.STATUS_PENDING).update(
+            status=GenerationJob.STATUS_RUNNING, updated_at=timezone.now(),
+        )
+        if not claimed:
+            return
+
+        timer = None
+        try:
+            job = GenerationJob.objects.select_related('user').get(id=job_id)
+            requester = owner_key(job.user, job.session_key)
+
+            source_bytes = os.path.getsize(upload_path) if upload_path else None
+            timer = telemetry.GenerationTimer(job.source_type, num_questions, source_bytes=source_bytes, streamed=events is not None)
+            timer.stages['queue'] = (timezone.now() - job.created_at).total_seconds()
+            on_question = None if events is None else (lambda question: events.put(('question', question)))
+
+            if job.source_type == GenerationJob.SOURCE_URL:
+                quiz_data, document = services.generate_quiz_from_source(job.source_type, job.source_url, num_questions, custom_instructions, owner_key=requester, timer=timer, on_question=on_question)
+            else:
+                with open(upload_path, 'rb') as fh:
+                    upload = File(fh, name=job.title)
+                    quiz_data, document = services.generate_quiz_from_source(job.source_type, upload, num_questions, custom_instructions, owner_key=requester, timer=timer, on_question=on_question)
+
+            with timer.stage('save'):
+                quiz = save_generated_quiz(job.user, job.title, quiz_data, source_document=document, session_key=job.session_key)
+        except Exception as e:
+            # Any failure after the claim, setup included, must fail the job or it stays running.
+            logger.exception("Error in generation job %s", job_id)
+            if timer is not None:
+                timer.finish(succeeded=False)
+            _finish_job(job_id, status=GenerationJob.STATUS_FAILED, error=str(e))
+            outcome = ('error', str(e))
+            return
+
+        timer.finish()
+        _finish_job(job_id, status=GenerationJob.STATUS_DONE, quiz=quiz)
+        outcome = ('done', quiz)
+    finally:
+        if events is not None:
+            events.put(outcome)
+        with _active_jobs_lock:
+            _active_jobs.discard(job_id)
+        if upload_path and os.path.exists(upload_path):
+            os.remove(upload_path)
+        connection.close()
+
+def expire_stale_job(job):
+    """
+    Jobs live in the memory of the worker that accepted them, so a restart
+    loses them. Report those as failed instead of letting the client poll forever.
+    A live worker refreshes its jobs every GENERATION_JOB_HEARTBEAT seconds,
+    however long they wait in its queue, so only abandoned jobs go stale.
+    """
+    if job.status not in (GenerationJob.STATUS_PENDING, GenerationJob.STATUS_RUNNING):
+        return job
+
+    cutoff = timezone.now() - timedelta(seconds=settings.GENERATION_JOB_TIMEOUT)
+    if job.updated_at < cutoff:
+        # Conditional, so a worker that finishes the job meanwhile is not overwritten.
+        GenerationJob.objects.filter(id=job.id, status=job.status, updated_at__lt=cutoff).update(
+            status=GenerationJob.STATUS_FAILED,
+            error="The quiz generation was interrupted. Please try again.",
+            updated_at=timezone.now(),
+        )
+        job.refresh_from_db()
+    return job
@@ -0,0 +1,400 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .budget import estimate_tokens
+from .models import ApiKeyUsage
+
+class LLMResponse:
+    """Text returned by a backend plus the token counts it reported."""
+
+    def __init__(self, text, input_tokens=0, output_tokens=0, feedback=None):
+        self.text = text
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        # Backend-specific detail on empty responses (e.g. Gemini safety feedback).
+        self.feedback = feedback
+
+class LLMBackend:
+    """
+    Interface the quiz pipeline calls through. `num_questions` and `compact`
+    (positional-array output) are hints for backends that do not read the
+    prompt (the fake one); real models ignore them.
+    """
+    name = 'base'
+
+    def generate(self, prompt, num_questions=None, compact=False):
+        raise NotImplementedError
+
+    def stream(self, prompt, num_questions=None, compact=False):
+        """Yield the response text in pieces. Defaults to a single piece."""
+        yield self.generate(prompt, num_questions=num_questions, compact=compact).text
+
+class TokenBucket:
+    """Allows `capacity` requests per `period` seconds, refilled continuously."""
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self):
+        self._refill()
+        return self.tokens
+
+    def seconds_until_available(self):
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+def is_quota_error(error):
+    """
+    Whether the API refused the request for quota or rate limiting (HTTP 429).
+    Judged from the exception type or status code, never its message, so
+    other failures that merely mention a quota do not cool a healthy key down.
+    """
+    try:
+        from google.api_core import exceptions as google_exceptions
+        if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+            return True
+    except ImportError:
+        pass
+    return getattr(error, 'code', None) == 429 or getattr(error, 'status_code', None) == 429
+
+class GeminiKey:
+    """One API key with its own client, rate limiters and cooldown state."""
+
+    def __init__(self, api_key, client, requests_per_minute, requests_per_day):
+        self.key_id = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+        self.client = client
+        self.minute_bucket = TokenBucket(requests_per_minute, 60)
+        self.day_bucket = TokenBucket(requests_per_day, 24 * 60 * 60)
+        self.cooldown_until = None
+        self.consecutive_quota_errors = 0
+        self.in_flight = 0
+
+    def is_cooling_down(self, now):
+        return self.cooldown_until is not None and self.cooldown_until > now
+
+    def load(self):
+        """Fraction of the tighter limit already used; lower is less loaded."""
+        minute_used = 1 - self.minute_bucket.available() / self.minute_bucket.capacity
+        day_used = 1 - self.day_bucket.available() / self.day_bucket.capacity
+        return max(minute_used, day_used)
+
+class GeminiKeyPool:
+    """
+    Spreads requests over several API keys. Each key has token buckets for
+    requests per minute and per day; usage and cooldowns are persisted in
+    ApiKeyUsage so restarts and other worker processes see them.
+    """
+    # How often to pick up usage recorded by other worker processes.
+    SYNC_INTERVAL = 60
+
+    def __init__(self, keys, cooldown, max_wait):
+        self.keys = keys
+        self.cooldown = cooldown
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._last_sync = 0.0
+        self._sync_from_db()
+
+    def _sync_from_db(self):
+        self._last_sync = time.monotonic()
+        try:
+            usage = {
+                row.key_id: row
+                for row in ApiKeyUsage.objects.filter(day=timezone.now().date(), key_id__in=[key.key_id for key in self.keys])
+            }
+        except Exception as e:
+            print(f"Error loading API key usage: {e}")
+            return
+
+        for key in self.keys:
+            row = usage.get(key.key_id)
+            if row is None:
+                continue
+            remaining_today = key.day_bucket.capacity - row.requests
+            key.day_bucket.tokens = max(0.0, min(key.day_bucket.available(), remaining_today))
+            if row.cooldown_until and (key.cooldown_until is None or row.cooldown_until > key.cooldown_until):
+                key.cooldown_until = row.cooldown_until
+
+    def _pick_key(self):
+        now = timezone.now()
+        ready = [
+            key for key in self.keys
+            if not key.is_cooling_down(now) and key.minute_bucket.available() >= 1 and key.day_bucket.available() >= 1
+        ]
+        if ready:
+            return min(ready, key=lambda key: (key.in_flight, key.load())), 0.0
+
+        # Nothing free right now: how long until the soonest key frees up?
+        waits = []
+        for key in self.keys:
+            if key.day_bucket.available() < 1:
+                continue
+            wait = key.minute_bucket.seconds_until_available()
+            if key.is_cooling_down(now):
+                wait = max(wait, (key.cooldown_until - now).total_seconds())
+            waits.append(wait)
+        return None, min(waits) if waits else None
+
+    def acquire(self):
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with self._lock:
+                if time.monotonic() - self._last_sync > self.SYNC_INTERVAL:
+                    self._sync_from_db()
+                key, wait = self._pick_key()
+                if key is not None:
+                    key.minute_bucket.take()
+                    key.day_bucket.take()
+                    key.in_flight += 1
+                    break
+
+            if wait is None or time.monotonic() + wait > deadline:
+                raise Exception("All Gemini API keys have used up their quota for now. Please try again later.")
+            time.sleep(wait)
+
+        self._record(key, requests=1)
+        return key
+
+    def release(self, key, quota_error=False):
+        with self._lock:
+            key.in_flight -= 1
+            if not quota_error:
+                key.consecutive_quota_errors = 0
+                return
+            key.consecutive_quota_errors += 1
+            backoff = min(self.cooldown * 2 ** (key.consecutive_quota_errors - 1), 60 * 60)
+            key.cooldown_until = timezone.now() + timedelta(seconds=backoff)
+            print(f"Gemini key {key.key_id} hit its quota; cooling down for {backoff}s")
+        self._record(key, quota_errors=1, cooldown_until=key.cooldown_until)
+
+    def _record(self, key, requests=0, quota_errors=0, cooldown_until=None):
+        try:
+            usage, _ = ApiKeyUsage.objects.get_or_create(key_id=key.key_id, day=timezone.now().date())
+            updates = {'requests': F('requests') + requests, 'quota_errors': F('quota_errors') + quota_errors}
+            if cooldown_until is not None:
+                updates['cooldown_until'] = cooldown_until
+            ApiKeyUsage.objects.filter(pk=usage.pk).update(**updates)
+        except Exception as e:
+            # Accounting must never block a generation.
+            print(f"Error recording API key usage: {e}")
+
+class GeminiBackend(LLMBackend):
+    name = 'gemini'
+
+    def __init__(self, api_keys, model_name, requests_per_minute, requests_per_day, cooldown, max_wait):
+        # Imported here so the fake backend works without the Gemini SDK.
+        import google.ai.generativelanguage as glm
+        from google.generativeai.types import GenerateContentResponse
+
+        if not api_keys:
+            raise Exception("No Gemini API key is configured.")
+
+        # genai.configure() is process-global and GenerativeModel takes no
+        # client, so each key gets its own GenerativeServiceClient and the
+        # requests are built here; responses are wrapped in the SDK's own type.
+        self._glm = glm
+        self._response_type = GenerateContentResponse
+        self.model_name = model_name if model_name.startswith('models/') else f"models/{model_name}"
+        keys = [
+            GeminiKey(api_key, glm.GenerativeServiceClient(client_options={"api_key": api_key}), requests_per_minute, requests_per_day)
+            for api_key in api_keys
+        ]
+        self.pool = GeminiKeyPool(keys, cooldown, max_wait)
+
+    def _request(self, prompt):
+        glm = self._glm
+        return glm.GenerateContentRequest(
+            model=self.model_name,
+            contents=[glm.Content(role='user', parts=[glm.Part(text=prompt)])],
+        )
+
+    def _call(self, request):
+        """Run `request(client)` on pool keys until one is not over quota."""
+        last_error = None
+        for _ in range(len(self.pool.keys)):
+            key = self.pool.acquire()
+            try:
+                result = request(key.client)
+            except Exception as e:
+                quota_error = is_quota_error(e)
+                self.pool.release(key, quota_error=quota_error)
+                if not quota_error:
+                    raise
+                last_error = e
+                continue
+            self.pool.release(key)
+            return result
+        raise last_error
+
+    def generate(self, prompt, num_questions=None, compact=False):
+        response = self._response_type.from_response(
+            self._call(lambda client: client.generate_content(self._request(prompt)))
+        )
+        try:
+            text = response.text
+        except ValueError:
+            # Raised when the candidate was blocked and has no text parts.
+            text = ""
+        usage = getattr(response, 'usage_metadata', None)
+        return LLMResponse(
+            text,
+            input_tokens=getattr(usage, 'prompt_token_count', 0) or 0,
+            output_tokens=getattr(usage, 'candidates_token_count', 0) or 0,
+            feedback=getattr(response, 'prompt_feedback', None),
+        )
+
+    def stream(self, prompt, num_questions=None, compact=False):
+        # Quota errors surface on the first chunk, so open the stream inside
+        # the retry loop and only hand back text once it has started.
+        def start(client):
+            iterator = iter(self._response_type.from_iterator(client.stream_generate_content(self._request(prompt))))
+            return iterator, next(iterator, None)
+
+        iterator, first_chunk = self._call(start)
+        if first_chunk is None:
+            return
+        yield first_chunk.text
+        for chunk in iterator:
+            yield chunk.text
+
+class FakeBackend(LLMBackend):
+    """
+    Offline stand-in that returns valid quiz JSON built from the prompt.
+    The same prompt always produces the same quiz. Latency (per call, per
+    question and per output token), failure rate and reported output tokens
+    are configurable so the pipeline can be profiled and load-tested without
+    a key or network.
+    """
+    name = 'fake'
+
+    def __init__(self, latency=0.0, latency_per_question=0.0, latency_per_output_token=0.0,
+                 failure_rate=0.0, output_tokens_per_question=0):
+        self.latency = latency
+        self.latency_per_question = latency_per_question
+        self.latency_per_output_token = latency_per_output_token
+        self.failure_rate = failure_rate
+        # 0 means estimate the count from the length of the response text.
+        self.output_tokens_per_question = output_tokens_per_question
+        self._failure_random = random.Random(0)
+        self._failure_lock = threading.Lock()
+
+    def _should_fail(self):
+        with self._failure_lock:
+            return self._failure_random.random() < self.failure_rate
+
+    def _build_quiz(self, prompt, num_questions):
+        if num_questions is None:
+            match = re.search(r'with (\d+) questions', prompt)
+            num_questions = int(match.group(1)) if match else 5
+        num_questions = int(num_questions)
+
+        rng = random.Random(hashlib.sha256(prompt.encode('utf-8')).hexdigest())
+        words = re.findall(r'[A-Za-z]{5,}', prompt.rsplit('---', 2)[-2] if prompt.count('---') >= 2 else prompt)
+        words = words or ['concept', 'principle', 'process', 'property']
+
+        quiz_data = []
+        for i in range(num_questions):
+            topic = rng.choice(words)
+            options = [rng.choice(words).capitalize() for _ in range(4)]
+            correct = rng.randrange(4)
+            quiz_data.append({
+                "question": f"Question {i + 1}: which term is most closely related to {topic.lower()}?",
+                "options": options,
+                "correctAnswer": correct,
+                "explanation": f"{options[correct]} is discussed alongside {topic.lower()} in the text.",
+            })
+        return quiz_data
+
+    def _serialize(self, question, compact):
+        if compact:
+            return json.dumps([question["question"], question["options"], question["correctAnswer"], question["explanation"]])
+        return json.dumps(question)
+
+    def _output_tokens(self, text, num_questions):
+        if self.output_tokens_per_question:
+            return self.output_tokens_per_question * num_questions
+        return estimate_tokens(text)
+
+    def generate(self, prompt, num_questions=None, compact=False):
+        quiz_data = self._build_quiz(prompt, num_questions)
+        text = "[" + ",".join(self._serialize(question, compact) for question in quiz_data) + "]"
+        output_tokens = self._output_tokens(text, len(quiz_data))
+
+        time.sleep(self.latency + self.latency_per_question * len(quiz_data) + self.latency_per_output_token * output_tokens)
+        if self._should_fail():
+            raise Exception("Fake backend failure (simulated).")
+
+        return LLMResponse(text, input_tokens=estimate_tokens(prompt), output_tokens=output_tokens)
+
+    def stream(self, prompt, num_questions=None, compact=False):
+        quiz_data = self._build_quiz(prompt, num_questions)
+        time.sleep(self.latency)
+        if self._should_fail():
+            raise Exception("Fake backend failure (simulated).")
+
+        yield "["
+        for i, question in enumerate(quiz_data):
+            piece = ("," if i else "") + self._serialize(question, compact)
+            time.sleep(self.latency_per_question + self.latency_per_output_token * self._output_tokens(piece, 1))
+            yield piece
+        yield "]"
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def create_backend(name):
+    if name == 'fake':
+        return FakeBackend(
+            latency=settings.FAKE_LLM_LATENCY,
+            latency_per_question=settings.FAKE_LLM_LATENCY_PER_QUESTION,
+            latency_per_output_token=settings.FAKE_LLM_LATENCY_PER_OUTPUT_TOKEN,
+            failure_rate=settings.FAKE_LLM_FAILURE_RATE,
+            output_tokens_per_question=settings.FAKE_LLM_OUTPUT_TOKENS_PER_QUESTION,
+        )
+    if name == 'gemini':
+        return GeminiBackend(
+            settings.GEMINI_API_KEYS,
+            settings.GEMINI_MODEL_NAME,
+            requests_per_minute=settings.GEMINI_KEY_REQUESTS_PER_MINUTE,
+            requests_per_day=settings.GEMINI_KEY_REQUESTS_PER_DAY,
+            cooldown=settings.GEMINI_KEY_COOLDOWN,
+            max_wait=settings.GEMINI_KEY_MAX_WAIT,
+        )
+    raise Exception(f"Unknown LLM backend: {name}")
+
+def get_backend():
+    """The backend selected by settings.QUIZ_LLM_BACKEND, or None if it failed to configure."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            try:
+                _backend = create_backend(settings.QUIZ_LLM_BACKEND)
+            except Exception as e:
+                print(f"Error configuring LLM backend '{settings.QUIZ_LLM_BACKEND}': {e}")
+                return None
+        return _backend
+
+def set_backend(backend):
+    """Swap the active backend (benchmarks and load tests)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
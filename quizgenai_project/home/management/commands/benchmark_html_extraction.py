@@ -0,0 +1,87 @@
+import glob
+import os
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from home.html_extraction import extract_html_text
+from home.services import extract_html_text_with_soup
+
+WORDS = "photosynthesis chlorophyll glucose oxygen carbon membrane enzyme &amp; café naïve".split()
+
+def build_page(num_sections, seed=0):
+    """A synthetic article page with the furniture the extractors must skip."""
+    rng = random.Random(seed)
+
+    def sentence():
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 25))) + "."
+
+    parts = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>Plant biology</title>",
+        "<style>body { font: 14px sans-serif } .nav > a { color: red }</style>",
+        "<script>var tracking = {'id': 42}; if (a < b) { track(); }</script></head><body>",
+        "<header><nav><ul>" + "".join(f"<li><a href='/p{i}'>Menu {i}</a></li>" for i in range(20)) + "</ul></nav></header>",
+        "<main><article><h1>Plant biology</h1>",
+    ]
+    for section in range(num_sections):
+        parts.append(f"<section><h2>Section {section}</h2>")
+        for _ in range(rng.randint(2, 5)):
+            parts.append(f"<p>{sentence()} <b>{rng.choice(WORDS)}</b> {sentence()}<br>{sentence()}</p>")
+        if section % 4 == 0:
+            parts.append("<aside><p>Related: " + sentence() + "</p></aside>")
+            parts.append("<table><tr><td>" + "</td><td>".join(rng.choice(WORDS) for _ in range(5)) + "</td></tr></table>")
+        parts.append("<!-- tracking pixel --></section>")
+    parts.append("</article></main><footer><p>Copyright " + sentence() + "</p></footer>")
+    parts.append("<script>window.onload = function () { render('<p>not text</p>'); };</script></body></html>")
+    return "".join(parts).encode('utf-8')
+
+def _chunks(data, size=64 * 1024):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+class Command(BaseCommand):
+    help = "Check the streaming HTML extractor against BeautifulSoup on a corpus of pages and compare their speed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixtures', help="Directory of saved .html pages (defaults to a synthetic corpus).")
+        parser.add_argument('--sections', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--max-chars', type=int, default=None, help="Also time the streaming extractor with this text budget.")
+
+    def handle(self, *args, **options):
+        if options['fixtures']:
+            corpus = []
+            for path in sorted(glob.glob(os.path.join(options['fixtures'], '*.html'))):
+                with open(path, 'rb') as fh:
+                    corpus.append((os.path.basename(path), fh.read()))
+        else:
+            corpus = [(f"{sections} sections", build_page(sections, seed=sections)) for sections in options['sections']]
+
+        self.stdout.write(f"{'page':>24} {'KB':>7} {'soup':>8} {'stream':>8} {'speedup':>8}  same text")
+        mismatches = 0
+        for label, data in corpus:
+            soup_text = extract_html_text_with_soup(data)
+            stream_text = extract_html_text(_chunks(data))
+            same = soup_text.split() == stream_text.split()
+            mismatches += not same
+
+            soup_time = self._time(options['runs'], lambda: extract_html_text_with_soup(data))
+            stream_time = self._time(options['runs'], lambda: extract_html_text(_chunks(data)))
+            line = f"{label[:24]:>24} {len(data) / 1024:7.0f} {soup_time:7.3f}s {stream_time:7.3f}s {soup_time / stream_time:7.1f}x  {'yes' if same else 'NO'}"
+            if options['max_chars']:
+                budget_time = self._time(options['runs'], lambda: extract_html_text(_chunks(data), max_chars=options['max_chars']))
+                line += f"  ({budget_time:.3f}s with a {options['max_chars']}-char budget)"
+            self.stdout.write(line)
+
+        if mismatches:
+            self.stdout.write(self.style.WARNING(f"{mismatches} of {len(corpus)} pages extracted differently."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"All {len(corpus)} pages extracted the same text."))
+
+    def _time(self, runs, extract):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            extract()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
@@ -0,0 +1,77 @@
+import os
+import statistics
+import tempfile
+import time
+import fitz
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from home import pdf_extraction
+
+PARAGRAPH = (
+    "Thermodynamics describes how energy moves between a system and its surroundings. "
+    "The first law states that energy is conserved; the second introduces entropy, "
+    "which never decreases in an isolated system. Enthalpy, free energy and chemical "
+    "potential follow from these definitions and predict whether a reaction is spontaneous. "
+)
+
+def build_pdf(path, num_pages):
+    pdf_document = fitz.open()
+    for page_number in range(num_pages):
+        page = pdf_document.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), f"Page {page_number + 1}\n" + PARAGRAPH * 8, fontsize=9)
+    pdf_document.save(path)
+    pdf_document.close()
+
+class _OnDisk:
+    """Minimal stand-in for an upload stored at `path`."""
+
+    def __init__(self, path):
+        self.name = path
+
+class Command(BaseCommand):
+    help = "Time serial and process-pool PDF extraction across page counts to find where the pool starts paying off."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+', default=[8, 16, 32, 64, 128, 256, 512])
+        parser.add_argument('--workers', type=int, default=max(settings.PDF_EXTRACT_WORKERS, 2))
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--pdf', help="Also time this PDF file.")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        # Start the pool outside the timings, as it would be in a running server.
+        pdf_extraction.extract_pdf_pages_parallel(self._sample(1), 1, workers)
+
+        cases = [(f"{pages} pages", self._sample(pages)) for pages in options['pages']]
+        if options['pdf']:
+            cases.append((os.path.basename(options['pdf']), options['pdf']))
+
+        crossover = None
+        self.stdout.write(f"{'document':>16} {'serial':>9} {'parallel':>9}  speedup  ({workers} workers)")
+        for label, path in cases:
+            with fitz.open(path) as pdf_document:
+                page_count = pdf_document.page_count
+            serial = self._time(options['runs'], lambda: pdf_extraction.extract_pdf_text(_OnDisk(path)))
+            parallel = self._time(options['runs'], lambda: pdf_extraction.extract_pdf_pages_parallel(path, page_count, workers))
+            self.stdout.write(f"{label:>16} {serial:8.3f}s {parallel:8.3f}s  {serial / parallel:6.2f}x")
+            if crossover is None and parallel < serial:
+                crossover = page_count
+
+        if crossover is None:
+            self.stdout.write(self.style.WARNING("The pool never beat serial extraction here; keep PDF_EXTRACT_WORKERS at 0."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Parallel extraction wins from about {crossover} pages (PDF_PARALLEL_MIN_PAGES={settings.PDF_PARALLEL_MIN_PAGES})."))
+
+    def _sample(self, pages):
+        path = os.path.join(tempfile.gettempdir(), f"quizgen-benchmark-{pages}.pdf")
+        if not os.path.exists(path):
+            build_pdf(path, pages)
+        return path
+
+    def _time(self, runs, extract):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            extract()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
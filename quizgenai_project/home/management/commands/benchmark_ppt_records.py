@@ -0,0 +1,115 @@
+import io
+import random
+import statistics
+import struct
+import time
+from django.core.management.base import BaseCommand
+from home.ppt_extraction import extract_ppt_text_runs
+
+SLIDE_CONTAINER = 1006
+SLIDE_ATOM = 1007
+TEXT_HEADER_ATOM = 3999
+STYLE_TEXT_PROP_ATOM = 4001
+TEXT_CHARS_ATOM = 4000
+TEXT_BYTES_ATOM = 4008
+PICTURE_BLOB = 0xF01E
+
+def _record(rec_type, payload, version=0):
+    return struct.pack('<HHI', version, rec_type, len(payload)) + payload
+
+def build_record_stream(num_slides, seed=0, picture_bytes=20000):
+    """A synthetic 'PowerPoint Document' stream: slide containers with text atoms, formatting atoms and image blobs."""
+    rng = random.Random(seed)
+    words = "energy entropy enthalpy reaction equilibrium catalyst kinetics isotope électron molécule".split()
+    parts = []
+    for slide in range(num_slides):
+        children = [_record(SLIDE_ATOM, bytes(24))]
+        for _ in range(rng.randint(2, 6)):
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(4, 40)))
+            children.append(_record(TEXT_HEADER_ATOM, struct.pack('<I', 1)))
+            if rng.random() < 0.5:
+                children.append(_record(TEXT_CHARS_ATOM, text.encode('utf-16le')))
+            else:
+                children.append(_record(TEXT_BYTES_ATOM, text.encode('latin-1')))
+            children.append(_record(STYLE_TEXT_PROP_ATOM, bytes(rng.randint(10, 60))))
+        if slide % 3 == 0:
+            children.append(_record(PICTURE_BLOB, rng.randbytes(picture_bytes)))
+        parts.append(_record(SLIDE_CONTAINER, b"".join(children), version=0x0F))
+    return b"".join(parts)
+
+def slice_and_unpack_walk(data):
+    """The previous walker: slices and struct.unpack per header field."""
+    text_runs = []
+    idx = 0
+    while idx < len(data):
+        if idx + 8 > len(data):
+            break
+        rec_ver_inst = struct.unpack('<H', data[idx:idx+2])[0]
+        rec_type = struct.unpack('<H', data[idx+2:idx+4])[0]
+        rec_len = struct.unpack('<I', data[idx+4:idx+8])[0]
+        rec_ver = rec_ver_inst & 0x000F
+        if rec_type in (4000, 4008):
+            if idx + 8 + rec_len <= len(data):
+                try:
+                    text_runs.append(data[idx+8:idx+8+rec_len].decode('utf-16le' if rec_type == 4000 else 'latin-1'))
+                except UnicodeDecodeError:
+                    pass
+            idx += 8 + rec_len
+        elif rec_ver == 0x0F:
+            idx += 8
+        else:
+            idx += 8 + rec_len
+    return text_runs
+
+class _Unbuffered(io.RawIOBase):
+    """A non-BytesIO stream, to exercise the chunked reader."""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=0):
+        return self._data.seek(offset, whence)
+
+    def readinto(self, buffer):
+        return self._data.readinto(buffer)
+
+class Command(BaseCommand):
+    help = "Time the legacy .ppt record walker against the previous slice-and-unpack version on synthetic record streams."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slides', type=int, nargs='+', default=[100, 1000, 5000])
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--chunk-size', type=int, default=64 * 1024)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'slides':>7} {'MB':>7} {'previous':>9} {'in place':>9} {'chunked':>9}  speedup")
+        for num_slides in options['slides']:
+            data = build_record_stream(num_slides)
+            expected = slice_and_unpack_walk(data)
+
+            in_place = extract_ppt_text_runs(io.BytesIO(data))
+            chunked = extract_ppt_text_runs(_Unbuffered(data), chunk_size=options['chunk_size'])
+            if in_place != expected or chunked != expected:
+                raise AssertionError(f"Text runs differ from the previous walker for {num_slides} slides")
+
+            previous_time = self._time(options['runs'], lambda: slice_and_unpack_walk(data))
+            in_place_time = self._time(options['runs'], lambda: extract_ppt_text_runs(io.BytesIO(data)))
+            chunked_time = self._time(options['runs'], lambda: extract_ppt_text_runs(_Unbuffered(data), chunk_size=options['chunk_size']))
+            self.stdout.write(
+                f"{num_slides:>7} {len(data) / 1e6:7.1f} {previous_time:8.4f}s {in_place_time:8.4f}s {chunked_time:8.4f}s"
+                f"  {previous_time / in_place_time:6.2f}x"
+            )
+
+    def _time(self, runs, walk):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            walk()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
@@ -0,0 +1,78 @@
+import io
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from PIL import Image
+from pptx import Presentation
+from pptx.util import Inches
+from home.ppt_extraction import extract_pptx_text
+from home.services import extract_text_from_pptx_object_model
+
+WORDS = "energy entropy enthalpy reaction equilibrium catalyst kinetics isotope electron molecule oxidation".split()
+
+def build_deck(num_slides, images_per_slide=1, seed=0):
+    """A synthetic deck: a title and bullet text on every slide, plus noisy (incompressible) images."""
+    rng = random.Random(seed)
+    presentation = Presentation()
+    layout = presentation.slide_layouts[1]
+    for slide_number in range(num_slides):
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide {slide_number + 1}: {rng.choice(WORDS).capitalize()}"
+        body = slide.placeholders[1].text_frame
+        body.text = " ".join(rng.choice(WORDS) for _ in range(12))
+        for _ in range(rng.randint(2, 5)):
+            body.add_paragraph().text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 20)))
+        for _ in range(images_per_slide):
+            image = io.BytesIO()
+            Image.frombytes('RGB', (256, 256), rng.randbytes(256 * 256 * 3)).save(image, format='PNG')
+            image.seek(0)
+            slide.shapes.add_picture(image, Inches(6), Inches(5), width=Inches(2))
+    deck = io.BytesIO()
+    presentation.save(deck)
+    return deck.getvalue()
+
+class Command(BaseCommand):
+    help = "Compare speed and peak memory of the direct-XML .pptx extractor with python-pptx."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slides', type=int, nargs='+', default=[10, 50, 200])
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--pptx', help="Also measure this .pptx file.")
+
+    def handle(self, *args, **options):
+        cases = [(f"{num_slides} slides", build_deck(num_slides)) for num_slides in options['slides']]
+        if options['pptx']:
+            with open(options['pptx'], 'rb') as fh:
+                cases.append((os.path.basename(options['pptx']), fh.read()))
+
+        self.stdout.write(f"{'deck':>14} {'MB':>6} {'python-pptx':>12} {'xml':>8} {'speedup':>8} {'peak MB pptx':>13} {'peak MB xml':>12}")
+        for label, data in cases:
+            object_model_text = extract_text_from_pptx_object_model(io.BytesIO(data))
+            xml_text = extract_pptx_text(io.BytesIO(data))
+            if object_model_text.split() != xml_text.split():
+                self.stdout.write(self.style.WARNING(f"{label}: extracted text differs (groups and tables are only read by the XML path)"))
+
+            object_model_time, object_model_peak = self._measure(options['runs'], lambda: extract_text_from_pptx_object_model(io.BytesIO(data)))
+            xml_time, xml_peak = self._measure(options['runs'], lambda: extract_pptx_text(io.BytesIO(data)))
+            self.stdout.write(
+                f"{label:>14} {len(data) / 1e6:6.1f} {object_model_time:11.3f}s {xml_time:7.3f}s {object_model_time / xml_time:7.1f}x"
+                f" {object_model_peak / 1e6:13.1f} {xml_peak / 1e6:12.1f}"
+            )
+
+    def _measure(self, runs, extract):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            extract()
+            timings.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        try:
+            extract()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return statistics.median(timings), peak
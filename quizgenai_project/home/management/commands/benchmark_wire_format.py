@@ -0,0 +1,61 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from home import llm, services
+
+SAMPLE_TEXT = """
+Photosynthesis converts light energy into chemical energy stored in glucose.
+Chlorophyll in the thylakoid membranes absorbs light, driving the light-dependent
+reactions that split water, release oxygen and produce ATP and NADPH. The Calvin
+cycle in the stroma then fixes carbon dioxide using that ATP and NADPH. Factors such
+as light intensity, carbon dioxide concentration and temperature limit the rate of
+photosynthesis, and plants adapted to hot climates use C4 or CAM pathways to reduce
+photorespiration.
+""" * 20
+
+class Command(BaseCommand):
+    help = "Compare output tokens and latency of the verbose and compact quiz response formats using the fake backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--questions', type=int, default=10)
+        parser.add_argument('--latency-per-token', type=float, default=0.005,
+                            help="Simulated decode time per output token, in seconds.")
+
+    def handle(self, *args, **options):
+        backend = llm.FakeBackend(latency=0.2, latency_per_output_token=options['latency_per_token'])
+        previous = llm.get_backend()
+        llm.set_backend(backend)
+        try:
+            results = {fmt: self._measure(fmt, options['runs'], options['questions']) for fmt in ('verbose', 'compact')}
+        finally:
+            llm.set_backend(previous)
+
+        for fmt, (tokens, seconds) in results.items():
+            self.stdout.write(f"{fmt:8} output tokens: {tokens:7.1f}   latency: {seconds:6.2f}s")
+
+        verbose_tokens, verbose_seconds = results['verbose']
+        compact_tokens, compact_seconds = results['compact']
+        self.stdout.write(self.style.SUCCESS(
+            f"compact saves {100 * (1 - compact_tokens / verbose_tokens):.0f}% of output tokens "
+            f"and {100 * (1 - compact_seconds / verbose_seconds):.0f}% of latency"
+        ))
+
+    def _measure(self, fmt, runs, num_questions):
+        backend = llm.get_backend()
+        tokens = []
+        seconds = []
+        with override_settings(QUIZ_RESPONSE_FORMAT=fmt, QUIZ_CACHE_ENABLED=False):
+            compact = services._use_compact_format()
+            for run in range(runs):
+                # Vary the prompt so every run builds a different quiz.
+                text = f"Run {run}.\n{SAMPLE_TEXT}"
+                prompt = services.build_quiz_prompt(text, num_questions, "", compact=compact)
+                tokens.append(backend.generate(prompt, num_questions=num_questions, compact=compact).output_tokens)
+
+                started = time.monotonic()
+                quiz_data = services._generate_quiz_with_model(text, num_questions, "")
+                seconds.append(time.monotonic() - started)
+                assert len(quiz_data) == num_questions
+        return statistics.mean(tokens), statistics.mean(seconds)
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from home.jobs import prune_anonymous_quizzes
+
+class Command(BaseCommand):
+    help = (
+        "Delete old anonymous quizzes: all but the newest few of each session, and any older than "
+        "ANONYMOUS_QUIZ_MAX_AGE. Meant to run periodically (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=settings.ANONYMOUS_QUIZZES_PER_SESSION, help="Quizzes kept per session.")
+        parser.add_argument('--max-age', type=int, default=settings.ANONYMOUS_QUIZ_MAX_AGE, help="Seconds an anonymous quiz is kept at most.")
+        parser.add_argument('--batch-size', type=int, default=settings.QUIZ_PRUNE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        deleted = prune_anonymous_quizzes(options['keep'], options['max_age'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} anonymous quizzes."))
@@ -0,0 +1,20 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from home.services import get_quiz_cache_stats
+
+class Command(BaseCommand):
+    help = "Report the quiz cache's size, the hits its entries have served and its recent hit rate."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help="Window for the hit rate, in days (0 for all time).")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days']) if options['days'] else None
+        stats = get_quiz_cache_stats(since=since)
+        window = f"last {options['days']} days" if since else "all time"
+        self.stdout.write(f"Entries: {stats['entries']} ({stats['stored_hits']} hits served by current entries)")
+        self.stdout.write(
+            f"Generations ({window}): {stats['generations']}, {stats['cached_generations']} from the cache "
+            f"(hit rate {stats['hit_rate']:.1%})"
+        )
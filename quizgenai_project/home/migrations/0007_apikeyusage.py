@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0006_generationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiKeyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_id', models.CharField(max_length=16)),
+                ('day', models.DateField()),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('quota_errors', models.PositiveIntegerField(default=0)),
+                ('cooldown_until', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('key_id', 'day'), name='unique_api_key_usage_per_day')],
+            },
+        ),
+    ]
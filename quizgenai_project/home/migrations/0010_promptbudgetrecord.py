@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0009_questionbank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromptBudgetRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('num_questions', models.PositiveIntegerField()),
+                ('document_chars', models.PositiveIntegerField()),
+                ('document_tokens', models.PositiveIntegerField()),
+                ('source_chars', models.PositiveIntegerField()),
+                ('source_tokens', models.PositiveIntegerField()),
+                ('prompt_tokens', models.PositiveIntegerField()),
+                ('expected_output_tokens', models.PositiveIntegerField()),
+                ('expected_latency', models.FloatField()),
+                ('limited_by', models.CharField(max_length=16)),
+                ('input_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('output_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0010_promptbudgetrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationTiming',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_type', models.CharField(max_length=8)),
+                ('num_questions', models.PositiveIntegerField()),
+                ('source_bytes', models.PositiveIntegerField(blank=True, null=True)),
+                ('text_chars', models.PositiveIntegerField(blank=True, null=True)),
+                ('queue_seconds', models.FloatField(default=0)),
+                ('extract_seconds', models.FloatField(default=0)),
+                ('generate_seconds', models.FloatField(default=0)),
+                ('save_seconds', models.FloatField(default=0)),
+                ('total_seconds', models.FloatField()),
+                ('streamed', models.BooleanField(default=False)),
+                ('cached', models.BooleanField(default=False)),
+                ('succeeded', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LatencyModelState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+                ('xtx', models.JSONField(default=list)),
+                ('xty', models.JSONField(default=list)),
+                ('yty', models.FloatField(default=0)),
+                ('weight', models.FloatField(default=0)),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('source_stats', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
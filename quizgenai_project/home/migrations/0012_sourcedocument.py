@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0011_generationtiming'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SourceDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('source_type', models.CharField(max_length=8)),
+                ('compressed_text', models.BinaryField()),
+                ('text_chars', models.PositiveIntegerField()),
+                ('page_offsets', models.JSONField(default=list)),
+                ('complete', models.BooleanField(default=True)),
+                ('stored_bytes', models.PositiveIntegerField()),
+                ('extracted_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='source_document',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='quizzes', to='home.sourcedocument'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0012_sourcedocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sourcedocument',
+            name='removed_chars',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
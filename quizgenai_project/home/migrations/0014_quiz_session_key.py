@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0013_sourcedocument_removed_chars'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='session_key',
+            field=models.CharField(blank=True, db_index=True, max_length=40),
+        ),
+    ]
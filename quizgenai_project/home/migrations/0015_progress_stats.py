@@ -0,0 +1,76 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_question_counts(apps, schema_editor):
+    Quiz = apps.get_model('home', 'Quiz')
+    batch = []
+    for quiz in Quiz.objects.only('id', 'quiz_data').iterator(chunk_size=500):
+        quiz.question_count = len(quiz.quiz_data or [])
+        batch.append(quiz)
+        if len(batch) >= 500:
+            Quiz.objects.bulk_update(batch, ['question_count'])
+            batch = []
+    if batch:
+        Quiz.objects.bulk_update(batch, ['question_count'])
+
+
+def backfill_progress_stats(apps, schema_editor):
+    QuizAttempt = apps.get_model('home', 'QuizAttempt')
+    UserProgressStats = apps.get_model('home', 'UserProgressStats')
+    stats = {}
+    attempts = QuizAttempt.objects.filter(user__isnull=False).values_list('user_id', 'score', 'quiz__question_count')
+    for user_id, score, question_count in attempts.iterator(chunk_size=2000):
+        row = stats.setdefault(user_id, UserProgressStats(user_id=user_id))
+        percentage = (score / question_count) * 100 if question_count > 0 else 0
+        row.total_attempts += 1
+        row.total_correct += score
+        row.total_questions += question_count
+        row.percentage_sum += percentage
+        row.best_percentage = max(row.best_percentage, percentage)
+        if percentage == 100 and question_count > 0:
+            row.perfect_count += 1
+    UserProgressStats.objects.bulk_create(stats.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0014_quiz_session_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserProgressStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_attempts', models.PositiveIntegerField(default=0)),
+                ('total_correct', models.PositiveIntegerField(default=0)),
+                ('total_questions', models.PositiveIntegerField(default=0)),
+                ('percentage_sum', models.FloatField(default=0)),
+                ('best_percentage', models.FloatField(default=0)),
+                ('perfect_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['user', 'timestamp'], name='quizattempt_user_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='userprogressstats',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='progress_stats', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_question_counts, migrations.RunPython.noop),
+        migrations.RunPython(backfill_progress_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:38
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_extracted_chars(apps, schema_editor):
+    # Normalization only ever removes characters, so this is what was extracted.
+    SourceDocument = apps.get_model('home', 'SourceDocument')
+    SourceDocument.objects.update(extracted_chars=F('text_chars') + F('removed_chars'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0016_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sourcedocument',
+            name='extracted_chars',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_extracted_chars, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,45 @@
 from django.db import models
 from django.contrib.auth.models import User
 import uuid
+import zlib
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+class SourceDocument(models.Model):
+    """
+    The extracted text of one uploaded file or web page, keyed by the SHA-256
+    of the file's bytes (or of the normalized URL), so later quizzes from the
+    same source skip parsing it. The text is stored zlib-compressed.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    source_type = models.CharField(max_length=8)
+    compressed_text = models.BinaryField()
+    text_chars = models.PositiveIntegerField()
+    # Character offset where each page (PDF) or slide (.pptx) starts.
+    page_offsets = models.JSONField(default=list)
+    # False when extraction stopped at a text budget before the end of the source.
+    complete = models.BooleanField(default=True)
+    # Characters extracted before normalization; an incomplete document covers budgets up to this.
+    extracted_chars = models.PositiveIntegerField(default=0)
+    # Characters of boilerplate (repeated headers/footers, page numbers, extra whitespace) stripped from the text.
+    removed_chars = models.PositiveIntegerField(default=0)
+    # Size of compressed_text, counted against DOCUMENT_STORE_MAX_BYTES.
+    stored_bytes = models.PositiveIntegerField()
+    extracted_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    @cached_property
+    def text(self):
+        return zlib.decompress(bytes(self.compressed_text)).decode('utf-8')
+
+    def pages(self):
+        """The text of each page or slide, split at page_offsets."""
+        bounds = list(self.page_offsets or [0]) + [len(self.text)]
+        return [self.text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    def __str__(self):
+        return f"{self.source_type} {self.key[:12]} ({self.text_chars} chars)"
+
 
 class Quiz(models.Model):
     """
@@ -11,16 +50,31 @@ class Quiz(models.Model):
     
     # The user who created the quiz
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+
+    # The session an anonymous quiz belongs to; only that visitor sees it.
+    session_key = models.CharField(max_length=40, blank=True, db_index=True)
     
     # The title of the quiz, which can be the PDF filename.
     title = models.CharField(max_length=255)
     
     # The actual quiz questions and answers, stored in a flexible JSON format.
     quiz_data = models.JSONField()
+
+    # len(quiz_data), so listings and statistics need not load the questions.
+    question_count = models.PositiveIntegerField(default=0)
+
+    # The extracted text the quiz was generated from, while it stays in the document store.
+    source_document = models.ForeignKey(SourceDocument, on_delete=models.SET_NULL, null=True, blank=True, related_name='quizzes')
     
     # Automatically records the date and time when the quiz was created.
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # The history page, newest first, a page at a time.
+            models.Index(fields=['user', 'created_at'], name='quiz_user_created_idx'),
+        ]
+
     def __str__(self):
         """A human-readable representation of the model."""
         return self.title
@@ -36,5 +90,231 @@ class QuizAttempt(models.Model):
     user_answers = models.JSONField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # The progress page's daily chart.
+            models.Index(fields=['user', 'timestamp'], name='quizattempt_user_time_idx'),
+            # The latest attempt shown with a quiz's answers.
+            models.Index(fields=['quiz', 'user', 'timestamp'], name='quizattempt_quiz_user_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quiz.title} - {self.score}"
+
+
+class UserProgressStats(models.Model):
+    """
+    Running totals of a user's quiz attempts, updated with each saved
+    attempt so the progress page never rescans QuizAttempt.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='progress_stats')
+    total_attempts = models.PositiveIntegerField(default=0)
+    total_correct = models.PositiveIntegerField(default=0)
+    total_questions = models.PositiveIntegerField(default=0)
+    # Sum of each attempt's score as a percentage, for the average.
+    percentage_sum = models.FloatField(default=0)
+    best_percentage = models.FloatField(default=0)
+    perfect_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user}: {self.total_attempts} attempts"
+
+class QuizCacheEntry(models.Model):
+    """
+    A generated quiz stored under a hash of its source text and quiz options,
+    so repeat uploads of the same document skip the Gemini call.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    quiz_data = models.JSONField()
+    # How many times this entry has been served instead of calling the model.
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} ({self.hits} hits)"
+
+
+class GenerationJob(models.Model):
+    """
+    A quiz generation request running on the in-process worker pool.
+    The client polls its status and fetches the finished quiz from it.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    SOURCE_PDF = 'pdf'
+    SOURCE_PPT = 'ppt'
+    SOURCE_URL = 'url'
+    SOURCE_CHOICES = [
+        (SOURCE_PDF, 'PDF'),
+        (SOURCE_PPT, 'PPT'),
+        (SOURCE_URL, 'URL'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    # Lets anonymous visitors poll only the jobs they started.
+    session_key = models.CharField(max_length=40, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    source_type = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    source_url = models.TextField(blank=True)
+    # Title for the resulting quiz (the uploaded file name or "Quiz from <domain>").
+    title = models.CharField(max_length=255)
+    error = models.TextField(blank=True)
+    quiz = models.ForeignKey(Quiz, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.title} ({self.status})"
+
+
+class ApiKeyUsage(models.Model):
+    """
+    Requests sent with one Gemini API key on one day, shared by every worker
+    process so restarts and parallel workers agree on the remaining quota.
+    Keys are identified by a hash fingerprint, never stored in the clear.
+    """
+    key_id = models.CharField(max_length=16)
+    day = models.DateField()
+    requests = models.PositiveIntegerField(default=0)
+    quota_errors = models.PositiveIntegerField(default=0)
+    # Set when the key returns quota errors; it is skipped until then.
+    cooldown_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key_id', 'day'], name='unique_api_key_usage_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.key_id} on {self.day}: {self.requests} requests"
+
+
+class GenerationLock(models.Model):
+    """
+    Held while one worker process generates a quiz for a cache key, so
+    identical requests in other workers wait for its result instead of
+    calling the model again.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.key
+
+
+class QuestionBank(models.Model):
+    """
+    A pool of questions generated once per unique document (and custom
+    instructions). Later requests for the document sample from it instead
+    of calling the model.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    questions = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} ({len(self.questions)} questions)"
+
+
+class QuestionBankDraw(models.Model):
+    """Which questions of a bank one user (or anonymous session) has already been given."""
+    bank = models.ForeignKey(QuestionBank, on_delete=models.CASCADE, related_name='draws')
+    # "user:<id>" or "session:<session key>"
+    owner_key = models.CharField(max_length=64)
+    # Indices into bank.questions
+    served = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bank', 'owner_key'], name='unique_question_bank_draw'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_key}: {len(self.served)} served"
+
+
+class PromptBudgetRecord(models.Model):
+    """
+    The document budget chosen for one model call, next to the tokens and
+    time the call actually took, for tuning the planner settings.
+    """
+    num_questions = models.PositiveIntegerField()
+    document_chars = models.PositiveIntegerField()
+    document_tokens = models.PositiveIntegerField()
+    # The part of the document that went into the prompt.
+    source_chars = models.PositiveIntegerField()
+    source_tokens = models.PositiveIntegerField()
+    prompt_tokens = models.PositiveIntegerField()
+    expected_output_tokens = models.PositiveIntegerField()
+    expected_latency = models.FloatField()  # seconds
+    limited_by = models.CharField(max_length=16)
+    # Reported by the model; empty when it does not report usage (streaming).
+    input_tokens = models.PositiveIntegerField(null=True, blank=True)
+    output_tokens = models.PositiveIntegerField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)  # seconds
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.num_questions} questions: {self.source_tokens} source tokens ({self.limited_by})"
+
+
+class GenerationTiming(models.Model):
+    """
+    Wall-clock time spent in each stage of one quiz generation, used to
+    fit the latency model behind the countdown shown while generating.
+    """
+    source_type = models.CharField(max_length=8)
+    num_questions = models.PositiveIntegerField()
+    # Size of the uploaded file; empty for URLs.
+    source_bytes = models.PositiveIntegerField(null=True, blank=True)
+    text_chars = models.PositiveIntegerField(null=True, blank=True)
+    # Stage timings in seconds.
+    queue_seconds = models.FloatField(default=0)
+    extract_seconds = models.FloatField(default=0)
+    generate_seconds = models.FloatField(default=0)
+    save_seconds = models.FloatField(default=0)
+    total_seconds = models.FloatField()
+    streamed = models.BooleanField(default=False)
+    # Served from the quiz cache, so not representative of a model call.
+    cached = models.BooleanField(default=False)
+    succeeded = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.source_type}, {self.num_questions} questions: {self.total_seconds:.1f}s"
+
+
+class LatencyModelState(models.Model):
+    """
+    Running sufficient statistics (X'X, X'y, y'y) of the generation-latency
+    regression, updated with each finished generation so predictions never
+    rescan GenerationTiming. Also tracks how much text each source type
+    yields per byte, to turn a file size into a text length.
+    """
+    name = models.CharField(max_length=32, unique=True)
+    xtx = models.JSONField(default=list)
+    xty = models.JSONField(default=list)
+    yty = models.FloatField(default=0)
+    # Effective number of samples after decay.
+    weight = models.FloatField(default=0)
+    samples = models.PositiveIntegerField(default=0)
+    # {source_type: {"count": ..., "chars": ..., "bytes": ...}}
+    source_stats = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"{self.quiz.title} - {self.score}"
\ No newline at end of file
+        return f"{self.name} ({self.samples} samples)"
@@ -0,0 +1,74 @@
+import re
+from collections import Counter
+
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"[ \t\f\v\u00a0]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+# A word broken at the end of a line ("photo-\nsynthesis"); only rejoined
+# when the next line continues in lower case, so "well-\nKnown" stays.
+_HYPHENATED_BREAK = re.compile(r"(\w)-\n[ \t]*([a-z])")
+# Lines that are nothing but a page number: "12", "- 12 -", "Page 12 of 40", "12/40".
+_PAGE_NUMBER = re.compile(r"^(page\s*)?[-–—(\[]?\s*\d+\s*[-–—)\]]?(\s*(of|/)\s*\d+)?$", re.IGNORECASE)
+
+# Running headers and footers sit in the first and last few lines of a page,
+# at the same place on every page; only those lines are candidates for
+# removal. Pages shorter than four times this keep proportionally fewer.
+_EDGE_LINES = 3
+
+def _line_signature(line):
+    """What an edge line is compared by: case, spacing and numbers (page or lecture numbers) ignored."""
+    return _DIGITS.sub("#", _SPACES.sub(" ", line).strip().lower())
+
+def _edge_positions(lines):
+    """
+    {index: position} for the header and footer lines of a page: position
+    0, 1, ... counts down from the top and -1, -2, ... up from the bottom.
+    """
+    filled = [index for index, line in enumerate(lines) if line.strip()]
+    depth = min(_EDGE_LINES, len(filled) // 4)
+    positions = {}
+    for offset in range(depth):
+        positions[filled[offset]] = offset
+        positions[filled[-1 - offset]] = -1 - offset
+    return positions
+
+def find_repeated_lines(pages, min_fraction=0.6, min_pages=3):
+    """
+    (position, signature) of the header and footer lines found at the same
+    place on at least `min_fraction` of the pages (and at least `min_pages`
+    of them): running headers, footers and copyright lines.
+    """
+    if len(pages) < min_pages:
+        return set()
+    counts = Counter()
+    for page_text in pages:
+        lines = page_text.splitlines()
+        counts.update({(position, _line_signature(lines[index])) for index, position in _edge_positions(lines).items()})
+    threshold = max(min_pages, min_fraction * len(pages))
+    return {key for key, count in counts.items() if count >= threshold}
+
+def _clean_page(page_text, repeated):
+    raw_lines = page_text.splitlines()
+    edges = _edge_positions(raw_lines)
+    lines = []
+    for index, line in enumerate(raw_lines):
+        stripped = _SPACES.sub(" ", line).strip()
+        if index in edges and ((edges[index], _line_signature(stripped)) in repeated or _PAGE_NUMBER.match(stripped)):
+            continue
+        lines.append(stripped)
+    text = "\n".join(lines)
+    text = _HYPHENATED_BREAK.sub(r"\1\2", text)
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+def normalize_pages(pages, min_fraction=0.6, min_pages=3):
+    """
+    Strip boilerplate from the text of each page or slide: header and footer
+    lines repeated across most pages and bare page numbers are dropped, words hyphenated across
+    a line break are rejoined and runs of whitespace collapsed.
+
+    Returns (pages, removed_chars).
+    """
+    repeated = find_repeated_lines(pages, min_fraction=min_fraction, min_pages=min_pages)
+    cleaned = [_clean_page(page_text, repeated) for page_text in pages]
+    removed_chars = sum(len(page_text) for page_text in pages) - sum(len(page_text) for page_text in cleaned)
+    return cleaned, removed_chars
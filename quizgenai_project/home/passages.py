@@ -0,0 +1,150 @@
+import re
+import numpy as np
+
+_WORD_PATTERN = re.compile(r"[a-z][a-z0-9]{2,}")
+_NON_LETTERS = re.compile(r"[^A-Za-z]+")
+_WHITESPACE = re.compile(r"\s+")
+
+_STOPWORDS = frozenset("""
+    the and for are but not you all any can had her was one our out has him his how its may new now
+    see two who did get let put say she too use that with have this will your from they know want been
+    good much some time very when come here just like long make many more only over such take than them
+    well were what where which while into also each other these those there their then about after
+    again being below between both could does doing down during further here itself most should through
+    under until would page pages chapter section figure table contents
+""".split())
+
+# BM25 parameters (the usual defaults)
+_K1 = 1.5
+_B = 0.75
+
+def split_into_passages(text, target_chars=1200):
+    """
+    Split text into passages of roughly `target_chars`: short paragraphs are
+    merged and paragraphs longer than twice the target are split at sentences.
+    """
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    if len(paragraphs) <= 1:
+        # Extracted PDF text often has no blank lines; fall back to single lines.
+        paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
+
+    pieces = []
+    for paragraph in paragraphs:
+        if len(paragraph) <= target_chars * 2:
+            pieces.append(paragraph)
+            continue
+        sentences = re.split(r"(?<=[.!?])\s+", paragraph)
+        for sentence in sentences:
+            while len(sentence) > target_chars * 2:
+                pieces.append(sentence[:target_chars])
+                sentence = sentence[target_chars:]
+            pieces.append(sentence)
+
+    passages = []
+    current = []
+    current_len = 0
+    for piece in pieces:
+        if current and current_len + len(piece) > target_chars:
+            passages.append("\n".join(current))
+            current = []
+            current_len = 0
+        current.append(piece)
+        current_len += len(piece) + 1
+    if current:
+        passages.append("\n".join(current))
+    return passages
+
+def _tokenize(text):
+    return [word for word in _WORD_PATTERN.findall(text.lower()) if word not in _STOPWORDS]
+
+def score_passages(passages, query=""):
+    """
+    Score each passage by how well it represents the document as a whole.
+
+    The query is a pseudo-document built from the whole text: terms that
+    recur across passages weighted by IDF, so the ranking favours passages
+    dense in the document's core vocabulary. Terms from `query` (e.g. the
+    custom instructions) get extra weight. Terms that appear in most
+    passages (running headers, course codes) and passages that are mostly
+    digits and punctuation (tables of contents, page furniture) are
+    down-weighted.
+    """
+    tokenized = [_tokenize(passage) for passage in passages]
+    vocabulary = {}
+    rows = []
+    cols = []
+    for row, tokens in enumerate(tokenized):
+        for token in tokens:
+            rows.append(row)
+            cols.append(vocabulary.setdefault(token, len(vocabulary)))
+
+    num_passages = len(passages)
+    if not vocabulary:
+        return np.zeros(num_passages)
+
+    rows = np.array(rows)
+    cols = np.array(cols)
+    lengths = np.bincount(rows, minlength=num_passages).astype(np.float32)
+
+    unique_pairs = np.unique(rows * len(vocabulary) + cols)
+    doc_freq = np.bincount(unique_pairs % len(vocabulary), minlength=len(vocabulary))
+
+    # Terms confined to one passage cannot represent the document; dropping
+    # them before building the dense matrix keeps it small.
+    boost_terms = {vocabulary[token] for token in set(_tokenize(query)) if token in vocabulary}
+    keep = doc_freq >= 2 if num_passages >= 4 else np.ones(len(vocabulary), dtype=bool)
+    keep[list(boost_terms)] = True
+    column_map = np.cumsum(keep) - 1
+    mask = keep[cols]
+
+    term_freq = np.zeros((num_passages, int(keep.sum())), dtype=np.float32)
+    np.add.at(term_freq, (rows[mask], column_map[cols[mask]]), 1)
+
+    doc_freq = doc_freq[keep]
+    idf = np.log((num_passages - doc_freq + 0.5) / (doc_freq + 0.5) + 1.0)
+
+    avg_length = max(lengths.mean(), 1.0)
+    norm = _K1 * (1 - _B + _B * lengths / avg_length)
+    bm25 = term_freq * (_K1 + 1) / (term_freq + norm[:, None])
+
+    query_weights = idf * np.log1p(term_freq.sum(axis=0))
+    if num_passages >= 4:
+        query_weights[doc_freq < 2] = 0
+        query_weights[doc_freq > num_passages * 0.5] = 0
+
+    boost_terms = column_map[sorted(boost_terms)]
+    if len(boost_terms):
+        query_weights[boost_terms] += 2 * max(query_weights.max(), 1.0)
+
+    scores = bm25 @ query_weights
+
+    letters = np.array([len(_NON_LETTERS.sub("", passage)) for passage in passages], dtype=np.float32)
+    visible = np.array([max(len(_WHITESPACE.sub("", passage)), 1) for passage in passages], dtype=np.float32)
+    prose_penalty = np.clip((letters / visible - 0.5) / 0.3, 0.1, 1.0)
+
+    return scores * prose_penalty
+
+def select_passages(text, budget, query=""):
+    """
+    Return at most `budget` characters of `text`, made of the highest-scoring
+    passages kept in their original order.
+    """
+    if len(text) <= budget:
+        return text
+
+    passages = split_into_passages(text)
+    scores = score_passages(passages, query)
+
+    chosen = []
+    used = 0
+    for index in np.argsort(-scores, kind="stable"):
+        length = len(passages[index]) + 2
+        if used + length > budget:
+            continue
+        chosen.append(index)
+        used += length
+
+    if not chosen:
+        return text[:budget]
+
+    return "\n\n".join(passages[index] for index in sorted(chosen))
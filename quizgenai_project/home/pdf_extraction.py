@@ -0,0 +1,149 @@
+import math
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import fitz
+
+# MuPDF documents cannot be shared between threads, so parallel extraction
+# uses processes that each open the file themselves. Workers are spawned
+# rather than forked because the web process runs threads.
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def upload_path(uploaded_file):
+    """Filesystem path of an upload that already lives on disk, else None."""
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        return uploaded_file.temporary_file_path()
+    name = getattr(getattr(uploaded_file, 'file', uploaded_file), 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    return None
+
+def open_pdf(pdf_file):
+    """
+    Open an upload without copying it into a bytes object: from its path
+    when it is on disk (MuPDF then reads pages from the file as needed),
+    otherwise from a view of the in-memory buffer.
+    """
+    path = upload_path(pdf_file)
+    if path:
+        return fitz.open(path, filetype="pdf")
+
+    fh = getattr(pdf_file, 'file', pdf_file)
+    if hasattr(fh, 'getbuffer'):
+        return fitz.open(stream=fh.getbuffer(), filetype="pdf")
+    if hasattr(pdf_file, 'seek'):
+        pdf_file.seek(0)
+    return fitz.open(stream=pdf_file.read(), filetype="pdf")
+
+def iter_pdf_pages(pdf_document, start=0, stop=None):
+    """Yield the text of each page in turn, parsing a page only when it is reached."""
+    stop = pdf_document.page_count if stop is None else min(stop, pdf_document.page_count)
+    for page_number in range(start, stop):
+        yield pdf_document.load_page(page_number).get_text()
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _extract_page_range(path, start, stop):
+    """Runs in a worker process: the text of each of pages [start, stop) of the file at `path`."""
+    with fitz.open(path, filetype="pdf") as pdf_document:
+        return list(iter_pdf_pages(pdf_document, start, stop))
+
+def _truncate_pages(pages, max_chars):
+    """Cut the list of page texts so they add up to at most `max_chars` characters."""
+    if max_chars is None:
+        return pages
+    kept = []
+    remaining = max_chars
+    for page_text in pages:
+        if remaining <= 0:
+            break
+        kept.append(page_text[:remaining])
+        remaining -= len(page_text)
+    return kept
+
+def extract_pdf_pages_parallel(path, page_count, workers, max_chars=None, pages_per_task=None):
+    """
+    Extract the file at `path` with page ranges spread across a process pool,
+    reassembled in page order. Only a couple of ranges per worker are in
+    flight at once, so hitting `max_chars` leaves little wasted work.
+    """
+    if pages_per_task is None:
+        pages_per_task = max(4, math.ceil(page_count / (workers * 4)))
+    ranges = iter([(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)])
+
+    pool = _get_pool(workers)
+    in_flight = deque()
+    for start, stop in ranges:
+        in_flight.append(pool.submit(_extract_page_range, path, start, stop))
+        if len(in_flight) >= workers * 2:
+            break
+
+    pages = []
+    collected = 0
+    while in_flight:
+        range_pages = in_flight.popleft().result()
+        pages.extend(range_pages)
+        collected += sum(len(page_text) for page_text in range_pages)
+        if max_chars is not None and collected >= max_chars:
+            for future in in_flight:
+                future.cancel()
+            break
+        next_range = next(ranges, None)
+        if next_range is not None:
+            in_flight.append(pool.submit(_extract_page_range, path, *next_range))
+
+    return _truncate_pages(pages, max_chars)
+
+def extract_pdf_pages(pdf_file, max_chars=None, workers=0, parallel_min_pages=None):
+    """
+    Text of each page of the PDF, stopping as soon as `max_chars`
+    characters have been collected (the last page kept is cut short).
+    The rest of the file is never parsed.
+
+    Files on disk with at least `parallel_min_pages` pages are split across
+    `workers` processes; smaller files, in-memory uploads and pool failures
+    use the serial path.
+    """
+    pdf_document = open_pdf(pdf_file)
+    try:
+        path = upload_path(pdf_file)
+        if workers > 1 and path and parallel_min_pages is not None and pdf_document.page_count >= parallel_min_pages:
+            try:
+                return extract_pdf_pages_parallel(path, pdf_document.page_count, workers, max_chars=max_chars)
+            except Exception as pool_error:
+                print(f"Parallel PDF extraction failed, falling back to serial: {pool_error}")
+                _reset_pool()
+
+        pages = []
+        collected = 0
+        for page_text in iter_pdf_pages(pdf_document):
+            pages.append(page_text)
+            collected += len(page_text)
+            if max_chars is not None and collected >= max_chars:
+                break
+        return _truncate_pages(pages, max_chars)
+    finally:
+        pdf_document.close()
+
+def extract_pdf_text(pdf_file, max_chars=None, workers=0, parallel_min_pages=None):
+    """The text of extract_pdf_pages() in one string."""
+    return "".join(extract_pdf_pages(pdf_file, max_chars=max_chars, workers=workers, parallel_min_pages=parallel_min_pages))
@@ -0,0 +1,227 @@
+import io
+import posixpath
+import re
+import struct
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+# recVer/recInstance, recType, recLen
+_RECORD_HEADER = struct.Struct('<HHI')
+_HEADER_SIZE = _RECORD_HEADER.size
+_CONTAINER_VERSION = 0x0F
+_TEXT_CHARS_ATOM = 4000  # UTF-16LE text
+_TEXT_BYTES_ATOM = 4008  # 8-bit text
+_CHUNK_SIZE = 1 << 20
+
+_DRAWINGML = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+_PRESENTATIONML = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+_RELATIONSHIPS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PACKAGE_RELATIONSHIPS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_SLIDE_PART = re.compile(r'ppt/slides/slide(\d+)\.xml$')
+
+def _walk_records(view, runs):
+    """
+    Walk the records in `view`, appending the text of each text atom to
+    `runs`. Containers are descended into, other atoms skipped.
+
+    Returns (pos, needed): where the walk stopped and, if it stopped at a
+    text atom that runs past the end of `view`, how many bytes that atom
+    needs in total (else 0). `pos` may lie beyond the end of `view` when a
+    skipped atom does.
+    """
+    unpack_header = _RECORD_HEADER.unpack_from
+    size = len(view)
+    pos = 0
+    while pos + _HEADER_SIZE <= size:
+        ver_inst, rec_type, rec_len = unpack_header(view, pos)
+        end = pos + _HEADER_SIZE + rec_len
+        if rec_type == _TEXT_CHARS_ATOM or rec_type == _TEXT_BYTES_ATOM:
+            if end > size:
+                return pos, end - pos
+            try:
+                runs.append(str(view[pos + _HEADER_SIZE:end], 'utf-16le' if rec_type == _TEXT_CHARS_ATOM else 'latin-1'))
+            except UnicodeDecodeError:
+                pass
+            pos = end
+        elif ver_inst & 0x000F == _CONTAINER_VERSION:
+            pos += _HEADER_SIZE
+        else:
+            pos = end
+    return pos, 0
+
+def _skip(stream, count):
+    if stream.seekable():
+        stream.seek(count, 1)
+        return
+    while count > 0:
+        discarded = stream.read(min(count, _CHUNK_SIZE))
+        if not discarded:
+            return
+        count -= len(discarded)
+
+class OleStreamReader(io.RawIOBase):
+    """
+    One stream of an open olefile.OleFileIO, read straight from the file by
+    following the stream's chain of sectors in the FAT. olefile's own
+    openstream() reads the whole stream into a BytesIO first; this holds
+    no more than the caller asks for. Sectors that follow each other on
+    disk are read in one go.
+    """
+
+    def __init__(self, ole, entry):
+        self._fp = ole.fp
+        self._sector_size = ole.sectorsize
+        self._fat = ole.fat
+        self._sector = entry.isectStart
+        self._offset = 0  # into the current sector
+        self._remaining = entry.size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self._remaining)
+        if count <= 0:
+            return 0
+        if self._sector >= len(self._fat):
+            raise IOError("OLE stream ends before its recorded size")
+
+        last = self._sector
+        available = self._sector_size - self._offset
+        while available < count and self._fat[last] == last + 1:
+            last += 1
+            available += self._sector_size
+        count = min(count, available)
+
+        # Sector n starts after the header, which takes up one sector.
+        self._fp.seek((self._sector + 1) * self._sector_size + self._offset)
+        data = self._fp.read(count)
+        if len(data) < count:
+            raise IOError("OLE file is truncated")
+        buffer[:count] = data
+        self._remaining -= count
+
+        position = self._offset + count
+        for _ in range(position // self._sector_size):
+            self._sector = self._fat[self._sector]
+        self._offset = position % self._sector_size
+        return count
+
+def open_ole_stream(ole, name):
+    """
+    A top-level stream of an OLE file as a file object: an OleStreamReader
+    for regular streams, olefile's BytesIO for the small ones kept in the
+    mini stream (under 4 KB).
+    """
+    for entry in ole.root.kids:
+        if entry.name.lower() == name.lower() and entry.size >= ole.minisectorcutoff:
+            return OleStreamReader(ole, entry)
+    return ole.openstream(name)
+
+def extract_ppt_text_runs(stream, chunk_size=_CHUNK_SIZE):
+    """
+    Text runs of a 'PowerPoint Document' record stream, in order.
+
+    Streams that are already in memory (BytesIO) are walked in place through
+    a memoryview; getvalue() hands back the bytes the BytesIO was built from
+    without copying them. Anything else, such as open_ole_stream()'s readers,
+    is read in `chunk_size` windows, so only one window plus the largest
+    text atom is held at once.
+    """
+    runs = []
+    if isinstance(stream, io.BytesIO):
+        with memoryview(stream.getvalue()) as view:
+            _walk_records(view, runs)
+        return runs
+
+    buffer = bytearray()
+    needed = 0
+    while True:
+        chunk = stream.read(max(chunk_size, needed - len(buffer)))
+        if not chunk:
+            return runs
+        buffer += chunk
+        with memoryview(buffer) as view:
+            pos, needed = _walk_records(view, runs)
+        if pos > len(buffer):
+            _skip(stream, pos - len(buffer))
+            buffer.clear()
+        else:
+            del buffer[:pos]
+
+def _slide_parts(archive):
+    """Slide part names in presentation order, falling back to their numbering."""
+    names = set(archive.namelist())
+    try:
+        targets = {}
+        with archive.open('ppt/_rels/presentation.xml.rels') as rels:
+            for _, element in iterparse(rels):
+                if element.tag == _PACKAGE_RELATIONSHIPS + 'Relationship':
+                    targets[element.get('Id')] = posixpath.normpath(posixpath.join('ppt', element.get('Target')))
+        order = []
+        with archive.open('ppt/presentation.xml') as presentation:
+            for _, element in iterparse(presentation):
+                if element.tag == _PRESENTATIONML + 'sldId':
+                    order.append(targets[element.get(_RELATIONSHIPS + 'id')])
+        if order and all(name in names for name in order):
+            return order
+    except (KeyError, SyntaxError):
+        pass
+    slides = [name for name in names if _SLIDE_PART.match(name)]
+    return sorted(slides, key=lambda name: int(_SLIDE_PART.match(name).group(1)))
+
+def _notes_part(archive, slide_part):
+    rels_name = posixpath.join(posixpath.dirname(slide_part), '_rels', posixpath.basename(slide_part) + '.rels')
+    try:
+        with archive.open(rels_name) as rels:
+            for _, element in iterparse(rels):
+                if element.tag == _PACKAGE_RELATIONSHIPS + 'Relationship' and element.get('Type', '').endswith('/notesSlide'):
+                    return posixpath.normpath(posixpath.join(posixpath.dirname(slide_part), element.get('Target')))
+    except KeyError:
+        pass
+    return None
+
+def _iter_paragraphs(part):
+    """Text of each DrawingML paragraph in an XML part, streamed; line breaks become '\\v' as in python-pptx."""
+    pieces = []
+    for event, element in iterparse(part, events=('end',)):
+        tag = element.tag
+        if tag == _DRAWINGML + 't':
+            pieces.append(element.text or '')
+        elif tag == _DRAWINGML + 'br':
+            pieces.append('\v')
+        elif tag == _DRAWINGML + 'p':
+            yield ''.join(pieces)
+            pieces = []
+            element.clear()
+
+def _iter_slide_lines(pptx_file, include_notes):
+    if hasattr(pptx_file, 'seek'):
+        pptx_file.seek(0)
+    with zipfile.ZipFile(pptx_file) as archive:
+        slide_parts = _slide_parts(archive)
+        if not slide_parts:
+            raise ValueError("No slides found in the .pptx package.")
+        for slide_part in slide_parts:
+            with archive.open(slide_part) as part:
+                lines = list(_iter_paragraphs(part))
+            if include_notes:
+                notes_part = _notes_part(archive, slide_part)
+                if notes_part:
+                    with archive.open(notes_part) as part:
+                        lines.extend(_iter_paragraphs(part))
+            yield lines
+
+def extract_pptx_slides(pptx_file, include_notes=False):
+    """
+    Text of each slide of a .pptx read straight from the slide XML inside
+    the zip, without building python-pptx's object model or touching media
+    parts. One line per paragraph, slides in presentation order, each
+    optionally followed by its speaker notes. Text inside groups and tables
+    is included.
+    """
+    return ["\n".join(lines) for lines in _iter_slide_lines(pptx_file, include_notes)]
+
+def extract_pptx_text(pptx_file, include_notes=False):
+    """The text of extract_pptx_slides() in one string, one line per paragraph."""
+    return "\n".join(line for lines in _iter_slide_lines(pptx_file, include_notes) for line in lines)
@@ -0,0 +1,44 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+from .models import QuizAttempt, UserProgressStats
+
+def attempt_percentage(score, question_count):
+    return (score / question_count) * 100 if question_count > 0 else 0
+
+def record_attempt(quiz, user, score, user_answers):
+    """
+    Save an attempt and, for signed-in users, fold it into their
+    UserProgressStats in the same transaction. The totals are updated
+    with F() expressions, so concurrent attempts never lose an update.
+    """
+    with transaction.atomic():
+        attempt = QuizAttempt.objects.create(quiz=quiz, user=user, score=score, user_answers=user_answers)
+        if user is None:
+            return attempt
+
+        percentage = attempt_percentage(score, quiz.question_count)
+        UserProgressStats.objects.get_or_create(user=user)
+        UserProgressStats.objects.filter(user=user).update(
+            total_attempts=F('total_attempts') + 1,
+            total_correct=F('total_correct') + score,
+            total_questions=F('total_questions') + quiz.question_count,
+            percentage_sum=F('percentage_sum') + percentage,
+            best_percentage=Greatest(F('best_percentage'), percentage),
+            perfect_count=F('perfect_count') + (1 if percentage == 100 and quiz.question_count > 0 else 0),
+            updated_at=timezone.now(),
+        )
+    return attempt
+
+def daily_results(user, days):
+    """Correct and total answers per day over the last `days` days, summed by the database, oldest first."""
+    since = timezone.now() - timedelta(days=days)
+    return list(
+        QuizAttempt.objects.filter(user=user, timestamp__gte=since)
+        .annotate(day=TruncDate('timestamp'))
+        .values('day')
+        .annotate(correct=Sum('score'), questions=Sum('quiz__question_count'))
+        .order_by('day')
+    )
@@ -0,0 +1,170 @@
+import json
+import re
+
+# Characters that change the parser state; everything else is skipped in bulk.
+_STRUCTURAL_CHARS = re.compile(r'[\[\]{}"\\]')
+
+class IncrementalArrayParser:
+    """
+    Parses a JSON array that arrives in pieces (e.g. a streamed model response)
+    and hands back each top-level element as soon as its closing bracket is seen.
+
+    Anything before the opening '[' (such as a ```json fence) is ignored, and
+    elements that fail to decode are counted in `skipped` instead of raising.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.skipped = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer = []
+
+    def feed(self, chunk):
+        """Consume the next piece of text and return the elements it completed."""
+        completed = []
+        # Where the element currently being read starts within this chunk.
+        element_start = 0 if self._depth else None
+        pos = 0
+
+        while pos < len(chunk) and not self.finished:
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+
+            match = _STRUCTURAL_CHARS.search(chunk, pos)
+            if match is None:
+                break
+            char = match.group()
+            index = match.start()
+            pos = index + 1
+
+            if self._in_string:
+                if char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if not self.started:
+                if char == '[':
+                    self.started = True
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0:
+                    element_start = index
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    # The closing bracket of the array itself.
+                    if char == ']':
+                        self.finished = True
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    self._buffer.append(chunk[element_start:pos])
+                    raw_element = ''.join(self._buffer)
+                    self._buffer = []
+                    element_start = None
+                    try:
+                        completed.append(json.loads(raw_element))
+                    except json.JSONDecodeError:
+                        self.skipped += 1
+
+        if self._depth and element_start is not None:
+            self._buffer.append(chunk[element_start:])
+
+        return completed
+
+def expand_question(element):
+    """
+    Turn a compact positional question [question, options, correctAnswer, explanation]
+    into the quiz_data dict shape. Dicts (the verbose format) pass through unchanged.
+    """
+    if not isinstance(element, list) or len(element) not in (3, 4):
+        return element
+    question = {
+        "question": element[0],
+        "options": element[1],
+        "correctAnswer": element[2],
+    }
+    if len(element) == 4:
+        question["explanation"] = element[3]
+    return question
+
+def validate_question(question, position):
+    """
+    Check one generated question and fill in optional fields.
+    `position` is the 1-based number used in error messages.
+    """
+    if not isinstance(question, dict):
+        raise Exception(f"Question {position} is not a valid object.")
+    if "question" not in question or "options" not in question or "correctAnswer" not in question:
+        raise Exception(f"Question {position} is missing required fields (question, options, correctAnswer).")
+    if not isinstance(question.get("options"), list) or len(question.get("options", [])) != 4:
+        raise Exception(f"Question {position} does not have exactly 4 options.")
+    # Explanation is optional for backward compatibility, but we expect it for new quizzes
+    if "explanation" not in question:
+        question["explanation"] = "No explanation provided."
+    return question
+
+def parse_quiz_response(response_text):
+    """Strictly parse a complete model response into a list of validated questions."""
+    response_text = response_text.strip()
+
+    # Robust JSON extraction: find the first '[' and the last ']'
+    start_idx = response_text.find("[")
+    end_idx = response_text.rfind("]")
+
+    if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
+        response_text = response_text[start_idx:end_idx+1]
+    else:
+        # Fallback: basic markdown cleanup if brackets aren't found correctly
+        if response_text.startswith("```json"):
+            response_text = response_text[7:]
+        elif response_text.startswith("```"):
+            response_text = response_text[3:]
+        if response_text.endswith("```"):
+            response_text = response_text[:-3]
+        response_text = response_text.strip()
+
+    quiz_data = json.loads(response_text)
+
+    if not isinstance(quiz_data, list):
+        raise Exception("The AI response is not a valid array of questions.")
+
+    if len(quiz_data) == 0:
+        raise Exception("The AI generated no questions. Please try again with a different PDF or fewer questions.")
+
+    quiz_data = [expand_question(question) for question in quiz_data]
+    for i, question in enumerate(quiz_data):
+        validate_question(question, i + 1)
+
+    return quiz_data
+
+def salvage_questions(response_text):
+    """
+    Recover every complete, valid question from a malformed or truncated
+    response. Broken or cut-off objects are dropped.
+    """
+    first_object = response_text.find("{")
+    first_array = response_text.find("[")
+    if first_object != -1 and (first_array == -1 or first_object < first_array):
+        # Objects without the surrounding array; the first '[' is inside an object.
+        response_text = "[" + response_text[first_object:]
+
+    elements = IncrementalArrayParser().feed(response_text)
+
+    quiz_data = []
+    for element in elements:
+        try:
+            quiz_data.append(validate_question(expand_question(element), len(quiz_data) + 1))
+        except Exception:
+            continue
+    return quiz_data
@@ -1,54 +1,304 @@
-import fitz
-import google.generativeai as genai
 import json
-import requests
 import olefile
-import struct
 import re
 import os
+import copy
+import hashlib
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
 from bs4 import BeautifulSoup
 from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
 from urllib.parse import urlparse, parse_qs
 from pptx import Presentation
+from . import coalescing, documents, llm, telemetry, uploads, url_fetching
+from .budget import estimate_tokens, max_chunked_source_chars, max_source_chars, plan_prompt_budget, record_prompt_budget
+from .models import GenerationJob, GenerationTiming, QuestionBank, QuestionBankDraw, QuizCacheEntry
+from .normalization import normalize_pages
+from .passages import select_passages, split_into_passages
+from .html_extraction import extract_html_text
+from .pdf_extraction import extract_pdf_pages
+from .ppt_extraction import extract_ppt_text_runs, extract_pptx_slides, open_ole_stream
+from .quiz_parsing import IncrementalArrayParser, expand_question, parse_quiz_response, salvage_questions, validate_question
 
-try:
-    genai.configure(api_key=settings.GEMINI_API_KEY)
+def extract_html_text_with_soup(content, encoding=None):
+    soup = BeautifulSoup(content, 'html.parser', from_encoding=encoding)
+    
+    # Remove script and style elements
+    for script in soup(["script", "style", "nav", "footer", "header", "aside"]):
+        script.decompose()
+        
+    return soup.get_text(separator=' ', strip=True)
+
+def _html_to_text(chunks, max_chars=None, encoding=None):
+    received = []
 
-    model = genai.GenerativeModel('gemini-2.5-flash')
-except Exception as e:
-    print(f"Error configuring Gemini API in services.py: {e}")
-    model = None
+    def remember(chunks):
+        for chunk in chunks:
+            received.append(chunk)
+            yield chunk
 
-def extract_text_from_url(url):
+    chunks = iter(chunks)
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style", "nav", "footer", "header", "aside"]):
-            script.decompose()
-            
-        text = soup.get_text(separator=' ', strip=True)
-        return text
+        return extract_html_text(remember(chunks), max_chars=max_chars, encoding=encoding)
+    except Exception as parse_error:
+        # Pages the streaming parser chokes on still go through BeautifulSoup.
+        print(f"Streaming HTML extraction failed, falling back to BeautifulSoup: {parse_error}")
+        text = extract_html_text_with_soup(b"".join(received) + b"".join(chunks), encoding=encoding)
+        return text if max_chars is None else text[:max_chars]
+
+def extract_text_from_url(url, max_chars=None):
+    try:
+        return url_fetching.fetch_text(url, _html_to_text, max_chars=max_chars)
     except Exception as e:
         print(f"Error extracting text from URL: {e}")
         raise Exception(f"Could not extract text from the URL: {e}")
 
-def generate_quiz_from_text(text, num_questions, custom_instructions):
-    if model is None:
-        raise Exception("Gemini API model is not configured.")
+def _normalize_for_cache(value):
+    return re.sub(r'\s+', ' ', value or '').strip()
+
+def quiz_cache_key(text, num_questions, custom_instructions):
+    """Hash of the normalized source text plus the options that shape the quiz."""
+    digest = hashlib.sha256()
+    digest.update(_normalize_for_cache(text).encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(str(int(num_questions)).encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(_normalize_for_cache(custom_instructions).encode('utf-8'))
+    return digest.hexdigest()
 
+def get_quiz_cache_stats(since=None):
+    """
+    How well the quiz cache is doing, from the database so every worker's
+    traffic counts: stored entries and the hits they have served, and the
+    share of generations (since `since`, if given) answered from the cache.
+    """
+    entries = QuizCacheEntry.objects.aggregate(entries=Count('id'), stored_hits=Sum('hits'))
+    timings = GenerationTiming.objects.filter(succeeded=True)
+    if since is not None:
+        timings = timings.filter(created_at__gte=since)
+    generations = timings.aggregate(generations=Count('id'), cached=Count('id', filter=Q(cached=True)))
+    return {
+        'entries': entries['entries'],
+        'stored_hits': entries['stored_hits'] or 0,
+        'generations': generations['generations'],
+        'cached_generations': generations['cached'],
+        'hit_rate': round(generations['cached'] / generations['generations'], 3) if generations['generations'] else 0.0,
+    }
+
+def get_cached_quiz(cache_key):
+    if not settings.QUIZ_CACHE_ENABLED:
+        return None
+
+    try:
+        entry = QuizCacheEntry.objects.filter(key=cache_key).first()
+        if entry is None:
+            return None
+
+        if entry.created_at < timezone.now() - timedelta(seconds=settings.QUIZ_CACHE_TTL):
+            entry.delete()
+            return None
+
+        QuizCacheEntry.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_used_at=timezone.now())
+        return entry.quiz_data
+    except Exception as cache_error:
+        # The cache is an optimization; never fail a generation because of it.
+        print(f"Error reading quiz cache: {cache_error}")
+        return None
+
+def store_cached_quiz(cache_key, quiz_data):
+    if not settings.QUIZ_CACHE_ENABLED:
+        return
+
+    try:
+        try:
+            QuizCacheEntry.objects.update_or_create(key=cache_key, defaults={
+                'quiz_data': quiz_data,
+                'created_at': timezone.now(),
+                'last_used_at': timezone.now(),
+            })
+        except IntegrityError:
+            # Another worker stored the same quiz at the same time.
+            pass
+        evict_quiz_cache()
+    except Exception as cache_error:
+        print(f"Error writing quiz cache: {cache_error}")
+
+def evict_quiz_cache():
+    """Drop expired entries, then the least recently used ones above the size cap."""
+    expired_before = timezone.now() - timedelta(seconds=settings.QUIZ_CACHE_TTL)
+    QuizCacheEntry.objects.filter(created_at__lt=expired_before).delete()
+
+    overflow = QuizCacheEntry.objects.count() - settings.QUIZ_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        stale_ids = list(QuizCacheEntry.objects.order_by('last_used_at').values_list('id', flat=True)[:overflow])
+        QuizCacheEntry.objects.filter(id__in=stale_ids).delete()
+
+def generate_quiz_from_text(text, num_questions, custom_instructions, owner_key=None, timer=None):
     if not text.strip():
         raise Exception("Could not extract any meaningful text.")
+    if timer is not None:
+        timer.text_chars = len(text)
 
-    prompt_base = f"""
-    Based on the following text, create a multiple-choice quiz with {num_questions} questions.
-    The response MUST be a valid JSON array and nothing else. Do not include any text, code block markers like ```json, or any other formatting before or after the JSON array.
+    if settings.QUESTION_BANK_ENABLED and owner_key:
+        return generate_quiz_from_bank(text, num_questions, custom_instructions, owner_key)
+
+    cache_key = quiz_cache_key(text, num_questions, custom_instructions)
+    cached_quiz = get_cached_quiz(cache_key)
+    if cached_quiz is not None:
+        if timer is not None:
+            timer.cached = True
+        return cached_quiz
+
+    # Identical requests already in flight (e.g. a class generating from the
+    # same shared document) wait for that result instead of calling the model.
+    return coalescing.run_single_flight(
+        cache_key,
+        lambda: _generate_and_cache(text, num_questions, custom_instructions, cache_key),
+        lambda: get_cached_quiz(cache_key),
+    )
+
+def _generate_and_cache(text, num_questions, custom_instructions, cache_key):
+    if _use_chunked_generation(text, num_questions):
+        quiz_data = _generate_quiz_chunked(text, num_questions, custom_instructions)
+    else:
+        quiz_data = _generate_quiz_with_model(text, num_questions, custom_instructions)
+    store_cached_quiz(cache_key, quiz_data)
+    return quiz_data
+
+def _use_chunked_generation(text, num_questions):
+    return settings.QUIZ_CHUNKED_GENERATION and _section_count(text, num_questions) > 1
+
+def _section_count(text, num_questions):
+    """
+    Prompts needed to give every question its QUIZ_SOURCE_TOKENS_PER_QUESTION
+    of source text. One prompt does unless the target latency or the model's
+    context holds the planner below that, so most quizzes stay at one call.
+    """
+    num_questions = int(num_questions)
+    budget = plan_prompt_budget(text, num_questions, compact=_use_compact_format())
+    if not budget.truncated or budget.limited_by == 'questions':
+        return 1
+    wanted_tokens = min(budget.document_tokens, num_questions * settings.QUIZ_SOURCE_TOKENS_PER_QUESTION)
+    return max(1, min(
+        math.ceil(wanted_tokens / max(budget.source_tokens, 1)),
+        num_questions,
+        settings.QUIZ_CHUNK_MAX_SECTIONS,
+    ))
+
+def split_text_into_sections(text, num_sections):
+    """
+    Split text into roughly equal sections, preferring to cut at paragraph
+    breaks, then line breaks, then spaces near each boundary.
+    """
+    target = math.ceil(len(text) / num_sections)
+    sections = []
+    start = 0
+    while start < len(text):
+        end = start + target
+        if end >= len(text) or len(sections) == num_sections - 1:
+            sections.append(text[start:])
+            break
+
+        # Only accept a break point in the second half of the section.
+        floor = start + target // 2
+        cut = -1
+        for separator in ("\n\n", "\n", " "):
+            cut = text.rfind(separator, floor, end)
+            if cut != -1:
+                break
+        if cut <= start:
+            cut = end
 
+        sections.append(text[start:cut])
+        start = cut
+    return [section for section in sections if section.strip()]
+
+def allocate_questions(section_lengths, num_questions):
+    """Share questions across sections in proportion to their length (largest remainder)."""
+    total_length = sum(section_lengths)
+    shares = [num_questions * length / total_length for length in section_lengths]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(len(shares)), key=lambda i: shares[i] - counts[i], reverse=True)
+    for i in by_remainder[:num_questions - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+def _question_fingerprint(question):
+    return re.sub(r'[^a-z0-9]+', ' ', str(question.get("question", "")).lower()).strip()
+
+def merge_questions(question_lists, limit):
+    """Concatenate per-section questions, dropping duplicates, up to `limit` questions."""
+    merged = []
+    seen = set()
+    for questions in question_lists:
+        for question in questions:
+            fingerprint = _question_fingerprint(question)
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
+            merged.append(question)
+            if len(merged) == limit:
+                return merged
+    return merged
+
+def _plan_sections(text, num_questions):
+    sections = split_text_into_sections(text, _section_count(text, num_questions))
+    counts = allocate_questions([len(section) for section in sections], num_questions)
+    return [(section, count) for section, count in zip(sections, counts) if count > 0]
+
+def _generate_section_quiz(section, count, custom_instructions):
+    try:
+        return _generate_quiz_with_model(section, count, custom_instructions)
+    finally:
+        # Section threads touch the DB (API key accounting); don't leak their connections.
+        connection.close()
+
+def _iter_section_quizzes(text, num_questions, custom_instructions):
+    """
+    Run one generation call per section on a bounded thread pool and yield
+    (section_index, questions) as each call finishes. Failed sections are
+    skipped unless every section fails.
+    """
+    plan = _plan_sections(text, num_questions)
+    print(f"Generating {num_questions} questions across {len(plan)} sections of {len(text)} chars")
+
+    errors = []
+    succeeded = 0
+    with ThreadPoolExecutor(max_workers=settings.QUIZ_CHUNK_WORKERS, thread_name_prefix='quizgen-section') as executor:
+        futures = {
+            executor.submit(_generate_section_quiz, section, count, custom_instructions): index
+            for index, (section, count) in enumerate(plan)
+        }
+        for future in as_completed(futures):
+            try:
+                questions = future.result()
+            except Exception as section_error:
+                print(f"Error generating questions for section {futures[future] + 1}: {section_error}")
+                errors.append(section_error)
+                continue
+            succeeded += 1
+            yield futures[future], questions
+
+    if not succeeded and errors:
+        raise errors[0]
+
+def _generate_quiz_chunked(text, num_questions, custom_instructions):
+    num_questions = int(num_questions)
+    results = dict(_iter_section_quizzes(text, num_questions, custom_instructions))
+    quiz_data = merge_questions([results[index] for index in sorted(results)], num_questions)
+    # Sections often ask the same thing; replace the duplicates that were dropped.
+    quiz_data = _top_up_questions(quiz_data, text, num_questions, custom_instructions)
+    if not quiz_data:
+        raise Exception("The AI generated no questions. Please try again with a different PDF or fewer questions.")
+    return quiz_data
+
+_VERBOSE_FORMAT_INSTRUCTIONS = """
     Each object in the array must have these exact keys:
     1. "question": A string for the question text.
     2. "options": An array of 4 strings representing the possible answers.
@@ -57,8 +307,39 @@ def generate_quiz_from_text(text, num_questions, custom_instructions):
 
     Example format:
     [
-      {{"question": "What is the primary topic?", "options": ["A", "B", "C", "D"], "correctAnswer": 2, "explanation": "Option C is correct because..."}}
+      {"question": "What is the primary topic?", "options": ["A", "B", "C", "D"], "correctAnswer": 2, "explanation": "Option C is correct because..."}
+    ]
+"""
+
+# Positional arrays instead of keyed objects: same content, fewer output tokens.
+_COMPACT_FORMAT_INSTRUCTIONS = """
+    Each element of the array must itself be an array of exactly 4 items, in this order:
+    1. The question text (a string).
+    2. An array of 4 strings representing the possible answers.
+    3. The 0-based index of the correct answer within that array.
+    4. A short explanation (1-2 sentences) of why the correct answer is correct.
+
+    Example format:
+    [
+      ["What is the primary topic?", ["A", "B", "C", "D"], 2, "Option C is correct because..."]
     ]
+"""
+
+def _use_compact_format():
+    return settings.QUIZ_RESPONSE_FORMAT == 'compact'
+
+def build_quiz_prompt(text, num_questions, custom_instructions, compact=None):
+    return plan_quiz_prompt(text, num_questions, custom_instructions, compact)[0]
+
+def plan_quiz_prompt(text, num_questions, custom_instructions, compact=None):
+    """Build the prompt, returning it with the PromptBudget that sized its document section."""
+    if compact is None:
+        compact = _use_compact_format()
+
+    prompt_base = f"""
+    Based on the following text, create a multiple-choice quiz with {num_questions} questions.
+    The response MUST be a valid JSON array and nothing else. Do not include any text, code block markers like ```json, or any other formatting before or after the JSON array.
+    """ + (_COMPACT_FORMAT_INSTRUCTIONS if compact else _VERBOSE_FORMAT_INSTRUCTIONS) + """
     IMPORTANT: You must generate questions that test the conceptual and scientific understanding of the topics presented in the text.
     GOOD QUESTIONS are about: chemical principles, scientific concepts, reactions, definitions, properties, and applications (e.g., "What is a thermodynamic function?", "What is the principle of potentiometry?").
     BAD QUESTIONS (DO NOT ASK): Trivial questions about the document's structure, layout, or metadata. This includes questions about page numbers, section headings, experiment numbers (e.g., "What is Experiment 1?"), assessment procedures, rubrics, or lists of content.
@@ -69,10 +350,14 @@ def generate_quiz_from_text(text, num_questions, custom_instructions):
     else:
         prompt_instructions = ""
 
-    # Reduced character limit to speed up processing (approx 10-15k tokens)
-    max_chars = 50000 
-    if len(text) > max_chars:
-        text = text[:max_chars] + "...(truncated)"
+    budget = plan_prompt_budget(text, num_questions, prompt_base + prompt_instructions, compact=compact)
+    if budget.truncated:
+        if settings.QUIZ_PASSAGE_SELECTION:
+            # Keep the passages most representative of the document rather than
+            # the first pages (title page, table of contents, syllabus).
+            text = select_passages(text, budget.source_chars, custom_instructions or "")
+        else:
+            text = text[:budget.source_chars] + "...(truncated)"
 
     prompt_text_section = f"""
     Here is the text to analyze:
@@ -81,76 +366,403 @@ def generate_quiz_from_text(text, num_questions, custom_instructions):
     ---
     """
 
-    final_prompt = prompt_base + prompt_instructions + prompt_text_section
+    return prompt_base + prompt_instructions + prompt_text_section, budget
+
+def _get_configured_backend():
+    backend = llm.get_backend()
+    if backend is None:
+        raise Exception("Gemini API model is not configured.")
+    return backend
+
+def _generate_quiz_with_model(text, num_questions, custom_instructions, allow_top_up=True):
+    backend = _get_configured_backend()
 
+    compact = _use_compact_format()
+    final_prompt, budget = plan_quiz_prompt(text, num_questions, custom_instructions, compact=compact)
+
+    started = time.monotonic()
     try:
-        response = model.generate_content(final_prompt)
+        response = backend.generate(final_prompt, num_questions=num_questions, compact=compact)
     except Exception as api_error:
         print(f"Error calling Gemini API: {api_error}")
         raise Exception(f"Failed to communicate with the AI model: {api_error}")
+    record_prompt_budget(budget, response.input_tokens, response.output_tokens, time.monotonic() - started)
+
+    if not response.text:
+        print(f"Gemini Response Feedback: {response.feedback}")
+        raise Exception("The AI returned an empty response. This may be due to safety filters or the input content.")
 
     try:
-        if not response.text:
-            print(f"Gemini Response Feedback: {response.prompt_feedback}")
-            raise Exception("The AI returned an empty response. This may be due to safety filters or the input content.")
+        quiz_data = parse_quiz_response(response.text)
+    except Exception as parse_error:
+        if isinstance(parse_error, json.JSONDecodeError):
+            print(f"Failed to decode JSON. Raw response: {response.text}")
+        else:
+            print(f"Error processing response: {parse_error}")
 
-        response_text = response.text.strip()
-        
-        # Robust JSON extraction: find the first '[' and the last ']'
-        start_idx = response_text.find("[")
-        end_idx = response_text.rfind("]")
+        # Keep every complete, valid question and only ask for the rest again.
+        quiz_data = salvage_questions(response.text)
+        print(f"Salvaged {len(quiz_data)} of {num_questions} questions from the response")
+        if allow_top_up:
+            quiz_data = _top_up_questions(quiz_data, text, num_questions, custom_instructions)
 
-        if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-            response_text = response_text[start_idx:end_idx+1]
-        else:
-            # Fallback: basic markdown cleanup if brackets aren't found correctly
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            elif response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
-
-        quiz_data = json.loads(response_text)
-        
-        if not isinstance(quiz_data, list):
-            raise Exception("The AI response is not a valid array of questions.")
-        
-        if len(quiz_data) == 0:
-            raise Exception("The AI generated no questions. Please try again with a different PDF or fewer questions.")
-        
-        for i, question in enumerate(quiz_data):
-            if not isinstance(question, dict):
-                raise Exception(f"Question {i+1} is not a valid object.")
-            if "question" not in question or "options" not in question or "correctAnswer" not in question:
-                raise Exception(f"Question {i+1} is missing required fields (question, options, correctAnswer).")
-            if not isinstance(question.get("options"), list) or len(question.get("options", [])) != 4:
-                raise Exception(f"Question {i+1} does not have exactly 4 options.")
-            # Explanation is optional for backward compatibility, but we expect it for new quizzes
-            if "explanation" not in question:
-                question["explanation"] = "No explanation provided."
-
-    except json.JSONDecodeError as json_err:
-        print(f"Failed to decode JSON. Raw response: {response.text}")
-        raise Exception("The AI returned a malformed response. This sometimes happens with very large question counts. Try reducing the number of questions (max 25 recommended) or try again.")
-    except Exception as parse_error:
-        print(f"Error processing response: {parse_error}")
-        if "JSON" not in str(parse_error):
-            raise parse_error
-        raise Exception("An error occurred while processing the AI response. Please try again with fewer questions.")
+        if not quiz_data:
+            if isinstance(parse_error, json.JSONDecodeError):
+                raise Exception("The AI returned a malformed response. This sometimes happens with very large question counts. Try reducing the number of questions (max 25 recommended) or try again.")
+            if "JSON" not in str(parse_error):
+                raise parse_error
+            raise Exception("An error occurred while processing the AI response. Please try again with fewer questions.")
 
     return quiz_data
 
-def generate_quiz_from_pdf(pdf_file, num_questions, custom_instructions):
+def _top_up_questions(quiz_data, text, num_questions, custom_instructions):
+    """Make one follow-up call for the questions still missing and merge them in."""
+    missing = int(num_questions) - len(quiz_data)
+    if missing <= 0:
+        return quiz_data
+
+    instructions = (custom_instructions or "").strip()
+    if quiz_data:
+        existing = "\n".join(f"- {question['question']}" for question in quiz_data)
+        instructions += f"\nDo not repeat any of these questions, which have already been asked:\n{existing}"
+
     try:
-        pdf_document = fitz.open(stream=pdf_file.read(), filetype="pdf")
-        pdf_text = "".join(page.get_text() for page in pdf_document)
+        extra = _generate_quiz_with_model(text, missing, instructions, allow_top_up=False)
+    except Exception as top_up_error:
+        print(f"Error topping up {missing} missing questions: {top_up_error}")
+        return quiz_data
+
+    return merge_questions([quiz_data, extra], int(num_questions))
+
+def stream_quiz_from_text(text, num_questions, custom_instructions, owner_key=None, timer=None):
+    """
+    Like generate_quiz_from_text, but yields each validated question as soon as
+    the model has finished writing it. The complete quiz is cached at the end.
+    """
+    if not text.strip():
+        raise Exception("Could not extract any meaningful text.")
+    if timer is not None:
+        timer.text_chars = len(text)
+
+    if settings.QUESTION_BANK_ENABLED and owner_key:
+        yield from generate_quiz_from_bank(text, num_questions, custom_instructions, owner_key)
+        return
+
+    cache_key = quiz_cache_key(text, num_questions, custom_instructions)
+    cached_quiz = get_cached_quiz(cache_key)
+    if cached_quiz is not None:
+        if timer is not None:
+            timer.cached = True
+        yield from cached_quiz
+        return
+
+    yield from coalescing.run_single_flight_stream(
+        cache_key,
+        lambda: _stream_and_cache(text, num_questions, custom_instructions, cache_key),
+        lambda: get_cached_quiz(cache_key),
+    )
+
+def _stream_and_cache(text, num_questions, custom_instructions, cache_key):
+    if _use_chunked_generation(text, num_questions):
+        # Sections finish independently; pass each one's questions on as it lands.
+        quiz_data = []
+        for _, questions in _iter_section_quizzes(text, int(num_questions), custom_instructions):
+            for question in merge_questions([quiz_data, questions], int(num_questions))[len(quiz_data):]:
+                quiz_data.append(question)
+                yield question
+        # Sections often ask the same thing; replace the duplicates that were dropped.
+        for question in _top_up_questions(quiz_data, text, num_questions, custom_instructions)[len(quiz_data):]:
+            quiz_data.append(question)
+            yield question
+        if not quiz_data:
+            raise Exception("The AI generated no questions. Please try again with a different PDF or fewer questions.")
+        store_cached_quiz(cache_key, quiz_data)
+        return
+
+    backend = _get_configured_backend()
+
+    compact = _use_compact_format()
+    final_prompt, budget = plan_quiz_prompt(text, num_questions, custom_instructions, compact=compact)
+
+    parser = IncrementalArrayParser()
+    quiz_data = []
+    streamed_tokens = 0
+    dropped = 0
+    interrupted = False
+    try:
+        started = time.monotonic()
+        for chunk in backend.stream(final_prompt, num_questions=num_questions, compact=compact):
+            streamed_tokens += estimate_tokens(chunk)
+            for question in parser.feed(chunk):
+                try:
+                    question = validate_question(expand_question(question), len(quiz_data) + 1)
+                except Exception as question_error:
+                    # Drop the broken question but keep streaming the rest.
+                    print(f"Skipping streamed question: {question_error}")
+                    dropped += 1
+                    continue
+                quiz_data.append(question)
+                yield question
+            if parser.finished:
+                break
+    except Exception as api_error:
+        print(f"Error streaming Gemini response: {api_error}")
+        if not quiz_data:
+            raise Exception(f"Failed to communicate with the AI model: {api_error}")
+        interrupted = True
+    # Streaming responses carry no usage data, so the output is estimated.
+    record_prompt_budget(budget, output_tokens=streamed_tokens, duration=time.monotonic() - started)
+
+    if not quiz_data:
+        raise Exception("The AI generated no questions. Please try again with a different PDF or fewer questions.")
+
+    if len(quiz_data) < int(num_questions) and (interrupted or dropped or parser.skipped or not parser.finished):
+        # The stream broke off or had unusable questions: fetch only the missing ones.
+        topped_up = _top_up_questions(quiz_data, text, num_questions, custom_instructions)
+        for question in topped_up[len(quiz_data):]:
+            yield question
+        quiz_data = topped_up
+        interrupted = len(quiz_data) < int(num_questions)
+
+    # Keep cut-off streams out of the cache so the next request gets a full quiz.
+    if not interrupted:
+        store_cached_quiz(cache_key, quiz_data)
+
+def question_bank_key(text, custom_instructions):
+    """Identifies a document's bank; unlike the quiz cache key it ignores the question count."""
+    digest = hashlib.sha256()
+    digest.update(b'bank\x00')
+    digest.update(_normalize_for_cache(text).encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(_normalize_for_cache(custom_instructions).encode('utf-8'))
+    return digest.hexdigest()
+
+def _unseen_count(bank_key, owner_key):
+    bank = QuestionBank.objects.filter(key=bank_key).first()
+    draw = QuestionBankDraw.objects.filter(bank=bank, owner_key=owner_key).first() if bank else None
+    if bank is None:
+        return 0
+    return len(bank.questions) - (len(draw.served) if draw else 0)
+
+def _generate_bank_batch(text, count, custom_instructions):
+    try:
+        if _use_chunked_generation(text, count):
+            return _generate_quiz_chunked(text, count, custom_instructions)
+        return _generate_quiz_with_model(text, count, custom_instructions)
+    finally:
+        connection.close()
+
+def _avoid_repeats(custom_instructions, questions):
+    instructions = (custom_instructions or "").strip()
+    if questions:
+        existing = "\n".join(f"- {question['question']}" for question in questions[-50:])
+        instructions += f"\nDo not repeat any of these questions, which have already been asked:\n{existing}"
+    return instructions
+
+def _bank_sections(text, num_sections):
+    """
+    Deal the document's passages out round-robin into at most `num_sections`
+    disjoint sections, so parallel batches each see different material from
+    across the whole document.
+    """
+    passages = split_into_passages(text) or [text]
+    num_sections = max(1, min(num_sections, len(passages)))
+    return ["\n\n".join(passages[i::num_sections]) for i in range(num_sections)]
+
+def _generate_bank_batches(section, counts, custom_instructions, asked):
+    """
+    Generate the batches for one section one after another, each told the
+    questions asked so far. Returns (questions, errors).
+    """
+    questions = []
+    errors = []
+    for count in counts:
+        try:
+            questions += _generate_bank_batch(section, count, _avoid_repeats(custom_instructions, asked + questions))
+        except Exception as batch_error:
+            print(f"Error generating question bank batch: {batch_error}")
+            errors.append(batch_error)
+    return questions, errors
+
+def _refill_question_bank(bank_key, text, custom_instructions, needed):
+    """
+    Generate at least `needed` new questions, topping the bank up to
+    QUESTION_BANK_SIZE, in batches of QUESTION_BANK_BATCH_SIZE. Each batch
+    that runs in parallel gets its own section of the document; when the
+    document has too few passages for that, the batches sharing a section
+    run in turn so each can exclude the questions before it.
+    """
+    bank = QuestionBank.objects.get(key=bank_key)
+    target = max(needed, settings.QUESTION_BANK_SIZE - len(bank.questions))
+    batches = []
+    while target > 0:
+        batches.append(min(target, settings.QUESTION_BANK_BATCH_SIZE))
+        target -= batches[-1]
+
+    sections = _bank_sections(text, len(batches))
+    plan = [(section, batches[i::len(sections)]) for i, section in enumerate(sections)]
+
+    print(f"Refilling question bank {bank_key[:12]} with {sum(batches)} questions in {len(batches)} batches over {len(sections)} sections")
+    results = []
+    errors = []
+    with ThreadPoolExecutor(max_workers=settings.QUIZ_CHUNK_WORKERS, thread_name_prefix='quizgen-bank') as executor:
+        futures = [
+            executor.submit(_generate_bank_batches, section, counts, custom_instructions, bank.questions)
+            for section, counts in plan
+        ]
+        for future in futures:
+            questions, section_errors = future.result()
+            if questions:
+                results.append(questions)
+            errors += section_errors
+    if not results and errors:
+        raise errors[0]
+
+    with transaction.atomic():
+        bank = QuestionBank.objects.select_for_update().get(key=bank_key)
+        seen = {_question_fingerprint(question) for question in bank.questions}
+        fresh = [question for question in merge_questions(results, sum(batches)) if _question_fingerprint(question) not in seen]
+        bank.questions = bank.questions + fresh
+        bank.save(update_fields=['questions', 'updated_at'])
+    return True
+
+def generate_quiz_from_bank(text, num_questions, custom_instructions, owner_key):
+    """
+    Serve a quiz by sampling the document's question bank, avoiding questions
+    this owner has already been given. The model is only called when fewer
+    unseen questions are left than requested.
+    """
+    num_questions = int(num_questions)
+    bank_key = question_bank_key(text, custom_instructions)
+    try:
+        bank, _ = QuestionBank.objects.get_or_create(key=bank_key)
+    except IntegrityError:
+        bank = QuestionBank.objects.get(key=bank_key)
+    try:
+        draw, _ = QuestionBankDraw.objects.get_or_create(bank=bank, owner_key=owner_key)
+    except IntegrityError:
+        draw = QuestionBankDraw.objects.get(bank=bank, owner_key=owner_key)
+
+    if len(bank.questions) - len(draw.served) < num_questions:
+        needed = num_questions - (len(bank.questions) - len(draw.served))
+        coalescing.run_single_flight(
+            bank_key,
+            lambda: _refill_question_bank(bank_key, text, custom_instructions, needed),
+            lambda: True if _unseen_count(bank_key, owner_key) >= num_questions else None,
+        )
+
+    with transaction.atomic():
+        draw = QuestionBankDraw.objects.select_for_update().get(pk=draw.pk)
+        bank = QuestionBank.objects.get(pk=bank.pk)
+        served = set(draw.served)
+        unseen = [i for i in range(len(bank.questions)) if i not in served]
+        picked = random.sample(unseen, min(num_questions, len(unseen)))
+        if len(picked) < num_questions:
+            # Even a refill could not produce enough new questions; repeat some.
+            seen = [i for i in range(len(bank.questions)) if i in served]
+            picked += random.sample(seen, min(num_questions - len(picked), len(seen)))
+        draw.served = draw.served + [i for i in picked if i not in served]
+        draw.save(update_fields=['served', 'updated_at'])
+
+    if not picked:
+        raise Exception("The AI generated no questions. Please try again with a different PDF or fewer questions.")
+
+    print(f"Served {len(picked)} questions from bank {bank_key[:12]} ({len(unseen) - len(picked)} unseen left)")
+    return [copy.deepcopy(bank.questions[i]) for i in sorted(picked)]
+
+def extraction_budget(num_questions):
+    """
+    Most characters of a document worth extracting. A single prompt uses
+    up to max_source_chars of it and chunked generation the full allowance
+    of every question; passage selection picks from QUIZ_PASSAGE_POOL_FACTOR
+    times that. Only the question bank reads whole documents (up to
+    QUIZ_EXTRACT_MAX_CHARS), since it keeps drawing on them.
+    """
+    if settings.QUESTION_BANK_ENABLED:
+        return settings.QUIZ_EXTRACT_MAX_CHARS
+    budget = max_source_chars(num_questions)
+    if settings.QUIZ_CHUNKED_GENERATION:
+        budget = max(budget, max_chunked_source_chars(num_questions))
+    if settings.QUIZ_PASSAGE_SELECTION:
+        budget *= settings.QUIZ_PASSAGE_POOL_FACTOR
+    return min(budget, settings.QUIZ_EXTRACT_MAX_CHARS)
+
+def extract_pages_from_pdf(pdf_file, max_chars=None):
+    try:
+        return extract_pdf_pages(
+            pdf_file,
+            max_chars=max_chars,
+            workers=settings.PDF_EXTRACT_WORKERS,
+            parallel_min_pages=settings.PDF_PARALLEL_MIN_PAGES,
+        )
     except Exception as fitz_error:
         print(f"Error opening or reading PDF: {fitz_error}")
         raise Exception(f"Could not process the PDF file: {fitz_error}")
 
-    return generate_quiz_from_text(pdf_text, num_questions, custom_instructions)
+def extract_text_from_pdf(pdf_file, max_chars=None):
+    return "".join(extract_pages_from_pdf(pdf_file, max_chars=max_chars))
+
+def load_source_document(source_type, source, max_chars=None):
+    """
+    The SourceDocument for an uploaded file or a URL. Sources already in the
+    document store are not parsed again; others are extracted and stored.
+    URL documents are only reused while URL_CACHE_FRESH_SECONDS old, since
+    pages change under the same address.
+    """
+    if source_type == GenerationJob.SOURCE_URL:
+        key = documents.url_key(source)
+        document = documents.get_document(key, max_chars, max_age=settings.URL_CACHE_FRESH_SECONDS)
+    else:
+        key = documents.file_key(source)
+        document = documents.get_document(key, max_chars)
+    if document is not None:
+        return document
+
+    if source_type == GenerationJob.SOURCE_PDF:
+        pages, separator = extract_pages_from_pdf(source, max_chars=max_chars), ""
+    elif source_type == GenerationJob.SOURCE_PPT:
+        pages, separator = extract_slides_from_ppt(source), "\n"
+    else:
+        pages, separator = [extract_text_from_url(source, max_chars=max_chars)], ""
+    extracted_chars = sum(len(page_text) for page_text in pages)
+    complete = max_chars is None or extracted_chars < max_chars
+
+    removed_chars = 0
+    if settings.TEXT_NORMALIZATION_ENABLED:
+        pages, removed_chars = normalize_pages(
+            pages,
+            min_fraction=settings.BOILERPLATE_MIN_PAGE_FRACTION,
+            min_pages=settings.BOILERPLATE_MIN_PAGES,
+        )
+        # Normalized pages no longer end in a line break of their own.
+        separator = "\n"
+        print(f"Normalized {source_type} document {key[:12]}: removed {removed_chars} boilerplate characters")
+    return documents.store_document(key, source_type, pages, separator, complete=complete, removed_chars=removed_chars, extracted_chars=extracted_chars)
+
+def generate_quiz_from_source(source_type, source, num_questions, custom_instructions, owner_key=None, timer=None, on_question=None):
+    """
+    Load the source's document and generate from it; returns (quiz_data, document).
+    With `on_question`, the quiz is streamed and each question handed to it as
+    soon as the model has finished writing it.
+    """
+    # Slides are always read whole.
+    budget = None if source_type == GenerationJob.SOURCE_PPT else extraction_budget(num_questions)
+    with telemetry.stage(timer, 'extract'):
+        document = load_source_document(source_type, source, max_chars=budget)
+    text = document.text[:budget]
+    with telemetry.stage(timer, 'generate'):
+        if on_question is None:
+            quiz_data = generate_quiz_from_text(text, num_questions, custom_instructions, owner_key=owner_key, timer=timer)
+        else:
+            quiz_data = []
+            for question in stream_quiz_from_text(text, num_questions, custom_instructions, owner_key=owner_key, timer=timer):
+                on_question(question)
+                quiz_data.append(question)
+    return quiz_data, document
+
+def generate_quiz_from_pdf(pdf_file, num_questions, custom_instructions, owner_key=None, timer=None):
+    quiz_data, _ = generate_quiz_from_source(GenerationJob.SOURCE_PDF, pdf_file, num_questions, custom_instructions, owner_key=owner_key, timer=timer)
+    return quiz_data
 
 def extract_text_from_ppt_legacy(ppt_file):
     try:
@@ -162,62 +774,38 @@ def extract_text_from_ppt_legacy(ppt_file):
         if not ole.exists('PowerPoint Document'):
             return ""
             
-        stream = ole.openstream('PowerPoint Document')
-        data = stream.read()
-        
-        text_runs = []
-        idx = 0
-        while idx < len(data):
-            if idx + 8 > len(data):
-                break
-                
-            rec_ver_inst = struct.unpack('<H', data[idx:idx+2])[0]
-            rec_type = struct.unpack('<H', data[idx+2:idx+4])[0]
-            rec_len = struct.unpack('<I', data[idx+4:idx+8])[0]
-            
-            rec_ver = rec_ver_inst & 0x000F
-            
-            if rec_type == 4000:
-                if idx + 8 + rec_len <= len(data):
-                    text_bytes = data[idx+8:idx+8+rec_len]
-                    try:
-                        text = text_bytes.decode('utf-16le')
-                        text_runs.append(text)
-                    except:
-                        pass
-                idx += 8 + rec_len
-            elif rec_type == 4008:
-                if idx + 8 + rec_len <= len(data):
-                    text_bytes = data[idx+8:idx+8+rec_len]
-                    try:
-                        text = text_bytes.decode('latin-1')
-                        text_runs.append(text)
-                    except:
-                        pass
-                idx += 8 + rec_len
-            elif rec_ver == 0x0F:
-                idx += 8
-            else:
-                idx += 8 + rec_len
-            
-        return "\n".join(text_runs)
+        # Read from the file as the records are walked, not loaded whole.
+        stream = open_ole_stream(ole, 'PowerPoint Document')
+        return "\n".join(extract_ppt_text_runs(stream))
         
     except Exception as e:
         print(f"Error extracting text from legacy PPT: {e}")
         raise Exception(f"Could not extract text from .ppt file: {e}")
 
-def generate_quiz_from_ppt(ppt_file, num_questions, custom_instructions):
+def extract_text_from_pptx_object_model(pptx_file):
+    if hasattr(pptx_file, 'seek'):
+        pptx_file.seek(0)
+    prs = Presentation(pptx_file)
+    text_runs = []
+    for slide in prs.slides:
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                text_runs.append(shape.text)
+    return "\n".join(text_runs)
+
+def extract_slides_from_ppt(ppt_file):
+    """Text of each slide. Legacy .ppt files (and .pptx read through python-pptx) come back as one piece."""
     try:
-        if ppt_file.name.lower().endswith('.ppt'):
-             ppt_text = extract_text_from_ppt_legacy(ppt_file)
-        elif ppt_file.name.lower().endswith('.pptx'):
-            prs = Presentation(ppt_file)
-            text_runs = []
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        text_runs.append(shape.text)
-            ppt_text = "\n".join(text_runs)
+        file_type = uploads.uploaded_file_type(ppt_file)
+        if file_type == uploads.FILE_TYPE_PPT:
+             slides = [extract_text_from_ppt_legacy(ppt_file)]
+        elif file_type == uploads.FILE_TYPE_PPTX:
+            try:
+                slides = extract_pptx_slides(ppt_file, include_notes=settings.PPTX_INCLUDE_NOTES)
+            except Exception as xml_error:
+                # Unusual packages still open with the full object model.
+                print(f"Reading .pptx XML failed, falling back to python-pptx: {xml_error}")
+                slides = [extract_text_from_pptx_object_model(ppt_file)]
         else:
              raise Exception("Unsupported file format. Please upload .ppt or .pptx.")
              
@@ -225,28 +813,15 @@ def generate_quiz_from_ppt(ppt_file, num_questions, custom_instructions):
         print(f"Error opening or reading PPT: {ppt_error}")
         raise Exception(f"Could not process the PPT file: {ppt_error}")
 
-    return generate_quiz_from_text(ppt_text, num_questions, custom_instructions)
-
-def generate_quiz_from_url(url, num_questions, custom_instructions):
-    text = extract_text_from_url(url)
-    return generate_quiz_from_text(text, num_questions, custom_instructions)
+    return slides
 
+def extract_text_from_ppt(ppt_file):
+    return "\n".join(extract_slides_from_ppt(ppt_file))
 
-def estimate_generation_time(pdf_text_length, num_questions):
-    base_min = 15
-    base_max = 25
-    
-    size_factor_min = (pdf_text_length / 10000) * 5
-    size_factor_max = (pdf_text_length / 10000) * 8
-    
-    questions_factor_min = int(num_questions) * 3
-    questions_factor_max = int(num_questions) * 5
-    
-    total_min = int(base_min + size_factor_min + questions_factor_min)
-    total_max = int(base_max + size_factor_max + questions_factor_max)
-    
-    total_min = min(total_min, 180)
-    total_max = min(total_max, 180)
-    
-    return (total_min, total_max)
+def generate_quiz_from_ppt(ppt_file, num_questions, custom_instructions, owner_key=None, timer=None):
+    quiz_data, _ = generate_quiz_from_source(GenerationJob.SOURCE_PPT, ppt_file, num_questions, custom_instructions, owner_key=owner_key, timer=timer)
+    return quiz_data
 
+def generate_quiz_from_url(url, num_questions, custom_instructions, owner_key=None, timer=None):
+    quiz_data, _ = generate_quiz_from_source(GenerationJob.SOURCE_URL, url, num_questions, custom_instructions, owner_key=owner_key, timer=timer)
+    return quiz_data
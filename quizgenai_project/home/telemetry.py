@@ -0,0 +1,141 @@
+import time
+from contextlib import contextmanager, nullcontext
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from .models import GenerationTiming, LatencyModelState
+
+MODEL_NAME = 'total'
+# Keeps the normal equations solvable while there are few samples.
+_RIDGE = 1e-3
+# Used for the text length until a source type has been seen: about what the
+# old fixed estimate assumed (10k chars per MB of file, 10k chars per web page).
+_DEFAULT_CHARS_PER_BYTE = 0.01
+_DEFAULT_URL_CHARS = 10000
+_NUM_FEATURES = 5
+
+def _features(source_type, num_questions, text_chars):
+    return np.array([
+        1.0,
+        text_chars / 10000,
+        float(num_questions),
+        1.0 if source_type == 'ppt' else 0.0,
+        1.0 if source_type == 'url' else 0.0,
+    ])
+
+class GenerationTimer:
+    """Collects the per-stage timings of one generation and stores them once it finishes."""
+
+    def __init__(self, source_type, num_questions, source_bytes=None, streamed=False):
+        self.source_type = source_type
+        self.num_questions = int(num_questions)
+        self.source_bytes = source_bytes
+        self.streamed = streamed
+        self.text_chars = None
+        self.cached = False
+        self.stages = {}
+        self._started = time.monotonic()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - started
+
+    def finish(self, succeeded=True):
+        queue_seconds = self.stages.get('queue', 0.0)
+        try:
+            timing = GenerationTiming.objects.create(
+                source_type=self.source_type,
+                num_questions=self.num_questions,
+                source_bytes=self.source_bytes,
+                text_chars=self.text_chars,
+                queue_seconds=queue_seconds,
+                extract_seconds=self.stages.get('extract', 0.0),
+                generate_seconds=self.stages.get('generate', 0.0),
+                save_seconds=self.stages.get('save', 0.0),
+                total_seconds=queue_seconds + time.monotonic() - self._started,
+                streamed=self.streamed,
+                cached=self.cached,
+                succeeded=succeeded,
+            )
+            update_latency_model(timing)
+        except Exception as e:
+            print(f"Error recording generation timing: {e}")
+
+def stage(timer, name):
+    """timer.stage(name), or a no-op when the caller is not timing this generation."""
+    return timer.stage(name) if timer is not None else nullcontext()
+
+def update_latency_model(timing):
+    """
+    Fold one finished generation into the running regression statistics.
+    Older samples are decayed so the model follows changes in model speed.
+    """
+    if not timing.succeeded or timing.text_chars is None:
+        return
+
+    with transaction.atomic():
+        state, _ = LatencyModelState.objects.select_for_update().get_or_create(name=MODEL_NAME)
+
+        stats = state.source_stats.setdefault(timing.source_type, {'count': 0, 'chars': 0, 'bytes': 0})
+        stats['count'] += 1
+        stats['chars'] += timing.text_chars
+        stats['bytes'] += timing.source_bytes or 0
+
+        # Cache hits say nothing about how long a model call takes.
+        if not timing.cached:
+            x = _features(timing.source_type, timing.num_questions, timing.text_chars)
+            y = timing.total_seconds
+            decay = settings.LATENCY_MODEL_DECAY
+            xtx = np.array(state.xtx) if state.xtx else np.zeros((_NUM_FEATURES, _NUM_FEATURES))
+            xty = np.array(state.xty) if state.xty else np.zeros(_NUM_FEATURES)
+            state.xtx = (decay * xtx + np.outer(x, x)).tolist()
+            state.xty = (decay * xty + x * y).tolist()
+            state.yty = decay * state.yty + y * y
+            state.weight = decay * state.weight + 1
+            state.samples += 1
+
+        state.save()
+
+def _estimate_text_chars(state, source_type, source_bytes):
+    stats = state.source_stats.get(source_type) if state else None
+    if source_bytes:
+        if stats and stats['bytes']:
+            return source_bytes * stats['chars'] / stats['bytes']
+        return source_bytes * _DEFAULT_CHARS_PER_BYTE
+    if stats and stats['count']:
+        return stats['chars'] / stats['count']
+    return _DEFAULT_URL_CHARS
+
+def fixed_generation_estimate(text_length, num_questions):
+    """The hand-tuned estimate, used until the model has enough samples."""
+    total_min = int(15 + (text_length / 10000) * 5 + int(num_questions) * 3)
+    total_max = int(25 + (text_length / 10000) * 8 + int(num_questions) * 5)
+    return (min(total_min, 180), min(total_max, 180))
+
+def predict_generation_time(source_type, num_questions, source_bytes=None, text_chars=None):
+    """
+    Expected seconds for a generation, as (min, max). Uses the fitted model
+    (prediction plus or minus one residual standard deviation) once it has
+    LATENCY_MODEL_MIN_SAMPLES samples, the fixed estimate before that.
+    """
+    state = LatencyModelState.objects.filter(name=MODEL_NAME).first()
+    if text_chars is None:
+        text_chars = _estimate_text_chars(state, source_type, source_bytes)
+
+    if state is None or state.samples < settings.LATENCY_MODEL_MIN_SAMPLES:
+        return fixed_generation_estimate(text_chars, num_questions)
+
+    xtx = np.array(state.xtx)
+    xty = np.array(state.xty)
+    coefficients = np.linalg.solve(xtx + _RIDGE * np.eye(_NUM_FEATURES), xty)
+    residual = state.yty - 2 * coefficients @ xty + coefficients @ xtx @ coefficients
+    spread = np.sqrt(max(residual, 0.0) / max(state.weight - _NUM_FEATURES, 1.0))
+
+    predicted = float(coefficients @ _features(source_type, num_questions, text_chars))
+    low = max(int(predicted - spread), 1)
+    high = max(int(np.ceil(predicted + spread)), low + 1)
+    return (low, high)
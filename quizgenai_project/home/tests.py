@@ -1,3 +1,1753 @@
-from django.test import TestCase
+import io
+import itertools
+import json
+import os
+import queue
+import random
+import struct
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+import fitz
+import olefile
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from pptx import Presentation
+from pptx.util import Inches
+from home import budget as budget_module
+from home import coalescing, documents, jobs, llm, pdf_extraction, progress, services, telemetry, uploads, url_fetching
+from home.budget import estimate_tokens, max_source_chars, plan_prompt_budget
+from home.html_extraction import _sniff_encoding, extract_html_text
+from home.management.commands.benchmark_html_extraction import build_page
+from home.management.commands.benchmark_ppt_records import (
+    PICTURE_BLOB, SLIDE_CONTAINER, TEXT_BYTES_ATOM, TEXT_CHARS_ATOM, _record, _Unbuffered, build_record_stream,
+    slice_and_unpack_walk,
+)
+from home.management.commands.benchmark_pptx_extraction import build_deck
+from home.models import (
+    ApiKeyUsage, GenerationJob, GenerationLock, GenerationTiming, LatencyModelState, PromptBudgetRecord, QuestionBank,
+    QuestionBankDraw, Quiz, QuizAttempt, QuizCacheEntry, SourceDocument, UserProgressStats,
+)
+from home.normalization import normalize_pages
+from home.passages import score_passages, select_passages, split_into_passages
+from home.ppt_extraction import OleStreamReader, extract_ppt_text_runs, extract_pptx_slides, extract_pptx_text, open_ole_stream
+from home.quiz_parsing import IncrementalArrayParser, salvage_questions
+from home.services import extract_html_text_with_soup
+from home.url_fetching import declared_charset
 
-# Create your tests here.
+TESTDATA = os.path.join(os.path.dirname(__file__), 'testdata')
+
+
+class _NonSeekable(_Unbuffered):
+    def seekable(self):
+        return False
+
+    def seek(self, offset, whence=0):
+        raise io.UnsupportedOperation("seek")
+
+
+class PptRecordWalkerTests(SimpleTestCase):
+    """The zero-copy walker must return exactly what the slice-and-unpack walker did."""
+
+    def assertSameRuns(self, data):
+        expected = slice_and_unpack_walk(data)
+        self.assertEqual(extract_ppt_text_runs(io.BytesIO(data)), expected)
+        for chunk_size in (7, 512, 64 * 1024):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(extract_ppt_text_runs(_Unbuffered(data), chunk_size=chunk_size), expected)
+                self.assertEqual(extract_ppt_text_runs(_NonSeekable(data), chunk_size=chunk_size), expected)
+        return expected
+
+    def test_synthetic_presentations(self):
+        for seed, num_slides in enumerate((1, 5, 20, 60)):
+            with self.subTest(slides=num_slides):
+                runs = self.assertSameRuns(build_record_stream(num_slides, seed=seed, picture_bytes=3000))
+                self.assertTrue(runs)
+
+    def test_text_atom_cut_off_at_end_of_stream(self):
+        data = _record(TEXT_CHARS_ATOM, "kept".encode('utf-16le')) + _record(TEXT_BYTES_ATOM, b"cut off")[:-3]
+        self.assertEqual(self.assertSameRuns(data), ["kept"])
+
+    def test_skipped_atom_longer_than_the_stream(self):
+        data = _record(TEXT_BYTES_ATOM, b"before") + struct.pack('<HHI', 0, PICTURE_BLOB, 1 << 20) + b"\0" * 100
+        self.assertEqual(self.assertSameRuns(data), ["before"])
+
+    def test_undecodable_utf16_atom_is_dropped(self):
+        data = _record(TEXT_CHARS_ATOM, b"\x00\xd8") + _record(TEXT_BYTES_ATOM, "naïve".encode('latin-1'))
+        self.assertEqual(self.assertSameRuns(data), ["naïve"])
+
+    def test_nested_containers_are_descended(self):
+        inner = _record(SLIDE_CONTAINER, _record(TEXT_BYTES_ATOM, b"inner"), version=0x0F)
+        data = _record(SLIDE_CONTAINER, _record(TEXT_BYTES_ATOM, b"outer") + inner, version=0x0F)
+        self.assertEqual(self.assertSameRuns(data), ["outer", "inner"])
+
+    def test_empty_stream(self):
+        self.assertEqual(self.assertSameRuns(b""), [])
+
+
+def _chunked(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+class HtmlExtractionTests(SimpleTestCase):
+    """The streaming extractor must find the same words as BeautifulSoup, however the page is chunked."""
+
+    def saved_pages(self):
+        directory = os.path.join(TESTDATA, 'html')
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), 'rb') as fh:
+                yield name, fh.read()
+
+    def test_saved_pages_match_beautifulsoup(self):
+        pages = list(self.saved_pages())
+        self.assertTrue(pages)
+        for name, data in pages:
+            expected = extract_html_text_with_soup(data).split()
+            for size in (1, 13, 1024, 64 * 1024):
+                with self.subTest(page=name, chunk_size=size):
+                    self.assertEqual(extract_html_text(_chunked(data, size)).split(), expected)
+
+    def test_synthetic_pages_match_beautifulsoup(self):
+        for sections in (1, 10, 50):
+            data = build_page(sections, seed=sections)
+            with self.subTest(sections=sections):
+                self.assertEqual(extract_html_text(_chunked(data, 4096)).split(), extract_html_text_with_soup(data).split())
+
+    def test_page_furniture_is_skipped(self):
+        with open(os.path.join(TESTDATA, 'html', 'blog.html'), 'rb') as fh:
+            text = extract_html_text([fh.read()])
+        self.assertIn("Enzymes are biological catalysts.", text)
+        for furniture in ("Archive", "Popular posts", "All rights reserved", "querySelectorAll"):
+            self.assertNotIn(furniture, text)
+
+    def test_stops_reading_once_the_budget_is_reached(self):
+        data = build_page(200)
+        consumed = []
+
+        def chunks():
+            for chunk in _chunked(data, 1024):
+                consumed.append(chunk)
+                yield chunk
+
+        text = extract_html_text(chunks(), max_chars=500)
+        self.assertEqual(len(text), 500)
+        self.assertLess(len(consumed), len(data) // 1024 // 2)
+        self.assertEqual(text, extract_html_text([data])[:500])
+
+    def test_meta_charset_is_honoured(self):
+        with open(os.path.join(TESTDATA, 'html', 'latin1.html'), 'rb') as fh:
+            data = fh.read()
+        self.assertIn("La chimie du café", extract_html_text(_chunked(data, 16)))
+
+    def test_header_charset_wins_over_meta(self):
+        data = "<meta charset='utf-8'><p>Ça coûte 5 €</p>".encode('cp1252')
+        self.assertEqual(extract_html_text([data], encoding='windows-1252'), "Ça coûte 5 €")
+
+    def test_encoding_precedence(self):
+        meta = b"<meta charset='windows-1252'>"
+        self.assertEqual(_sniff_encoding(meta), 'cp1252')
+        self.assertEqual(_sniff_encoding(meta, 'utf-8'), 'utf-8')
+        self.assertEqual(_sniff_encoding(b'\xef\xbb\xbf' + meta, 'latin-1'), 'utf-8-sig')
+        self.assertEqual(_sniff_encoding(meta, 'not-a-charset'), 'cp1252')
+        self.assertEqual(_sniff_encoding(b"<p>no declaration</p>"), 'utf-8')
+
+    def test_declared_charset(self):
+        def response(content_type):
+            return SimpleNamespace(headers={'Content-Type': content_type} if content_type else {})
+
+        self.assertEqual(declared_charset(response('text/html; charset="ISO-8859-1"')), 'ISO-8859-1')
+        self.assertEqual(declared_charset(response('text/html;charset=utf-8')), 'utf-8')
+        self.assertIsNone(declared_charset(response('text/html')))
+        self.assertIsNone(declared_charset(response(None)))
+
+
+def _question(number, options=4):
+    # Brackets, quotes and a backslash inside strings must not confuse the parser.
+    return {
+        "question": f'Question {number}: is "a\\b" in [x] or {{y}}?',
+        "options": [f"Option {i}" for i in range(options)],
+        "correctAnswer": number % options,
+        "explanation": f"Because {number}.",
+    }
+
+
+class IncrementalArrayParserTests(SimpleTestCase):
+
+    def feed_in_pieces(self, text, size):
+        parser = IncrementalArrayParser()
+        elements = []
+        for start in range(0, len(text), size):
+            elements += parser.feed(text[start:start + size])
+        return parser, elements
+
+    def test_any_split_yields_the_same_elements(self):
+        questions = [_question(n) for n in range(1, 4)] + [["Compact [q]?", ["a", "b", "c", "d"], 1, "e}"]]
+        text = "```json\n" + json.dumps(questions, indent=2) + "\n```"
+        for size in range(1, 40):
+            with self.subTest(chunk_size=size):
+                parser, elements = self.feed_in_pieces(text, size)
+                self.assertEqual(elements, questions)
+                self.assertTrue(parser.finished)
+                self.assertEqual(parser.skipped, 0)
+
+    def test_elements_are_returned_as_soon_as_they_close(self):
+        parser = IncrementalArrayParser()
+        first = json.dumps(_question(1))
+        self.assertEqual(parser.feed("[" + first[:-1]), [])
+        self.assertEqual(parser.feed(first[-1] + ", {"), [_question(1)])
+        self.assertFalse(parser.finished)
+
+    def test_text_after_the_array_is_ignored(self):
+        parser = IncrementalArrayParser()
+        self.assertEqual(parser.feed('Here you go: [{"a": 1}] and also [{"b": 2}]'), [{"a": 1}])
+        self.assertTrue(parser.finished)
+        self.assertEqual(parser.feed('[{"c": 3}]'), [])
+
+    def test_undecodable_elements_are_counted_not_raised(self):
+        parser, elements = self.feed_in_pieces('[{"a": 1}, {"b": tru}, {"c": 3}]', 4)
+        self.assertEqual(elements, [{"a": 1}, {"c": 3}])
+        self.assertEqual(parser.skipped, 1)
+
+    def test_truncated_stream_keeps_complete_elements(self):
+        parser, elements = self.feed_in_pieces('[{"a": 1}, {"b": "cut', 3)
+        self.assertEqual(elements, [{"a": 1}])
+        self.assertFalse(parser.finished)
+
+
+class SalvageQuestionsTests(SimpleTestCase):
+
+    def test_truncated_array_keeps_complete_questions(self):
+        text = json.dumps([_question(1), _question(2), _question(3)])
+        self.assertEqual(salvage_questions(text[:-40]), [_question(1), _question(2)])
+
+    def test_fenced_response_with_trailing_garbage(self):
+        text = "```json\n" + json.dumps([_question(1), _question(2)]) + "\n``` Hope this helps!"
+        self.assertEqual(salvage_questions(text), [_question(1), _question(2)])
+
+    def test_bare_objects_without_the_array(self):
+        # The first '[' belongs to the first question's options list.
+        text = "\n".join(json.dumps(_question(n)) for n in range(1, 4))
+        self.assertEqual(salvage_questions(text), [_question(n) for n in range(1, 4)])
+
+    def test_invalid_questions_are_dropped(self):
+        broken = {"question": "No answer given", "options": ["a", "b", "c", "d"]}
+        text = json.dumps([_question(1), _question(2, options=3), broken, "not a question", _question(4)])
+        self.assertEqual(salvage_questions(text), [_question(1), _question(4)])
+
+    def test_compact_questions_are_expanded(self):
+        text = '[["Which gas do plants release?", ["CO2", "O2", "N2", "H2"], 1, "Photosynthesis releases O2."], ["cut off'
+        self.assertEqual(salvage_questions(text), [{
+            "question": "Which gas do plants release?",
+            "options": ["CO2", "O2", "N2", "H2"],
+            "correctAnswer": 1,
+            "explanation": "Photosynthesis releases O2.",
+        }])
+
+    def test_missing_explanation_is_filled_in(self):
+        question = _question(1)
+        del question["explanation"]
+        self.assertEqual(salvage_questions(json.dumps([question]))[0]["explanation"], "No explanation provided.")
+
+    def test_nothing_to_salvage(self):
+        self.assertEqual(salvage_questions("I'm sorry, I can't help with that."), [])
+
+
+def _quiz_created(created_at, **fields):
+    """A quiz with the given creation time, which auto_now_add would otherwise overwrite."""
+    quiz = Quiz.objects.create(quiz_data=fields.pop('quiz_data', []), **fields)
+    Quiz.objects.filter(pk=quiz.pk).update(created_at=created_at)
+    return quiz
+
+
+@override_settings(HISTORY_PAGE_SIZE=3)
+class HistoryPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='pw')
+        other = User.objects.create_user('other', password='pw')
+        now = timezone.now()
+        # Three quizzes share a created_at across a page break, so the cursor has to break ties by id.
+        for minutes in (0, 5, 5, 5, 10, 20, 20, 30):
+            _quiz_created(now - timedelta(minutes=minutes), user=self.user, title='Mine')
+        Quiz.objects.create(user=other, title='Theirs', quiz_data=[])
+        self.client.force_login(self.user)
+
+    def walk_pages(self):
+        pages = []
+        params = {}
+        while True:
+            response = self.client.get(reverse('history'), params)
+            self.assertEqual(response.status_code, 200)
+            pages.append([quiz.id for quiz in response.context['quizzes']])
+            if response.context['next_cursor'] is None:
+                return pages
+            params = {'before': response.context['next_cursor']}
+
+    def test_pages_cover_every_quiz_once_newest_first(self):
+        pages = self.walk_pages()
+        expected = list(Quiz.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual([len(page) for page in pages], [3, 3, 2])
+        self.assertEqual([quiz_id for page in pages for quiz_id in page], expected)
+
+    def test_quiz_data_is_not_loaded(self):
+        response = self.client.get(reverse('history'))
+        self.assertIn('quiz_data', response.context['quizzes'][0].get_deferred_fields())
+
+    def test_malformed_cursor_shows_the_first_page(self):
+        first = self.client.get(reverse('history'))
+        for cursor in ('garbage', '2024-01-01~not-a-uuid', '~'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('history'), {'before': cursor})
+                self.assertEqual(list(response.context['quizzes']), list(first.context['quizzes']))
+                self.assertTrue(response.context['is_first_page'])
+
+    def test_anonymous_visitors_only_see_their_session(self):
+        self.client.logout()
+        session = self.client.session
+        session.save()
+        Quiz.objects.create(title='Anonymous', quiz_data=[], session_key=session.session_key)
+        Quiz.objects.create(title='Someone else', quiz_data=[], session_key='another-session')
+        response = self.client.get(reverse('history'))
+        self.assertEqual([quiz.title for quiz in response.context['quizzes']], ['Anonymous'])
+
+
+PDF_BYTES = b"%PDF-1.7\n" + bytes(3000)
+PPT_BYTES = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + bytes(3000)
+PPTX_BYTES = b"PK\x03\x04" + bytes(3000)
+
+
+@override_settings(UPLOAD_MAX_BYTES=16 * 1024)
+class UploadHandlerTests(TestCase):
+    """Uploads are routed by their first bytes and refused early when too large or of an unknown type."""
+
+    def setUp(self):
+        patcher = mock.patch.object(jobs, 'submit_generation_job', side_effect=self._discard_spooled_upload)
+        self.submit = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _discard_spooled_upload(self, job, num_questions, custom_instructions, upload_path=None, events=None):
+        if upload_path:
+            os.remove(upload_path)
+
+    def upload(self, content, name='slides.pdf', field='pdf'):
+        return self.client.post(reverse('generate-quiz'), {field: SimpleUploadedFile(name, content), 'num_questions': 5})
+
+    def test_files_are_routed_by_magic_bytes_not_name(self):
+        cases = [
+            (PDF_BYTES, 'notes.pptx', GenerationJob.SOURCE_PDF),
+            (PPT_BYTES, 'notes.pdf', GenerationJob.SOURCE_PPT),
+            (PPTX_BYTES, 'notes.pdf', GenerationJob.SOURCE_PPT),
+            # PDF readers accept a header anywhere in the first kilobyte.
+            (b"\r\n\xef\xbb\xbf junk %PDF-1.4" + bytes(3000), 'scan', GenerationJob.SOURCE_PDF),
+            # Shorter than the sniffed prefix: detected once the file is complete.
+            (b"%PDF-1.4 tiny", 'tiny.pdf', GenerationJob.SOURCE_PDF),
+        ]
+        for content, name, source_type in cases:
+            with self.subTest(name=name, source_type=source_type):
+                response = self.upload(content, name=name)
+                self.assertEqual(response.status_code, 202)
+                job = GenerationJob.objects.get(id=response.json()['job_id'])
+                self.assertEqual(job.source_type, source_type)
+
+    def test_unknown_file_type_is_refused(self):
+        for content in (b"Just some text notes\n" * 200, b"GIF89a" + bytes(10)):
+            with self.subTest(content=content[:10]):
+                response = self.upload(content)
+                self.assertEqual(response.status_code, 415)
+        self.assertFalse(self.submit.called)
+        self.assertFalse(GenerationJob.objects.exists())
+
+    def test_file_over_the_cap_is_refused_while_streaming(self):
+        # Small enough to pass the Content-Length check; stopped by the per-chunk cap.
+        response = self.upload(PDF_BYTES + bytes(20 * 1024))
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("too large", response.json()['error'])
+        self.assertFalse(self.submit.called)
+
+    def test_oversized_request_is_refused_from_its_content_length(self):
+        with mock.patch.object(uploads.QuizUploadHandler, 'receive_data_chunk') as receive:
+            response = self.upload(PDF_BYTES + bytes(200 * 1024))
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(receive.called)
+
+    @override_settings(QUIZ_STREAMING_ENABLED=True)
+    def test_streaming_view_applies_the_same_checks(self):
+        response = self.client.post(reverse('generate-quiz-stream'), {'ppt': SimpleUploadedFile('x.ppt', b"not a deck" * 200)})
+        self.assertEqual(response.status_code, 415)
+
+    def test_streaming_is_opt_in(self):
+        stream_url = reverse('generate-quiz-stream')
+        self.assertNotContains(self.client.get(reverse('home')), stream_url)
+        response = self.client.post(stream_url, {'url': 'https://example.com/', 'num_questions': 5})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(self.submit.called)
+
+        with override_settings(QUIZ_STREAMING_ENABLED=True):
+            self.assertContains(self.client.get(reverse('home')), stream_url)
+
+    def test_detect_file_type(self):
+        self.assertEqual(uploads.detect_file_type(PDF_BYTES[:1024]), uploads.FILE_TYPE_PDF)
+        self.assertEqual(uploads.detect_file_type(PPT_BYTES[:1024]), uploads.FILE_TYPE_PPT)
+        self.assertEqual(uploads.detect_file_type(PPTX_BYTES[:1024]), uploads.FILE_TYPE_PPTX)
+        self.assertIsNone(uploads.detect_file_type(bytes(2000) + b"%PDF-"))
+        self.assertIsNone(uploads.detect_file_type(b""))
+
+
+def _lecture_page(number, body):
+    return f"Biology 101 - Lecture {number // 10 + 1}\n{body}\n© 2024 University of Example\nPage {number} of 12"
+
+
+class NormalizationTests(SimpleTestCase):
+
+    def test_running_headers_footers_and_page_numbers_are_removed(self):
+        words = "mitosis spindle chromatid centromere kinetochore prophase anaphase telophase cytokinesis".split()
+        rng = random.Random(0)
+        bodies = ["\n".join(" ".join(rng.choice(words) for _ in range(8)) for _ in range(10)) for _ in range(12)]
+        pages, removed = normalize_pages([_lecture_page(n + 1, body) for n, body in enumerate(bodies)])
+        self.assertEqual(pages, bodies)
+        self.assertEqual(removed, sum(len(_lecture_page(n + 1, body)) - len(body) for n, body in enumerate(bodies)))
+
+    def test_numbered_body_lines_are_kept(self):
+        # Short numbered lines recur on every page, but in the middle of it rather than at its edges.
+        raw = [
+            f"Chapter {n}\nIntroduction to topic {n}.\n1. Define the term\n2. Give an example\n3. Explain why it matters\nSummary of topic {n}."
+            for n in range(1, 11)
+        ]
+        pages, _ = normalize_pages(raw)
+        for page in pages:
+            self.assertIn("1. Define the term\n2. Give an example\n3. Explain why it matters", page)
+
+    def test_only_lines_repeated_on_most_pages_are_removed(self):
+        body = "Enzymes lower the activation energy.\nThey are not consumed.\nMost are proteins."
+        raw = [f"Running head\n{body}\nEnd of page" for _ in range(7)] + [f"Draft notice\n{body}\nEnd of page" for _ in range(3)]
+        pages, _ = normalize_pages(raw, min_fraction=0.6)
+        self.assertEqual(pages[:7], [body] * 7)
+        self.assertEqual(pages[7:], [f"Draft notice\n{body}"] * 3)
+
+    def test_short_documents_are_left_alone(self):
+        raw = ["Title\nPhotosynthesis\nPage 1", "Title\nRespiration\nPage 2"]
+        pages, removed = normalize_pages(raw)
+        self.assertEqual(pages, raw)
+        self.assertEqual(removed, 0)
+
+    def test_hyphenated_words_are_rejoined_and_whitespace_collapsed(self):
+        pages, _ = normalize_pages(["The photo-\nsynthetic   rate\u00a0rises.\n\n\n\nA well-\nKnown effect."])
+        self.assertEqual(pages, ["The photosynthetic rate rises.\n\nA well-\nKnown effect."])
+
+
+@override_settings(DOCUMENT_STORE_ENABLED=True)
+class DocumentBudgetTests(TestCase):
+
+    def test_truncated_document_is_reused_for_budgets_it_covered(self):
+        # 10,000 characters were extracted before the budget stopped extraction; normalization left 9,000.
+        documents.store_document('k', 'pdf', ["x" * 9000], complete=False, removed_chars=1000, extracted_chars=10000)
+        self.assertIsNotNone(documents.get_document('k', max_chars=10000))
+        self.assertIsNotNone(documents.get_document('k', max_chars=5000))
+        self.assertIsNone(documents.get_document('k', max_chars=20000))
+        self.assertIsNone(documents.get_document('k'))
+
+
+class DocumentStoreTests(TestCase):
+
+    def upload(self, data):
+        return SimpleUploadedFile('notes.pdf', data)
+
+    def test_same_bytes_share_a_key_and_are_extracted_once(self):
+        data = _pdf_bytes([_prose(1, seed=1), _prose(1, seed=2)])
+        self.assertEqual(documents.file_key(self.upload(data)), documents.file_key(self.upload(data)))
+        self.assertNotEqual(documents.file_key(self.upload(data)), documents.file_key(self.upload(data + b"\n")))
+
+        with mock.patch.object(services, 'extract_pages_from_pdf', wraps=services.extract_pages_from_pdf) as extract:
+            first = services.load_source_document(GenerationJob.SOURCE_PDF, self.upload(data))
+            second = services.load_source_document(GenerationJob.SOURCE_PDF, self.upload(data))
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(second.text, first.text)
+        self.assertEqual(len(second.pages()), 2)
+        self.assertEqual(SourceDocument.objects.count(), 1)
+
+    def test_url_spellings_share_a_key(self):
+        self.assertEqual(documents.url_key('HTTPS://Example.com:443/a?b=1#top'), documents.url_key('https://example.com/a?b=1'))
+        self.assertEqual(documents.url_key('http://example.com'), documents.url_key('http://example.com/'))
+        self.assertNotEqual(documents.url_key('http://example.com:8080/a'), documents.url_key('http://example.com/a'))
+
+    def test_url_documents_expire_but_files_do_not(self):
+        documents.store_document('page', 'url', ["page text"])
+        documents.store_document('file', 'pdf', ["file text"])
+        SourceDocument.objects.update(extracted_at=timezone.now() - timedelta(hours=1))
+        self.assertIsNone(documents.get_document('page', max_age=600))
+        self.assertIsNotNone(documents.get_document('page', max_age=7200))
+        self.assertIsNotNone(documents.get_document('file'))
+
+    def test_least_recently_used_documents_are_evicted(self):
+        now = timezone.now()
+        for age, key in enumerate(['a', 'b', 'c']):
+            documents.store_document(key, 'pdf', [_prose(20, seed=age)])
+            SourceDocument.objects.filter(key=key).update(last_used_at=now - timedelta(minutes=10 - age))
+        # Reading 'a', the oldest, makes 'b' the least recently used.
+        self.assertIsNotNone(documents.get_document('a'))
+        limit = sum(SourceDocument.objects.values_list('stored_bytes', flat=True))
+
+        with override_settings(DOCUMENT_STORE_MAX_BYTES=limit):
+            documents.store_document('d', 'pdf', [_prose(20, seed=9)])
+        self.assertEqual(set(SourceDocument.objects.values_list('key', flat=True)), {'a', 'c', 'd'})
+
+    @override_settings(DOCUMENT_STORE_ENABLED=False)
+    def test_disabled_store_still_returns_the_text(self):
+        document = documents.store_document('k', 'pdf', ["one", "two"], separator="\n")
+        self.assertEqual(document.text, "one\ntwo")
+        self.assertIsNone(document.pk)
+        self.assertIsNone(documents.get_document('k'))
+        self.assertFalse(SourceDocument.objects.exists())
+
+
+class PruneAnonymousQuizzesTests(TestCase):
+    MAX_AGE = 14 * 24 * 60 * 60
+
+    def setUp(self):
+        now = timezone.now()
+        self.user = User.objects.create_user('keeper', password='pw')
+        # Seven recent quizzes in one session: the five newest stay.
+        self.busy = [_quiz_created(now - timedelta(hours=hours), title=f'busy {hours}', session_key='busy') for hours in range(7)]
+        self.quiet = [_quiz_created(now - timedelta(days=1), title='quiet', session_key='quiet')]
+        self.expired = _quiz_created(now - timedelta(days=15), title='expired', session_key='gone')
+        self.unscoped = _quiz_created(now, title='from before sessions', session_key='')
+        self.owned = _quiz_created(now - timedelta(days=400), title='signed in', user=self.user)
+
+    def remaining(self):
+        return set(Quiz.objects.values_list('id', flat=True))
+
+    def test_keeps_the_newest_per_session_and_drops_expired_quizzes(self):
+        deleted = jobs.prune_anonymous_quizzes(keep_per_session=5, max_age=self.MAX_AGE, batch_size=2)
+        self.assertEqual(deleted, 4)
+        self.assertEqual(self.remaining(), {quiz.id for quiz in self.busy[:5] + self.quiet + [self.owned]})
+
+    def test_running_again_deletes_nothing(self):
+        jobs.prune_anonymous_quizzes(keep_per_session=5, max_age=self.MAX_AGE)
+        self.assertEqual(jobs.prune_anonymous_quizzes(keep_per_session=5, max_age=self.MAX_AGE), 0)
+
+    def test_management_command(self):
+        out = io.StringIO()
+        call_command('prune_anonymous_quizzes', keep=1, max_age=self.MAX_AGE, stdout=out)
+        self.assertIn("Deleted 8 anonymous quizzes.", out.getvalue())
+        self.assertEqual(self.remaining(), {self.busy[0].id, self.quiet[0].id, self.owned.id})
+
+
+class ProgressStatsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('learner', password='pw')
+        self.quizzes = [
+            Quiz.objects.create(user=self.user, title=f'Quiz {n}', quiz_data=[_question(i) for i in range(count)], question_count=count)
+            for n, count in enumerate((4, 5, 10))
+        ]
+
+    def stats(self):
+        return UserProgressStats.objects.get(user=self.user)
+
+    def test_counters_match_the_attempts(self):
+        attempts = [(0, 2), (1, 5), (2, 7), (0, 4), (2, 0)]
+        for quiz_index, score in attempts:
+            progress.record_attempt(self.quizzes[quiz_index], self.user, score, [0] * self.quizzes[quiz_index].question_count)
+
+        stats = self.stats()
+        percentages = [progress.attempt_percentage(score, self.quizzes[q].question_count) for q, score in attempts]
+        self.assertEqual(stats.total_attempts, QuizAttempt.objects.filter(user=self.user).count())
+        self.assertEqual(stats.total_correct, sum(score for _, score in attempts))
+        self.assertEqual(stats.total_questions, sum(self.quizzes[q].question_count for q, _ in attempts))
+        self.assertAlmostEqual(stats.percentage_sum, sum(percentages))
+        self.assertEqual(stats.best_percentage, 100)
+        self.assertEqual(stats.perfect_count, 2)
+
+    def test_anonymous_attempts_update_no_stats(self):
+        progress.record_attempt(self.quizzes[0], None, 3, [0, 1, 2, 3])
+        self.assertEqual(QuizAttempt.objects.count(), 1)
+        self.assertFalse(UserProgressStats.objects.exists())
+
+    def test_saved_attempts_show_on_the_progress_page(self):
+        self.client.force_login(self.user)
+        for quiz, score in ((self.quizzes[0], 4), (self.quizzes[2], 5)):
+            response = self.client.post(
+                reverse('save-attempt'),
+                json.dumps({'quiz_id': str(quiz.id), 'score': score, 'user_answers': [0] * quiz.question_count}),
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+        # An attempt from yesterday lands in its own bar of the chart.
+        old = progress.record_attempt(self.quizzes[1], self.user, 1, [0] * 5)
+        QuizAttempt.objects.filter(pk=old.pk).update(timestamp=timezone.now() - timedelta(days=1))
+
+        context = self.client.get(reverse('progress')).context
+        self.assertEqual(context['total_attempts'], 3)
+        self.assertEqual(context['average_score'], 56.7)
+        self.assertEqual(context['highest_score'], 100)
+        self.assertEqual(context['perfect_quizzes'], 1)
+        self.assertEqual((context['total_correct'], context['total_incorrect']), (10, 9))
+        self.assertEqual(json.loads(context['correct_data']), [1, 9])
+        self.assertEqual(json.loads(context['incorrect_data']), [4, 5])
+
+    def test_no_attempts_yet(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('progress')).context['total_attempts'], 0)
+
+
+def _pdf_bytes(pages):
+    """A PDF with one page per string."""
+    pdf = fitz.open()
+    for text in pages:
+        pdf.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=9)
+    data = pdf.tobytes()
+    pdf.close()
+    return data
+
+
+class _Stop(Exception):
+    pass
+
+
+# Worker threads use their own connections, so these tests commit their data.
+@override_settings(QUIZ_CACHE_ENABLED=False, DOCUMENT_STORE_ENABLED=False, QUESTION_BANK_ENABLED=False)
+class GenerationJobTests(TransactionTestCase):
+
+    def setUp(self):
+        llm.set_backend(llm.FakeBackend())
+        self.addCleanup(llm.set_backend, None)
+
+    def pdf_job(self, **fields):
+        job = GenerationJob.objects.create(source_type=GenerationJob.SOURCE_PDF, title='notes.pdf', session_key='s', **fields)
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(_pdf_bytes(["Photosynthesis converts light energy into chemical energy in chloroplasts. " * 20]))
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        return job, path
+
+    def run_job(self, job, num_questions, upload_path):
+        events = queue.Queue()
+        jobs.run_generation_job(job.id, num_questions, '', upload_path=upload_path, events=events)
+        job.refresh_from_db()
+        return list(events.queue)
+
+    def test_job_runs_to_done_and_streams_its_questions(self):
+        job, path = self.pdf_job()
+        events = self.run_job(job, 3, path)
+        self.assertEqual(job.status, GenerationJob.STATUS_DONE)
+        self.assertEqual(job.quiz.question_count, 3)
+        self.assertEqual([kind for kind, _ in events], ['question'] * 3 + ['done'])
+        self.assertFalse(os.path.exists(path))
+        self.assertNotIn(job.id, jobs._active_jobs)
+
+    def test_setup_failure_fails_the_job(self):
+        job, path = self.pdf_job()
+        with self.assertLogs('home.jobs', 'ERROR'):
+            events = self.run_job(job, 'abc', path)
+        self.assertEqual(job.status, GenerationJob.STATUS_FAILED)
+        self.assertIn('abc', job.error)
+        self.assertEqual(events[-1][0], 'error')
+        self.assertFalse(os.path.exists(path))
+
+    def test_generation_failure_fails_the_job(self):
+        llm.set_backend(llm.FakeBackend(failure_rate=1.0))
+        job, path = self.pdf_job()
+        with self.assertLogs('home.jobs', 'ERROR'):
+            self.run_job(job, 3, path)
+        self.assertEqual(job.status, GenerationJob.STATUS_FAILED)
+        self.assertIsNone(job.quiz)
+
+    def test_expired_job_is_not_claimed(self):
+        job, path = self.pdf_job(status=GenerationJob.STATUS_FAILED, error='expired')
+        events = self.run_job(job, 3, path)
+        self.assertEqual((job.status, job.error), (GenerationJob.STATUS_FAILED, 'expired'))
+        self.assertEqual(events, [('error', "The quiz generation was interrupted. Please try again.")])
+        self.assertFalse(Quiz.objects.exists())
+
+    @override_settings(GENERATION_JOB_TIMEOUT=300)
+    def test_only_jobs_without_a_recent_heartbeat_expire(self):
+        stale = GenerationJob.objects.create(source_type=GenerationJob.SOURCE_URL, title='stale')
+        fresh = GenerationJob.objects.create(source_type=GenerationJob.SOURCE_URL, title='fresh')
+        GenerationJob.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(seconds=301))
+        stale.refresh_from_db()
+        self.assertEqual(jobs.expire_stale_job(stale).status, GenerationJob.STATUS_FAILED)
+        self.assertEqual(jobs.expire_stale_job(fresh).status, GenerationJob.STATUS_PENDING)
+
+    def test_heartbeat_keeps_held_jobs_fresh(self):
+        held = GenerationJob.objects.create(source_type=GenerationJob.SOURCE_URL, title='held')
+        other = GenerationJob.objects.create(source_type=GenerationJob.SOURCE_URL, title='other')
+        old = timezone.now() - timedelta(hours=1)
+        GenerationJob.objects.update(updated_at=old)
+        self.addCleanup(jobs._active_jobs.discard, held.id)
+        jobs._active_jobs.add(held.id)
+
+        with mock.patch.object(jobs.time, 'sleep', side_effect=[None, _Stop]), self.assertRaises(_Stop):
+            jobs._heartbeat()
+        held.refresh_from_db()
+        other.refresh_from_db()
+        self.assertGreater(held.updated_at, old)
+        self.assertEqual(other.updated_at, old)
+
+    @override_settings(QUIZ_STREAMING_ENABLED=True)
+    def test_views_refuse_a_bad_question_count_before_creating_a_job(self):
+        with mock.patch.object(jobs, 'submit_generation_job') as submit:
+            for view in ('generate-quiz', 'generate-quiz-stream'):
+                for num_questions in ('abc', '0', '26', ''):
+                    with self.subTest(view=view, num_questions=num_questions):
+                        response = self.client.post(reverse(view), {'url': 'https://example.com/', 'num_questions': num_questions})
+                        self.assertEqual(response.status_code, 400)
+        self.assertFalse(submit.called)
+        self.assertFalse(GenerationJob.objects.exists())
+
+
+_PROSE_WORDS = (
+    "cell membrane protein enzyme energy photosynthesis chlorophyll glucose respiration mitochondria "
+    "nucleus chromosome gene mutation evolution species habitat ecosystem nutrient carbon oxygen"
+).split()
+
+def _prose(num_paragraphs, seed=0, words_per_paragraph=120):
+    """Paragraphs of random biology words, separated by blank lines."""
+    rng = random.Random(seed)
+    return "\n\n".join(
+        " ".join(rng.choice(_PROSE_WORDS) for _ in range(words_per_paragraph)).capitalize() + "."
+        for _ in range(num_paragraphs)
+    )
+
+
+class SectionPlanningTests(SimpleTestCase):
+
+    def test_small_quizzes_from_long_documents_stay_at_one_call(self):
+        text = _prose(180)
+        self.assertGreater(len(text), 130000)
+        for num_questions in (1, 5, 25):
+            with self.subTest(num_questions=num_questions):
+                self.assertEqual(services._section_count(text, num_questions), 1)
+                self.assertFalse(services._use_chunked_generation(text, num_questions))
+
+    @override_settings(QUIZ_TARGET_LATENCY=10, QUIZ_CHUNK_MAX_SECTIONS=6)
+    def test_questions_the_latency_target_starves_are_spread_over_sections(self):
+        text = _prose(300)
+        plan = services._plan_sections(text, 20)
+        # 20 questions are due 30,000 source tokens; the floor lets one prompt carry 8,000.
+        self.assertEqual(len(plan), 4)
+        self.assertEqual(sum(count for _, count in plan), 20)
+        self.assertEqual("".join(section for section, _ in plan), text)
+        self.assertTrue(services._use_chunked_generation(text, 20))
+
+        with override_settings(QUIZ_CHUNKED_GENERATION=False):
+            self.assertFalse(services._use_chunked_generation(text, 20))
+        with override_settings(QUIZ_CHUNK_MAX_SECTIONS=2):
+            self.assertEqual(len(services._plan_sections(text, 20)), 2)
+        # Never more sections than questions.
+        self.assertEqual(len(services._plan_sections(text, 2)), 1)
+
+    @override_settings(QUIZ_CHUNKED_GENERATION=True, QUIZ_PASSAGE_SELECTION=True, QUIZ_PASSAGE_POOL_FACTOR=4, QUESTION_BANK_ENABLED=False)
+    def test_extraction_stops_at_what_the_quiz_can_use(self):
+        # Five questions are due 7,500 source tokens; passages are picked from four times that.
+        self.assertEqual(services.extraction_budget(5), 4 * 7500 * 6)
+        self.assertEqual(services.extraction_budget(100), 500000)
+        with override_settings(QUIZ_PASSAGE_SELECTION=False):
+            self.assertEqual(services.extraction_budget(5), 7500 * 6)
+        with override_settings(QUESTION_BANK_ENABLED=True):
+            self.assertEqual(services.extraction_budget(5), 500000)
+
+    def test_sections_are_cut_at_paragraph_breaks(self):
+        text = _prose(12)
+        sections = services.split_text_into_sections(text, 3)
+        self.assertEqual(len(sections), 3)
+        self.assertEqual("".join(sections), text)
+        for section in sections[1:]:
+            self.assertTrue(section.startswith("\n\n"))
+
+    def test_questions_are_allocated_in_proportion_to_length(self):
+        self.assertEqual(services.allocate_questions([100, 100, 200], 8), [2, 2, 4])
+        self.assertEqual(services.allocate_questions([100, 100, 100], 5), [2, 2, 1])
+        self.assertEqual(services.allocate_questions([1, 1000], 3), [0, 3])
+
+    def test_merge_drops_duplicates_and_stops_at_the_limit(self):
+        first = [{"question": "What is ATP?"}, {"question": "Where is DNA stored?"}]
+        second = [{"question": "what is ATP"}, {"question": "What does an enzyme do?"}, {"question": "What is osmosis?"}]
+        merged = services.merge_questions([first, second], 4)
+        self.assertEqual([q["question"] for q in merged], [
+            "What is ATP?", "Where is DNA stored?", "What does an enzyme do?", "What is osmosis?",
+        ])
+        self.assertEqual(len(services.merge_questions([first, second], 2)), 2)
+
+
+# Section calls run on their own threads and connections.
+@override_settings(QUIZ_TARGET_LATENCY=10, QUIZ_CACHE_ENABLED=False)
+class ChunkedGenerationTests(TransactionTestCase):
+
+    def setUp(self):
+        llm.set_backend(llm.FakeBackend())
+        self.addCleanup(llm.set_backend, None)
+
+    def test_sections_are_generated_and_merged(self):
+        with mock.patch.object(services, '_generate_quiz_with_model', wraps=services._generate_quiz_with_model) as generate:
+            quiz_data = services._generate_quiz_chunked(_prose(300), 20, '')
+        self.assertEqual(len(quiz_data), 20)
+        self.assertEqual(len({services._question_fingerprint(q) for q in quiz_data}), 20)
+        # One call of five questions per section, then a top-up if the sections repeated each other.
+        self.assertEqual([call.args[1] for call in generate.call_args_list[:4]], [5, 5, 5, 5])
+
+    def test_questions_lost_to_deduplication_are_topped_up(self):
+        repeated = [{"question": "What is ATP?", "options": ["a", "b", "c", "d"], "correctAnswer": 0, "explanation": "x"}]
+        real = services._generate_quiz_with_model
+        calls = []
+
+        def generate(text, num_questions, custom_instructions, allow_top_up=True):
+            calls.append(num_questions)
+            if len(calls) <= 4:
+                return repeated * num_questions
+            return real(text, num_questions, custom_instructions, allow_top_up)
+
+        with mock.patch.object(services, '_generate_quiz_with_model', side_effect=generate):
+            quiz_data = services._generate_quiz_chunked(_prose(300), 20, '')
+        self.assertEqual(calls[4:], [19])
+        self.assertEqual(len(quiz_data), 20)
+
+
+@override_settings(QUIZ_CACHE_ENABLED=True, QUIZ_CACHE_TTL=3600, QUIZ_CACHE_MAX_ENTRIES=3, QUESTION_BANK_ENABLED=False)
+class QuizCacheTests(TestCase):
+    TEXT = "Mitochondria produce ATP through cellular respiration. " * 40
+
+    def setUp(self):
+        backend = llm.FakeBackend()
+        self.generate = mock.patch.object(backend, 'generate', wraps=backend.generate).start()
+        self.addCleanup(mock.patch.stopall)
+        llm.set_backend(backend)
+        self.addCleanup(llm.set_backend, None)
+
+    def test_repeat_requests_are_served_from_the_cache(self):
+        first = services.generate_quiz_from_text(self.TEXT, 3, 'Focus on energy')
+        # Whitespace differences do not matter.
+        again = services.generate_quiz_from_text(self.TEXT.replace(". ", ".\n  "), 3, ' Focus on energy ')
+        self.assertEqual(again, first)
+        self.assertEqual(self.generate.call_count, 1)
+        self.assertEqual(QuizCacheEntry.objects.get().hits, 1)
+
+        services.generate_quiz_from_text(self.TEXT, 4, 'Focus on energy')
+        services.generate_quiz_from_text(self.TEXT, 3, 'Focus on enzymes')
+        self.assertEqual(self.generate.call_count, 3)
+
+    def test_expired_entries_are_regenerated(self):
+        services.generate_quiz_from_text(self.TEXT, 3, '')
+        QuizCacheEntry.objects.update(created_at=timezone.now() - timedelta(seconds=3601))
+        services.generate_quiz_from_text(self.TEXT, 3, '')
+        self.assertEqual(self.generate.call_count, 2)
+        self.assertEqual(QuizCacheEntry.objects.get().hits, 0)
+
+    def test_least_recently_used_entries_are_evicted_over_the_cap(self):
+        keys = [f'key-{n}' for n in range(4)]
+        for n, key in enumerate(keys[:3]):
+            services.store_cached_quiz(key, [_question(n)])
+            QuizCacheEntry.objects.filter(key=key).update(last_used_at=timezone.now() - timedelta(minutes=10 - n))
+        # Reading key-0 makes key-1 the least recently used.
+        self.assertIsNotNone(services.get_cached_quiz('key-0'))
+        services.store_cached_quiz(keys[3], [_question(3)])
+        self.assertEqual(set(QuizCacheEntry.objects.values_list('key', flat=True)), {'key-0', 'key-2', 'key-3'})
+
+    def test_disabled_cache_stores_nothing(self):
+        with override_settings(QUIZ_CACHE_ENABLED=False):
+            services.generate_quiz_from_text(self.TEXT, 3, '')
+            services.generate_quiz_from_text(self.TEXT, 3, '')
+        self.assertEqual(self.generate.call_count, 2)
+        self.assertFalse(QuizCacheEntry.objects.exists())
+
+    def test_stats_command(self):
+        services.generate_quiz_from_text(self.TEXT, 3, '')
+        services.generate_quiz_from_text(self.TEXT, 3, '')
+        for cached in (False, True, True, True):
+            GenerationTiming.objects.create(source_type='pdf', num_questions=3, total_seconds=1, cached=cached)
+        GenerationTiming.objects.create(source_type='pdf', num_questions=3, total_seconds=1, succeeded=False)
+
+        out = io.StringIO()
+        call_command('quiz_cache_stats', stdout=out)
+        self.assertIn("Entries: 1 (1 hits served by current entries)", out.getvalue())
+        self.assertIn("Generations (last 7 days): 4, 3 from the cache (hit rate 75.0%)", out.getvalue())
+
+
+class GeminiKeyPoolTests(TestCase):
+
+    def setUp(self):
+        self.backend = llm.GeminiBackend(['key-one', 'key-two'], 'gemini-test', requests_per_minute=10,
+                                         requests_per_day=100, cooldown=60, max_wait=0)
+        self.pool = self.backend.pool
+        self.first, self.second = self.pool.keys
+
+    def usage(self, key):
+        return ApiKeyUsage.objects.get(key_id=key.key_id)
+
+    def test_requests_go_to_the_least_busy_key(self):
+        held = self.pool.acquire()
+        other = self.pool.acquire()
+        self.assertNotEqual(held, other)
+        self.pool.release(held)
+        self.pool.release(other)
+        # Both idle again: the key with more of its minute budget left wins.
+        busier = self.pool.acquire()
+        self.pool.release(busier)
+        self.assertIsNot(self.pool.acquire(), busier)
+
+    def test_quota_error_cools_the_key_down_with_backoff(self):
+        key = self.pool.acquire()
+        self.pool.release(key, quota_error=True)
+        self.assertAlmostEqual((key.cooldown_until - timezone.now()).total_seconds(), 60, delta=5)
+        other = self.pool.acquire()
+        self.assertIsNot(other, key)
+        self.pool.release(other)
+
+        key.cooldown_until = None
+        key.in_flight += 1
+        self.pool.release(key, quota_error=True)
+        self.assertAlmostEqual((key.cooldown_until - timezone.now()).total_seconds(), 120, delta=5)
+
+    def test_usage_and_cooldowns_are_persisted_and_shared(self):
+        key = self.pool.acquire()
+        self.pool.release(key, quota_error=True)
+        self.pool.release(self.pool.acquire())
+
+        usage = self.usage(key)
+        self.assertEqual((usage.requests, usage.quota_errors), (1, 1))
+        self.assertIsNotNone(usage.cooldown_until)
+
+        # Another worker process starting now skips the cooling key.
+        restarted = llm.GeminiBackend(['key-one', 'key-two'], 'gemini-test', requests_per_minute=10,
+                                      requests_per_day=100, cooldown=60, max_wait=0).pool
+        cooling = next(k for k in restarted.keys if k.key_id == key.key_id)
+        self.assertIsNotNone(cooling.cooldown_until)
+        self.assertIsNot(restarted.acquire(), cooling)
+
+    def test_keys_out_of_quota_for_the_day_are_skipped(self):
+        ApiKeyUsage.objects.create(key_id=self.first.key_id, day=timezone.now().date(), requests=100)
+        self.pool._sync_from_db()
+        for _ in range(5):
+            key = self.pool.acquire()
+            self.assertIs(key, self.second)
+            self.pool.release(key)
+
+    def test_waiting_longer_than_max_wait_fails(self):
+        for key in self.pool.keys:
+            key.cooldown_until = timezone.now() + timedelta(minutes=5)
+        with self.assertRaisesMessage(Exception, "used up their quota"):
+            self.pool.acquire()
+
+    def test_calls_move_to_the_next_key_only_on_quota_errors(self):
+        from google.api_core import exceptions as google_exceptions
+
+        def request(client):
+            if client is self.first.client:
+                raise google_exceptions.ResourceExhausted("Quota exceeded")
+            return 'answer'
+
+        for _ in range(3):
+            self.assertEqual(self.backend._call(request), 'answer')
+        self.assertTrue(self.first.is_cooling_down(timezone.now()))
+        self.assertEqual(self.usage(self.first).quota_errors, 1)
+
+        self.first.cooldown_until = None
+        failing = mock.Mock(side_effect=google_exceptions.InternalServerError("quota service unavailable"))
+        with self.assertRaises(google_exceptions.InternalServerError):
+            self.backend._call(failing)
+        self.assertEqual(failing.call_count, 1)
+        self.assertFalse(any(key.is_cooling_down(timezone.now()) for key in self.pool.keys))
+
+    def test_is_quota_error(self):
+        from google.api_core import exceptions as google_exceptions
+        self.assertTrue(llm.is_quota_error(google_exceptions.ResourceExhausted("x")))
+        self.assertTrue(llm.is_quota_error(google_exceptions.TooManyRequests("x")))
+        self.assertTrue(llm.is_quota_error(SimpleNamespace(status_code=429)))
+        self.assertFalse(llm.is_quota_error(google_exceptions.InternalServerError("quota exceeded")))
+        self.assertFalse(llm.is_quota_error(ValueError("HTTP 429 rate limit")))
+        self.assertFalse(llm.is_quota_error(Exception("Document mentions 4290 quota items")))
+
+
+@override_settings(QUIZ_CACHE_ENABLED=False, QUIZ_SINGLE_FLIGHT_TIMEOUT=10)
+class SingleFlightTests(SimpleTestCase):
+    """Identical requests in one process share the leader's call."""
+
+    def run_together(self, call, waiters=3):
+        """Start a leader, then `waiters` identical calls once it is in flight; returns their outcomes."""
+        release = threading.Event()
+        joined = threading.Semaphore(0)
+        real_wait = coalescing._wait_for_flight
+
+        def wait_for_flight(flight):
+            joined.release()
+            return real_wait(flight)
+
+        outcomes = {}
+
+        def run(name):
+            try:
+                outcomes[name] = ('result', call(release))
+            except Exception as e:
+                outcomes[name] = ('error', e)
+
+        with mock.patch.object(coalescing, '_wait_for_flight', side_effect=wait_for_flight):
+            leader = threading.Thread(target=run, args=('leader',))
+            leader.start()
+            while 'key' not in coalescing._flights:
+                threading.Event().wait(0.001)
+            threads = [threading.Thread(target=run, args=(n,)) for n in range(waiters)]
+            for thread in threads:
+                thread.start()
+            for _ in threads:
+                self.assertTrue(joined.acquire(timeout=5))
+            release.set()
+            for thread in [leader] + threads:
+                thread.join(5)
+        self.assertNotIn('key', coalescing._flights)
+        return outcomes
+
+    def test_waiters_share_the_leaders_result(self):
+        generate = mock.Mock(return_value=[{'question': 'Q1'}])
+
+        def call(release):
+            def work():
+                release.wait(5)
+                return generate()
+            return coalescing.run_single_flight('key', work, lambda: None)
+
+        outcomes = self.run_together(call)
+        self.assertEqual(generate.call_count, 1)
+        results = [result for kind, result in outcomes.values() if kind == 'result']
+        self.assertEqual(results, [[{'question': 'Q1'}]] * 4)
+        # Each caller gets its own copy.
+        self.assertEqual(len({id(result) for result in results}), 4)
+
+    def test_the_leaders_error_reaches_every_waiter(self):
+        generate = mock.Mock(side_effect=Exception("model unavailable"))
+
+        def call(release):
+            def work():
+                release.wait(5)
+                return generate()
+            return coalescing.run_single_flight('key', work, lambda: None)
+
+        outcomes = self.run_together(call)
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual({str(error) for kind, error in outcomes.values()}, {"model unavailable"})
+        self.assertEqual({kind for kind, _ in outcomes.values()}, {'error'})
+
+    def test_streaming_waiters_get_the_complete_result(self):
+        stream = mock.Mock(side_effect=lambda: iter(['Q1', 'Q2', 'Q3']))
+
+        def call(release):
+            def work():
+                release.wait(5)
+                return stream()
+            return list(coalescing.run_single_flight_stream('key', work, lambda: None))
+
+        outcomes = self.run_together(call, waiters=2)
+        self.assertEqual(stream.call_count, 1)
+        self.assertEqual([result for _, result in outcomes.values()], [['Q1', 'Q2', 'Q3']] * 3)
+
+
+@override_settings(QUIZ_CACHE_ENABLED=True, QUIZ_SINGLE_FLIGHT_TIMEOUT=60)
+class CrossProcessSingleFlightTests(TestCase):
+    """Other worker processes are coordinated through a lock row and the shared cache."""
+
+    def setUp(self):
+        patcher = mock.patch.object(coalescing, 'POLL_INTERVAL', 0.001)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_waits_for_the_process_holding_the_lock(self):
+        GenerationLock.objects.create(key='key')
+        read_result = mock.Mock(side_effect=[None, None, ['Q1']])
+        generate = mock.Mock()
+        self.assertEqual(coalescing.run_single_flight('key', generate, read_result), ['Q1'])
+        self.assertFalse(generate.called)
+
+    def test_generates_itself_when_the_other_process_failed(self):
+        GenerationLock.objects.create(key='key')
+        read_result = mock.Mock(return_value=None)
+
+        def lock_released(*args, **kwargs):
+            GenerationLock.objects.filter(key='key').delete()
+            return None
+
+        read_result.side_effect = lock_released
+        generate = mock.Mock(return_value=['Q1'])
+        self.assertEqual(coalescing.run_single_flight('key', generate, read_result), ['Q1'])
+        self.assertEqual(generate.call_count, 1)
+
+    def test_a_dead_workers_lock_is_taken_over(self):
+        GenerationLock.objects.create(key='key', created_at=timezone.now() - timedelta(seconds=61))
+        generate = mock.Mock(return_value=['Q1'])
+        self.assertEqual(coalescing.run_single_flight('key', generate, mock.Mock(return_value=None)), ['Q1'])
+        self.assertEqual(generate.call_count, 1)
+        # Released once the result is in.
+        self.assertFalse(GenerationLock.objects.exists())
+
+
+def _vocabulary_text(num_words, seed=0):
+    """Text of `num_words` distinct made-up words, so fake quizzes rarely repeat a question."""
+    rng = random.Random(seed)
+    words = {"".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(8)) for _ in range(num_words)}
+    words = sorted(words)
+    return "\n\n".join(" ".join(words[i:i + 50]) + "." for i in range(0, len(words), 50))
+
+
+# Batches are generated on their own threads and connections.
+@override_settings(QUESTION_BANK_ENABLED=True, QUESTION_BANK_SIZE=20, QUESTION_BANK_BATCH_SIZE=10, QUIZ_CACHE_ENABLED=False)
+class QuestionBankTests(TransactionTestCase):
+    TEXT = _vocabulary_text(2000)
+
+    def setUp(self):
+        backend = llm.FakeBackend()
+        self.model_calls = mock.patch.object(backend, 'generate', wraps=backend.generate).start()
+        self.addCleanup(mock.patch.stopall)
+        llm.set_backend(backend)
+        self.addCleanup(llm.set_backend, None)
+
+    def quiz(self, owner, num_questions=5):
+        return services.generate_quiz_from_text(self.TEXT, num_questions, '', owner_key=owner)
+
+    def bank(self):
+        return QuestionBank.objects.get()
+
+    def test_first_request_fills_the_bank_in_batches(self):
+        quiz_data = self.quiz('user:1')
+        self.assertEqual(len(quiz_data), 5)
+        self.assertEqual(self.model_calls.call_count, 2)
+        self.assertEqual(len(self.bank().questions), 20)
+        self.assertEqual(len(QuestionBankDraw.objects.get(owner_key='user:1').served), 5)
+
+    def test_later_requests_sample_unseen_questions_without_calling_the_model(self):
+        asked = []
+        for _ in range(4):
+            asked += [question['question'] for question in self.quiz('user:1')]
+        self.assertEqual(self.model_calls.call_count, 2)
+        self.assertEqual(len(set(asked)), 20)
+
+        # Someone else starts over on the same bank.
+        self.assertEqual(len(self.quiz('user:2', 10)), 10)
+        self.assertEqual(self.model_calls.call_count, 2)
+
+    def test_bank_is_refilled_when_too_few_unseen_questions_are_left(self):
+        self.quiz('user:1', 18)
+        self.quiz('user:1', 5)
+        # Two unseen left for five requested, and the bank is full: one batch of the missing three.
+        self.assertEqual(self.model_calls.call_count, 3)
+        self.assertEqual(len(self.bank().questions), 23)
+        self.assertEqual(len(set(QuestionBankDraw.objects.get(owner_key='user:1').served)), 23)
+
+    def test_repeated_questions_are_not_added_twice(self):
+        self.quiz('user:1', 5)
+        existing = self.bank().questions
+        repeat = [dict(question, question=question['question'].upper() + "?") for question in existing[:4]]
+        with mock.patch.object(services, '_generate_bank_batch', return_value=repeat + [_question(99)]):
+            services._refill_question_bank(self.bank().key, self.TEXT, '', 5)
+        self.assertEqual(len(self.bank().questions), 21)
+
+    def test_refill_fails_when_every_batch_fails(self):
+        with mock.patch.object(services, '_generate_bank_batch', side_effect=Exception("model unavailable")):
+            with self.assertRaisesMessage(Exception, "model unavailable"):
+                self.quiz('user:1')
+
+    def test_anonymous_requests_without_a_session_skip_the_bank(self):
+        self.assertEqual(len(services.generate_quiz_from_text(self.TEXT, 5, '', owner_key=None)), 5)
+        self.assertFalse(QuestionBank.objects.exists())
+
+    def test_parallel_batches_get_disjoint_sections(self):
+        sections = services._bank_sections(self.TEXT, 3)
+        self.assertEqual(len(sections), 3)
+        passages = [set(section.split("\n\n")) for section in sections]
+        self.assertFalse(passages[0] & passages[1] or passages[1] & passages[2] or passages[0] & passages[2])
+
+
+_TOPICS = [
+    "chlorophyll absorbs light photon pigment thylakoid membrane excitation".split(),
+    "glucose carbon dioxide fixation stroma sugar starch calvin".split(),
+    "oxygen water splitting electron transport proton gradient synthase".split(),
+]
+
+def _topic_paragraph(rng, topic, extra=()):
+    """About 1,300 characters on one topic, so each paragraph is a passage of its own."""
+    words = [rng.choice(_TOPICS[topic]) for _ in range(150)] + list(extra)
+    rng.shuffle(words)
+    return " ".join(words).capitalize() + "."
+
+
+class PassageSelectionTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.core = [_topic_paragraph(rng, n % 3) for n in range(9)]
+        self.contents = "\n".join(f"{n}.{m} Section {n}{m} .......... {n * 10 + m}" for n in range(1, 4) for m in range(1, 6))
+        self.thanks = ("We thank our funding agency, the department secretary, colleagues and reviewers "
+                       "for their generous support, patience and encouragement during the writing process.")
+        self.rubisco = _topic_paragraph(rng, 0, extra=["rubisco"] * 3)
+
+    def test_passages_stay_near_the_target_size(self):
+        text = "\n\n".join(["Short paragraph."] * 30 + [_topic_paragraph(random.Random(1), 0) * 2])
+        passages = split_into_passages(text, target_chars=300)
+        self.assertEqual(passages[0], "\n".join(["Short paragraph."] * 17))
+        self.assertTrue(all(len(passage) <= 600 for passage in passages))
+        # Text without blank lines is split at its lines instead.
+        self.assertEqual(split_into_passages("one line\nanother line", target_chars=10), ["one line", "another line"])
+
+    def test_core_vocabulary_outranks_contents_and_front_matter(self):
+        passages = [self.contents, self.thanks] + self.core
+        scores = score_passages(passages)
+        self.assertLess(scores[0], min(scores[2:]))
+        self.assertLess(scores[1], min(scores[2:]))
+
+    def test_query_terms_are_boosted(self):
+        passages = self.core + [self.rubisco]
+        self.assertNotEqual(int(score_passages(passages).argmax()), len(passages) - 1)
+        self.assertEqual(int(score_passages(passages, "Focus on RuBisCO").argmax()), len(passages) - 1)
+
+    def test_selection_fits_the_budget_and_keeps_document_order(self):
+        passages = [self.contents, self.thanks] + self.core
+        text = "\n\n".join(passages)
+        # The contents and the acknowledgements are short enough to share a passage.
+        self.assertEqual(split_into_passages(text), [self.contents + "\n" + self.thanks] + self.core)
+        budget = 3 * max(len(passage) + 2 for passage in self.core)
+        selected = select_passages(text, budget)
+        self.assertLessEqual(len(selected), budget)
+        chosen = selected.split("\n\n")
+        self.assertEqual(len(chosen), 3)
+        self.assertTrue(set(chosen) <= set(self.core))
+        self.assertEqual(chosen, sorted(chosen, key=passages.index))
+
+    def test_short_text_is_returned_whole(self):
+        self.assertEqual(select_passages("Light drives photosynthesis.", 1000), "Light drives photosynthesis.")
+
+
+@override_settings(
+    QUIZ_TARGET_LATENCY=30, QUIZ_SOURCE_TOKENS_PER_QUESTION=1500, QUIZ_MIN_SOURCE_TOKENS_PER_QUESTION=400,
+    QUIZ_MAX_SOURCE_TOKENS=60000, QUIZ_OUTPUT_TOKENS_PER_QUESTION=90, QUIZ_MODEL_CONTEXT_TOKENS=1048576,
+    QUIZ_MODEL_INPUT_TOKENS_PER_SECOND=5000, QUIZ_MODEL_OUTPUT_TOKENS_PER_SECOND=120, QUIZ_MODEL_REQUEST_OVERHEAD=1.5,
+)
+class PromptBudgetTests(SimpleTestCase):
+    DOCUMENT = _prose(400)
+
+    def test_token_estimates(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("The cell is small."), 5)
+        # Letters beyond the sixth split off every four; digits go three at a time.
+        self.assertEqual(estimate_tokens("photosynthesis"), 3)
+        self.assertEqual(estimate_tokens("1234567"), 3)
+        # Long texts are sampled, and still land close to the full count.
+        full = budget_module._count_tokens(self.DOCUMENT)
+        self.assertAlmostEqual(estimate_tokens(self.DOCUMENT) / full, 1, delta=0.02)
+
+    def test_the_deciding_constraint(self):
+        cases = [
+            # (num_questions, settings, limited_by, source_tokens)
+            (5, {}, 'questions', 7500),
+            (10, {'QUIZ_TARGET_LATENCY': 10}, 'latency', 5000),
+            (20, {'QUIZ_TARGET_LATENCY': 10}, 'floor', 8000),
+            (5, {'QUIZ_MAX_SOURCE_TOKENS': 2000}, 'context', 2000),
+        ]
+        for num_questions, overrides, limited_by, source_tokens in cases:
+            with self.subTest(limited_by=limited_by), override_settings(**overrides):
+                budget = plan_prompt_budget(self.DOCUMENT, num_questions)
+                self.assertEqual((budget.limited_by, budget.source_tokens), (limited_by, source_tokens))
+                self.assertTrue(budget.truncated)
+                self.assertAlmostEqual(budget.source_chars / len(self.DOCUMENT), source_tokens / budget.document_tokens, places=3)
+
+    def test_latency_limited_prompts_meet_the_target(self):
+        with override_settings(QUIZ_TARGET_LATENCY=10):
+            budget = plan_prompt_budget(self.DOCUMENT, 10, fixed_prompt="Write a quiz. " * 50)
+        self.assertEqual(budget.limited_by, 'latency')
+        self.assertAlmostEqual(budget.expected_latency, 10, delta=0.01)
+        self.assertEqual(budget.prompt_tokens, 5000)
+
+    def test_short_documents_go_in_whole(self):
+        budget = plan_prompt_budget("Light drives photosynthesis.", 5)
+        self.assertEqual(budget.limited_by, 'document')
+        self.assertFalse(budget.truncated)
+        self.assertEqual(budget.source_chars, len("Light drives photosynthesis."))
+
+    def test_compact_output_leaves_more_room_for_source_text(self):
+        with override_settings(QUIZ_TARGET_LATENCY=10):
+            verbose = plan_prompt_budget(self.DOCUMENT, 10)
+            compact = plan_prompt_budget(self.DOCUMENT, 10, compact=True)
+        self.assertLess(compact.output_tokens, verbose.output_tokens)
+        self.assertGreater(compact.source_tokens, verbose.source_tokens)
+
+    def test_extraction_bound_covers_what_a_prompt_uses(self):
+        for num_questions in (1, 5, 25):
+            with self.subTest(num_questions=num_questions):
+                budget = plan_prompt_budget(self.DOCUMENT, num_questions)
+                self.assertGreaterEqual(max_source_chars(num_questions), budget.source_chars)
+                # Text extracted only up to the bound still fills the prompt.
+                extracted = self.DOCUMENT[:max_source_chars(num_questions)]
+                self.assertEqual(plan_prompt_budget(extracted, num_questions).source_tokens, budget.source_tokens)
+
+
+@override_settings(QUIZ_CACHE_ENABLED=False, QUESTION_BANK_ENABLED=False)
+class PromptBudgetRecordTests(TestCase):
+
+    def test_each_model_call_is_recorded_with_its_usage(self):
+        llm.set_backend(llm.FakeBackend(output_tokens_per_question=80))
+        self.addCleanup(llm.set_backend, None)
+        services.generate_quiz_from_text(_prose(200), 5, '')
+
+        record = PromptBudgetRecord.objects.get()
+        self.assertEqual((record.num_questions, record.limited_by, record.output_tokens), (5, 'questions', 400))
+        self.assertGreater(record.input_tokens, record.source_tokens)
+        self.assertIsNotNone(record.duration)
+
+
+def _true_latency(source_type, num_questions, text_chars):
+    return 5 + 2 * text_chars / 10000 + 1.5 * num_questions + (3 if source_type == 'ppt' else 0)
+
+
+@override_settings(LATENCY_MODEL_MIN_SAMPLES=20, LATENCY_MODEL_DECAY=1.0)
+class LatencyModelTests(TestCase):
+
+    def record(self, source_type, num_questions, text_chars, total_seconds=None, source_bytes=None, **fields):
+        if total_seconds is None:
+            total_seconds = _true_latency(source_type, num_questions, text_chars)
+        timing = GenerationTiming.objects.create(
+            source_type=source_type, num_questions=num_questions, text_chars=text_chars,
+            source_bytes=source_bytes, total_seconds=total_seconds, **fields,
+        )
+        telemetry.update_latency_model(timing)
+        return timing
+
+    def train(self, samples=60, seed=0, scale=1.0):
+        rng = random.Random(seed)
+        for _ in range(samples):
+            source_type = rng.choice(['pdf', 'ppt', 'url'])
+            num_questions = rng.randint(1, 25)
+            text_chars = rng.randint(1000, 100000)
+            noise = rng.uniform(-0.5, 0.5)
+            self.record(source_type, num_questions, text_chars, scale * _true_latency(source_type, num_questions, text_chars) + noise)
+
+    def test_fixed_estimate_until_enough_samples(self):
+        self.train(samples=19)
+        self.assertEqual(
+            telemetry.predict_generation_time('pdf', 10, text_chars=20000),
+            telemetry.fixed_generation_estimate(20000, 10),
+        )
+
+    def test_predictions_follow_the_fitted_model(self):
+        self.train()
+        for source_type, num_questions, text_chars in (('pdf', 10, 20000), ('ppt', 5, 50000), ('url', 25, 8000)):
+            with self.subTest(source_type=source_type):
+                low, high = telemetry.predict_generation_time(source_type, num_questions, text_chars=text_chars)
+                expected = _true_latency(source_type, num_questions, text_chars)
+                self.assertLessEqual(low, expected)
+                self.assertGreaterEqual(high, expected)
+                self.assertLessEqual(high - low, 3)
+
+    def test_cached_and_failed_generations_are_not_fitted(self):
+        self.train(samples=20)
+        state = LatencyModelState.objects.get()
+        self.record('pdf', 5, 10000, total_seconds=0.1, cached=True)
+        self.record('pdf', 5, 10000, total_seconds=900, succeeded=False)
+        after = LatencyModelState.objects.get()
+        self.assertEqual((after.samples, after.xty), (state.samples, state.xty))
+        # The cache hit still says how much text a PDF holds.
+        self.assertEqual(after.source_stats['pdf']['count'], state.source_stats['pdf']['count'] + 1)
+
+    def test_text_length_is_estimated_from_the_file_size(self):
+        self.record('pdf', 5, 40000, source_bytes=2000000)
+        self.record('pdf', 5, 20000, source_bytes=1000000)
+        state = LatencyModelState.objects.get()
+        self.assertEqual(telemetry._estimate_text_chars(state, 'pdf', 500000), 10000)
+        # Unseen source types fall back to the old fixed ratios.
+        self.assertEqual(telemetry._estimate_text_chars(state, 'ppt', 500000), 5000)
+        self.assertEqual(telemetry._estimate_text_chars(state, 'url', None), 10000)
+
+    @override_settings(LATENCY_MODEL_DECAY=0.9)
+    def test_old_samples_fade_out(self):
+        self.train(samples=60, scale=3.0)
+        self.train(samples=60, seed=1)
+        low, high = telemetry.predict_generation_time('pdf', 10, text_chars=20000)
+        # The model sped up threefold; the old samples alone would predict about 72 seconds.
+        self.assertLessEqual(low, _true_latency('pdf', 10, 20000))
+        self.assertLess(high, 1.5 * _true_latency('pdf', 10, 20000))
+
+    def test_finished_generations_feed_the_model(self):
+        timer = telemetry.GenerationTimer('pdf', 5, source_bytes=1000)
+        timer.text_chars = 12000
+        with timer.stage('generate'):
+            pass
+        timer.finish()
+        timing = GenerationTiming.objects.get()
+        self.assertEqual((timing.num_questions, timing.text_chars, timing.succeeded), (5, 12000, True))
+        self.assertEqual(LatencyModelState.objects.get().samples, 1)
+
+    def test_estimate_view(self):
+        self.train()
+        response = self.client.get(reverse('estimate-time'), {'source_type': 'url', 'num_questions': 25})
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(response.json()['min_seconds'], response.json()['max_seconds'])
+        for params in ({'source_type': 'doc'}, {'num_questions': 'many'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse('estimate-time'), params).status_code, 400)
+
+
+def _pdf_page_texts(num_pages, seed=0):
+    rng = random.Random(seed)
+    return [f"Page {n + 1}. " + " ".join(rng.choice(_PROSE_WORDS) for _ in range(140)) for n in range(num_pages)]
+
+def _pdf_file(test, pages):
+    """Write a PDF of `pages` to a temp file removed after `test`; returns its path."""
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(_pdf_bytes(pages))
+    test.addCleanup(os.remove, path)
+    return path
+
+
+class LazyPdfExtractionTests(SimpleTestCase):
+
+    def setUp(self):
+        self.path = _pdf_file(self, _pdf_page_texts(20))
+        with fitz.open(self.path) as pdf:
+            self.expected = [page.get_text() for page in pdf]
+
+    def upload(self):
+        fh = open(self.path, 'rb')
+        self.addCleanup(fh.close)
+        return File(fh, name='notes.pdf')
+
+    def test_whole_document(self):
+        self.assertEqual(pdf_extraction.extract_pdf_pages(self.upload()), self.expected)
+        with open(self.path, 'rb') as fh:
+            self.assertEqual(pdf_extraction.extract_pdf_pages(SimpleUploadedFile('notes.pdf', fh.read())), self.expected)
+
+    def test_extraction_stops_at_the_budget(self):
+        budget = len(self.expected[0]) + len(self.expected[1]) + 100
+        loaded = []
+        load_page = fitz.Document.load_page
+
+        def counting_load_page(document, number):
+            loaded.append(number)
+            return load_page(document, number)
+
+        with mock.patch.object(fitz.Document, 'load_page', counting_load_page):
+            pages = pdf_extraction.extract_pdf_pages(self.upload(), max_chars=budget)
+        self.assertEqual(loaded, [0, 1, 2])
+        self.assertEqual(pages, self.expected[:2] + [self.expected[2][:100]])
+        self.assertEqual(sum(len(page) for page in pages), budget)
+
+    def test_in_memory_uploads_are_read_in_place(self):
+        with open(self.path, 'rb') as fh:
+            upload = SimpleUploadedFile('notes.pdf', fh.read())
+        self.assertIsNone(pdf_extraction.upload_path(upload))
+        self.assertEqual(pdf_extraction.extract_pdf_text(upload, max_chars=50), self.expected[0][:50])
+
+    def test_uploads_on_disk_are_opened_from_their_path(self):
+        upload = self.upload()
+        self.assertEqual(pdf_extraction.upload_path(upload), self.path)
+        self.assertEqual(pdf_extraction.extract_pdf_pages(upload, max_chars=10), [self.expected[0][:10]])
+
+
+class ParallelPdfExtractionTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.addClassCleanup(pdf_extraction._reset_pool)
+
+    def setUp(self):
+        self.path = _pdf_file(self, _pdf_page_texts(30))
+
+    def extract(self, **kwargs):
+        with open(self.path, 'rb') as fh:
+            return pdf_extraction.extract_pdf_pages(File(fh, name='notes.pdf'), **kwargs)
+
+    def test_parallel_pages_match_the_serial_ones(self):
+        serial = self.extract()
+        self.assertEqual(len(serial), 30)
+        parallel = pdf_extraction.extract_pdf_pages_parallel(self.path, 30, workers=2, pages_per_task=4)
+        self.assertEqual(parallel, serial)
+
+        budget = sum(len(page) for page in serial[:11]) + 7
+        self.assertEqual(
+            pdf_extraction.extract_pdf_pages_parallel(self.path, 30, workers=2, max_chars=budget, pages_per_task=4),
+            self.extract(max_chars=budget),
+        )
+
+    def test_only_long_files_use_the_pool(self):
+        with mock.patch.object(pdf_extraction, 'extract_pdf_pages_parallel', return_value=['from the pool']) as parallel:
+            self.assertEqual(self.extract(workers=2, parallel_min_pages=30), ['from the pool'])
+            self.assertEqual(len(self.extract(workers=2, parallel_min_pages=31)), 30)
+            self.assertEqual(len(self.extract(workers=1, parallel_min_pages=1)), 30)
+        self.assertEqual(parallel.call_count, 1)
+
+    def test_pool_failures_fall_back_to_serial(self):
+        serial = self.extract()
+        with mock.patch.object(pdf_extraction, 'extract_pdf_pages_parallel', side_effect=OSError("pool broken")), \
+                mock.patch.object(pdf_extraction, '_reset_pool') as reset:
+            self.assertEqual(self.extract(workers=2, parallel_min_pages=1), serial)
+        self.assertTrue(reset.called)
+
+
+_ENDOFCHAIN = 0xFFFFFFFE
+_FATSECT = 0xFFFFFFFD
+_FREESECT = 0xFFFFFFFF
+
+def _ole_file(name, data, order=None):
+    """
+    A version 3 compound file (512-byte sectors) holding one stream of at
+    least 4 KB, so it lives in the FAT. `order` maps each of the stream's
+    sectors to its place on disk, to lay the chain out of sequence.
+    """
+    sector_size = 512
+    num_data = -(-len(data) // sector_size)
+    order = list(range(num_data)) if order is None else order
+    num_fat = 1
+    while num_fat * 128 < num_fat + 1 + num_data:
+        num_fat += 1
+    first_data = num_fat + 1
+
+    fat = [_FREESECT] * (num_fat * 128)
+    for n in range(num_fat):
+        fat[n] = _FATSECT
+    fat[num_fat] = _ENDOFCHAIN
+    placed = [first_data + position for position in order]
+    for current, following in zip(placed, placed[1:] + [_ENDOFCHAIN]):
+        fat[current] = following
+
+    def entry(entry_name, entry_type, child, start, size):
+        encoded = entry_name.encode('utf-16le') + b"\x00\x00"
+        return (encoded.ljust(64, b"\x00") + struct.pack('<HBB3I', len(encoded), entry_type, 1, _FREESECT, _FREESECT, child)
+                + bytes(36) + struct.pack('<IQ', start, size))
+
+    directory = (entry("Root Entry", 5, 1, _ENDOFCHAIN, 0) + entry(name, 2, _FREESECT, placed[0], len(data))
+                 + (bytes(64) + struct.pack('<HBB3I', 0, 0, 0, _FREESECT, _FREESECT, _FREESECT) + bytes(48)) * 2)
+    difat = list(range(num_fat)) + [_FREESECT] * (109 - num_fat)
+    header = (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + bytes(16) + struct.pack('<HHHHH', 0x3E, 3, 0xFFFE, 9, 6) + bytes(6)
+              + struct.pack('<10I', 0, num_fat, num_fat, 0, 4096, _ENDOFCHAIN, 0, _ENDOFCHAIN, 0, difat[0])
+              + struct.pack('<108I', *difat[1:]))
+
+    sectors = [None] * (first_data + num_data)
+    fat_bytes = struct.pack(f'<{len(fat)}I', *fat)
+    for n in range(num_fat):
+        sectors[n] = fat_bytes[n * sector_size:(n + 1) * sector_size]
+    sectors[num_fat] = directory
+    for index, position in enumerate(order):
+        sectors[first_data + position] = data[index * sector_size:(index + 1) * sector_size].ljust(sector_size, b"\x00")
+    return header + b"".join(sectors)
+
+
+class OleStreamReaderTests(SimpleTestCase):
+
+    def setUp(self):
+        self.records = build_record_stream(12, seed=3, picture_bytes=3000)
+        num_sectors = -(-len(self.records) // 512)
+        self.scattered = list(range(num_sectors))
+        random.Random(0).shuffle(self.scattered)
+
+    def open(self, data):
+        return olefile.OleFileIO(io.BufferedReader(_Unbuffered(data)))
+
+    def test_stream_bytes_match_olefile(self):
+        for order in (None, self.scattered):
+            with self.subTest(scattered=order is not None):
+                ole = self.open(_ole_file('PowerPoint Document', self.records, order))
+                stream = open_ole_stream(ole, 'powerpoint document')
+                self.assertIsInstance(stream, OleStreamReader)
+                pieces = []
+                for size in itertools.cycle([1, 100, 511, 4096]):
+                    piece = stream.read(size)
+                    if not piece:
+                        break
+                    pieces.append(piece)
+                self.assertEqual(b"".join(pieces), self.records)
+                self.assertEqual(b"".join(pieces), ole.openstream('PowerPoint Document').read())
+
+    def test_legacy_extraction_walks_the_file(self):
+        data = _ole_file('PowerPoint Document', self.records, self.scattered)
+        expected = slice_and_unpack_walk(self.records)
+        with mock.patch.object(olefile.OleFileIO, 'openstream', side_effect=AssertionError("stream read whole")):
+            text = services.extract_text_from_ppt_legacy(SimpleUploadedFile('deck.ppt', data))
+        self.assertEqual(text, "\n".join(expected))
+
+    def test_truncated_file_is_an_error(self):
+        data = _ole_file('PowerPoint Document', self.records)
+        with self.assertRaises(Exception):
+            services.extract_text_from_ppt_legacy(SimpleUploadedFile('deck.ppt', data[:len(data) // 2]))
+
+
+def _saved(presentation):
+    deck = io.BytesIO()
+    presentation.save(deck)
+    return deck.getvalue()
+
+
+class PptxExtractionTests(SimpleTestCase):
+
+    def test_text_matches_python_pptx(self):
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                deck = build_deck(6, images_per_slide=1, seed=seed)
+                self.assertEqual(extract_pptx_text(io.BytesIO(deck)), services.extract_text_from_pptx_object_model(io.BytesIO(deck)))
+
+    def test_slides_follow_the_presentation_order(self):
+        presentation = Presentation(io.BytesIO(build_deck(4, images_per_slide=0)))
+        # Move the last slide to the front; its part keeps its name.
+        slide_ids = presentation.slides._sldIdLst
+        slide_ids.insert(0, slide_ids[-1])
+        slides = extract_pptx_slides(io.BytesIO(_saved(presentation)))
+        self.assertEqual([slide.split("\n")[0].split(":")[0] for slide in slides], ["Slide 4", "Slide 1", "Slide 2", "Slide 3"])
+
+    def test_line_breaks_tables_and_notes(self):
+        presentation = Presentation()
+        slide = presentation.slides.add_slide(presentation.slide_layouts[5])
+        slide.shapes.title.text = "Le Chatelier\vprinciple"
+        table = slide.shapes.add_table(2, 2, Inches(1), Inches(2), Inches(4), Inches(1)).table
+        table.cell(1, 1).text = "exothermic shift"
+        slide.notes_slide.notes_text_frame.text = "Mention the Haber process."
+        deck = _saved(presentation)
+
+        self.assertEqual(services.extract_text_from_pptx_object_model(io.BytesIO(deck)), "Le Chatelier\vprinciple")
+        text = extract_pptx_text(io.BytesIO(deck))
+        self.assertTrue(text.startswith("Le Chatelier\vprinciple"))
+        self.assertIn("exothermic shift", text)
+        self.assertNotIn("Haber", text)
+        self.assertTrue(extract_pptx_text(io.BytesIO(deck), include_notes=True).endswith("Mention the Haber process."))
+
+    def test_uploads_are_routed_to_the_xml_reader(self):
+        deck = build_deck(3, images_per_slide=0)
+        with mock.patch.object(services, 'Presentation', side_effect=AssertionError("object model used")):
+            slides = services.extract_slides_from_ppt(SimpleUploadedFile('deck.pptx', deck))
+        self.assertEqual(len(slides), 3)
+
+    def test_packages_without_slides_fall_back_to_python_pptx(self):
+        deck = _saved(Presentation())
+        with mock.patch.object(services, 'extract_text_from_pptx_object_model', return_value="fallback") as object_model:
+            self.assertEqual(services.extract_slides_from_ppt(SimpleUploadedFile('empty.pptx', deck)), ["fallback"])
+        self.assertTrue(object_model.called)
+
+
+class _PageHandler(BaseHTTPRequestHandler):
+    """Serves `server.pages` ({path: (body, headers)}), answering a matching If-None-Match with 304."""
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        if self.path not in self.server.pages:
+            self.send_error(404)
+            return
+        body, headers = self.server.pages[self.path]
+        etag = headers.get('ETag')
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _read_all(chunks, max_chars, encoding):
+    """An extractor that keeps the raw body, to see exactly what was downloaded."""
+    return b"".join(chunks).decode(encoding or 'utf-8')[:max_chars]
+
+
+class UrlFetchingTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _PageHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        self.server.pages = {}
+        self.server.requests = []
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(
+            URL_CACHE_ENABLED=True, URL_CACHE_DIR=cache_dir.name, URL_CACHE_FRESH_SECONDS=600,
+            URL_CACHE_MAX_ENTRIES=1000, URL_FETCH_MAX_BYTES=5 * 1024 * 1024,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def serve(self, path, body, **headers):
+        self.server.pages[path] = (body, headers)
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def fetch(self, url, max_chars=None):
+        extract = mock.Mock(side_effect=_read_all)
+        return url_fetching.fetch_text(url, extract, max_chars=max_chars), extract
+
+    def test_downloads_stop_at_the_size_cap(self):
+        url = self.serve('/big', b"x" * 200000)
+        with override_settings(URL_FETCH_MAX_BYTES=1000):
+            text, _ = self.fetch(url)
+        self.assertEqual(text, "x" * 1000)
+
+        chunks = [b"a" * 300, b"b" * 300, b"c" * 300]
+        response = SimpleNamespace(iter_content=lambda size: iter(chunks))
+        self.assertEqual(b"".join(url_fetching.iter_body(response, 700)), b"a" * 300 + b"b" * 300 + b"c" * 100)
+        self.assertEqual(b"".join(url_fetching.iter_body(response, 600)), b"a" * 300 + b"b" * 300)
+
+    def test_fresh_entries_are_reused_without_a_request(self):
+        url = self.serve('/page', b"<p>Osmosis</p>", ETag='"v1"')
+        self.assertEqual(self.fetch(url)[0], "<p>Osmosis</p>")
+        text, extract = self.fetch(url)
+        self.assertEqual(text, "<p>Osmosis</p>")
+        self.assertFalse(extract.called)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stale_entries_are_revalidated_with_their_etag(self):
+        url = self.serve('/page', b"<p>Osmosis</p>", ETag='"v1"', **{'Cache-Control': 'max-age=0'})
+        self.fetch(url)
+        text, extract = self.fetch(url)
+        self.assertEqual(text, "<p>Osmosis</p>")
+        self.assertFalse(extract.called)
+        self.assertEqual(self.server.requests[1][1].get('If-None-Match'), '"v1"')
+
+        # The page changed: its new text replaces the cached one.
+        self.serve('/page', b"<p>Diffusion</p>", ETag='"v2"', **{'Cache-Control': 'max-age=0'})
+        self.assertEqual(self.fetch(url)[0], "<p>Diffusion</p>")
+        self.assertEqual(self.fetch(url)[0], "<p>Diffusion</p>")
+        self.assertEqual(self.server.requests[-1][1].get('If-None-Match'), '"v2"')
+
+    def test_text_cut_short_is_not_reused_for_a_larger_budget(self):
+        url = self.serve('/page', b"abcdefghij" * 10, ETag='"v1"')
+        self.assertEqual(self.fetch(url, max_chars=10)[0], "abcdefghij")
+        self.assertEqual(self.fetch(url, max_chars=5)[0], "abcde")
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.fetch(url, max_chars=50)[0], "abcdefghij" * 5)
+        self.assertEqual(len(self.server.requests), 2)
+        # A conditional GET would only confirm the shorter text, so none is sent.
+        self.assertNotIn('If-None-Match', self.server.requests[1][1])
+
+    def test_cache_is_trimmed_to_its_size_limit(self):
+        with override_settings(URL_CACHE_MAX_ENTRIES=3):
+            for n in range(5):
+                self.fetch(self.serve(f'/page{n}', b"text"))
+        self.assertEqual(len(os.listdir(settings.URL_CACHE_DIR)), 3)
+
+    def test_disabled_cache_fetches_every_time(self):
+        url = self.serve('/page', b"<p>Osmosis</p>", ETag='"v1"')
+        with override_settings(URL_CACHE_ENABLED=False):
+            self.fetch(url)
+            self.fetch(url)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(os.listdir(settings.URL_CACHE_DIR), [])
+
+    def test_extract_text_from_url(self):
+        url = self.serve('/article', b"<html><body><nav>Menu</nav><p>Mitochondria make ATP.</p></body></html>")
+        self.assertIn("Mitochondria make ATP.", services.extract_text_from_url(url))
+        with self.assertRaisesMessage(Exception, "Could not extract text from the URL"):
+            services.extract_text_from_url(url.replace('/article', '/missing'))
@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+FILE_TYPE_PDF = 'pdf'
+FILE_TYPE_PPT = 'ppt'  # OLE2 compound file (legacy PowerPoint)
+FILE_TYPE_PPTX = 'pptx'  # ZIP package (Office Open XML)
+
+_OLE2_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+_ZIP_SIGNATURE = b'PK\x03\x04'
+_PDF_SIGNATURE = b'%PDF-'
+# PDF readers accept a header anywhere in the first kilobyte.
+SNIFF_BYTES = 1024
+# Room for the other form fields and multipart boundaries next to the file.
+_FORM_OVERHEAD = 64 * 1024
+
+def detect_file_type(head):
+    """The type of a file from its first bytes, or None if it is not one we can read."""
+    if head.startswith(_OLE2_SIGNATURE):
+        return FILE_TYPE_PPT
+    if head.startswith(_ZIP_SIGNATURE):
+        return FILE_TYPE_PPTX
+    if _PDF_SIGNATURE in head[:SNIFF_BYTES]:
+        return FILE_TYPE_PDF
+    return None
+
+def uploaded_file_type(uploaded_file):
+    """The detected type of an upload, sniffing its first bytes if the upload handler did not."""
+    detected = getattr(uploaded_file, 'detected_type', None)
+    if detected is not None:
+        return detected
+    uploaded_file.seek(0)
+    head = uploaded_file.read(SNIFF_BYTES)
+    uploaded_file.seek(0)
+    return detect_file_type(head)
+
+def _too_large_message():
+    return f"The file is too large. The maximum size is {settings.UPLOAD_MAX_BYTES / (1024 * 1024):.3g} MB."
+
+class QuizUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams each uploaded file straight to a temp file, and stops reading the
+    request as soon as it is clear the upload is unusable: a Content-Length
+    or file above UPLOAD_MAX_BYTES, or first bytes that are not a PDF, OLE2
+    (.ppt) or ZIP (.pptx) file. The reason is left on `request.upload_error`
+    as (status, message) for the view to report. Accepted files carry their
+    `detected_type`.
+    """
+
+    def _reject(self, status, message):
+        self.request.upload_error = (status, message)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > settings.UPLOAD_MAX_BYTES + _FORM_OVERHEAD:
+            self._reject(413, _too_large_message())
+            # Claim the body as parsed (and empty) without reading any of it.
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.head = b''
+        self.detected_type = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.UPLOAD_MAX_BYTES:
+            self._reject(413, _too_large_message())
+            raise StopUpload(connection_reset=True)
+
+        if self.detected_type is None and len(self.head) < SNIFF_BYTES:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self._sniff()
+        return super().receive_data_chunk(raw_data, start)
+
+    def _sniff(self):
+        self.detected_type = detect_file_type(self.head)
+        if self.detected_type is None:
+            self._reject(415, "Unsupported file type. Please upload a PDF, .ppt or .pptx file.")
+            raise StopUpload(connection_reset=True)
+
+    def file_complete(self, file_size):
+        if self.detected_type is None:
+            try:
+                self._sniff()
+            except StopUpload:
+                # Too late to stop reading; just leave the file out of request.FILES.
+                self.file.close()
+                return None
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.detected_type = self.detected_type
+        return uploaded_file
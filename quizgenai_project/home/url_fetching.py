@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+_DOWNLOAD_CHUNK = 64 * 1024
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+_CHARSET = re.compile(r'charset\s*=\s*["\']?([^"\';\s]+)', re.IGNORECASE)
+
+_session = None
+_session_lock = threading.Lock()
+_cache_lock = threading.Lock()
+
+def get_session():
+    """The process-wide HTTP session, so repeat hosts reuse pooled connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=settings.URL_FETCH_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = USER_AGENT
+            _session = session
+        return _session
+
+def iter_body(response, max_bytes):
+    """Yield a streamed response body in chunks, stopping at `max_bytes`."""
+    received = 0
+    for chunk in response.iter_content(_DOWNLOAD_CHUNK):
+        if received + len(chunk) >= max_bytes:
+            yield chunk[:max_bytes - received]
+            return
+        received += len(chunk)
+        yield chunk
+
+def _cache_path(url):
+    return os.path.join(settings.URL_CACHE_DIR, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+def _read_cache(url):
+    try:
+        with open(_cache_path(url), encoding='utf-8') as fh:
+            entry = json.load(fh)
+        return entry if entry.get('url') == url else None
+    except (OSError, ValueError):
+        return None
+
+def _write_cache(url, entry):
+    """Store an entry atomically, then trim the cache to URL_CACHE_MAX_ENTRIES files."""
+    try:
+        os.makedirs(settings.URL_CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=settings.URL_CACHE_DIR, suffix='.tmp', delete=False) as tmp:
+            json.dump(entry, tmp)
+        os.replace(tmp.name, _cache_path(url))
+
+        with _cache_lock:
+            entries = [os.path.join(settings.URL_CACHE_DIR, name) for name in os.listdir(settings.URL_CACHE_DIR) if name.endswith('.json')]
+            if len(entries) > settings.URL_CACHE_MAX_ENTRIES:
+                entries.sort(key=os.path.getmtime)
+                for path in entries[:len(entries) - settings.URL_CACHE_MAX_ENTRIES]:
+                    os.remove(path)
+    except OSError as e:
+        print(f"Error writing URL cache entry: {e}")
+
+def declared_charset(response):
+    """
+    The charset named in the Content-Type header, or None. Unlike
+    `response.encoding` this does not assume ISO-8859-1 for text/* responses
+    that name none, so the page's own <meta> declaration still gets a say.
+    """
+    match = _CHARSET.search(response.headers.get('Content-Type', ''))
+    return match.group(1) if match else None
+
+def _fresh_for(response):
+    """Seconds a response may be reused without revalidation: its max-age, capped by URL_CACHE_FRESH_SECONDS."""
+    cache_control = response.headers.get('Cache-Control', '')
+    if 'no-store' in cache_control or 'no-cache' in cache_control:
+        return 0
+    match = _MAX_AGE.search(cache_control)
+    if match:
+        return min(int(match.group(1)), settings.URL_CACHE_FRESH_SECONDS)
+    return settings.URL_CACHE_FRESH_SECONDS
+
+def fetch_text(url, extract, max_chars=None):
+    """
+    Text of the page at `url`, produced by `extract(chunks, max_chars, encoding)`
+    from the body as it downloads, `encoding` being the Content-Type charset
+    (or None). An extractor that stops early ends the download.
+
+    Pages are downloaded over the shared session, streamed and capped at
+    URL_FETCH_MAX_BYTES. The extracted text is cached on disk with the
+    response's ETag/Last-Modified: a fresh entry is returned without any
+    request, a stale one is revalidated with a conditional GET and reused
+    on 304 Not Modified. Entries cut short by a smaller `max_chars` than
+    this request's are fetched again.
+    """
+    entry = _read_cache(url) if settings.URL_CACHE_ENABLED else None
+    if entry is not None and not entry.get('complete') and (max_chars is None or len(entry['text']) < max_chars):
+        entry = None
+    now = time.time()
+    if entry is not None and now < entry['fresh_until']:
+        return entry['text'][:max_chars]
+
+    headers = {}
+    if entry is not None:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    with get_session().get(url, headers=headers, timeout=10, stream=True) as response:
+        if response.status_code == 304 and entry is not None:
+            entry['fresh_until'] = now + _fresh_for(response)
+            _write_cache(url, entry)
+            return entry['text'][:max_chars]
+        response.raise_for_status()
+
+        declared_length = response.headers.get('Content-Length')
+        if declared_length and declared_length.isdigit() and int(declared_length) > settings.URL_FETCH_MAX_BYTES:
+            print(f"Page declares {declared_length} bytes; reading only the first {settings.URL_FETCH_MAX_BYTES}")
+        text = extract(iter_body(response, settings.URL_FETCH_MAX_BYTES), max_chars, declared_charset(response))
+
+        if settings.URL_CACHE_ENABLED:
+            _write_cache(url, {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fresh_until': now + _fresh_for(response),
+                # False when the text stopped at max_chars rather than the end of the page.
+                'complete': max_chars is None or len(text) < max_chars,
+                'text': text,
+            })
+    return text
@@ -8,6 +8,10 @@ urlpatterns = [
     path("settings/", views.settings_view, name="settings"),
     path("", views.index, name="home"),
     path("api/generate-quiz/", views.generate_quiz_view, name="generate-quiz"),
+    path("api/generate-quiz/stream/", views.generate_quiz_stream_view, name="generate-quiz-stream"),
+    path("api/generate-quiz/<uuid:job_id>/status/", views.generation_job_status_view, name="generation-job-status"),
+    path("api/generate-quiz/<uuid:job_id>/result/", views.generation_job_result_view, name="generation-job-result"),
+    path("api/estimate-time/", views.estimate_generation_time_view, name="estimate-time"),
     path("api/save-attempt/", views.save_quiz_attempt, name="save-attempt"),
     path("api/update-quiz-title/", views.update_quiz_title_view, name="update-quiz-title"),
     path("api/delete-quiz/", views.delete_quiz_view, name="delete-quiz"),
@@ -1,14 +1,20 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.contrib.auth import authenticate, login, logout, update_session_auth_hash
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.cache import never_cache
-from . import services
-from .models import Quiz, QuizAttempt
+from django.urls import reverse
+from django.conf import settings
+from django.db.models import Q
+from . import jobs, progress, telemetry, uploads
+from .models import GenerationJob, Quiz, QuizAttempt, UserProgressStats
 import json
+import queue
 import re
+import uuid
+from datetime import datetime
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
@@ -97,7 +103,7 @@ def logout_view(request):
 
 @no_cache
 def index(request):
-    return render(request, 'index.html')
+    return render(request, 'index.html', {'streaming_enabled': settings.QUIZ_STREAMING_ENABLED})
 
 def description(request):
     try:
@@ -106,13 +112,41 @@ def description(request):
         print(f"Could not find description.html: {e}")
         return render(request, 'index.html')
 
+def _owned_quizzes(request):
+    """The quizzes the requester may see: their own, or for anonymous visitors those made in this session."""
+    if request.user.is_authenticated:
+        return Quiz.objects.filter(user=request.user)
+    if not request.session.session_key:
+        return Quiz.objects.none()
+    return Quiz.objects.filter(user__isnull=True, session_key=request.session.session_key)
+
+def _parse_history_cursor(cursor):
+    """(created_at, id) from a history cursor "<ISO timestamp>~<quiz id>", or None if it is missing or malformed."""
+    try:
+        created_at, quiz_id = cursor.split('~')
+        return datetime.fromisoformat(created_at), uuid.UUID(quiz_id)
+    except (AttributeError, ValueError):
+        return None
+
 @no_cache
 def history_view(request):
-    if request.user.is_authenticated:
-        quizzes = Quiz.objects.filter(user=request.user).order_by('-created_at')
-    else:
-        quizzes = Quiz.objects.filter(user__isnull=True).order_by('-created_at')
-    return render(request, 'history.html', {'quizzes': quizzes})
+    # Newest first, a page at a time; `before` is the cursor of the last quiz on the previous page.
+    quizzes = _owned_quizzes(request).only('id', 'title', 'created_at').order_by('-created_at', '-id')
+    cursor = _parse_history_cursor(request.GET.get('before'))
+    if cursor is not None:
+        created_at, quiz_id = cursor
+        quizzes = quizzes.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=quiz_id))
+
+    quizzes = list(quizzes[:settings.HISTORY_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(quizzes) > settings.HISTORY_PAGE_SIZE:
+        quizzes = quizzes[:settings.HISTORY_PAGE_SIZE]
+        next_cursor = f"{quizzes[-1].created_at.isoformat()}~{quizzes[-1].id}"
+    return render(request, 'history.html', {
+        'quizzes': quizzes,
+        'next_cursor': next_cursor,
+        'is_first_page': cursor is None,
+    })
 
 @no_cache
 def quiz_detail_view(request, quiz_id):
@@ -121,7 +155,7 @@ def quiz_detail_view(request, quiz_id):
         # Get the latest attempt for this quiz by this user
         latest_attempt = QuizAttempt.objects.filter(quiz=quiz, user=request.user).order_by('-timestamp').first()
     else:
-        quiz = get_object_or_404(Quiz, id=quiz_id, user__isnull=True)
+        quiz = get_object_or_404(_owned_quizzes(request), id=quiz_id)
         latest_attempt = None
         
     if latest_attempt:
@@ -141,63 +175,210 @@ def quiz_detail_view(request, quiz_id):
 
 @no_cache
 def quiz_retake_view(request, quiz_id):
+    quiz = get_object_or_404(_owned_quizzes(request), id=quiz_id)
+    return render(request, 'quiz_retake.html', {'quiz': quiz})
+
+def _owned_job_or_404(request, job_id):
     if request.user.is_authenticated:
-        quiz = get_object_or_404(Quiz, id=quiz_id, user=request.user)
+        return get_object_or_404(GenerationJob, id=job_id, user=request.user)
+    return get_object_or_404(GenerationJob, id=job_id, user__isnull=True, session_key=request.session.session_key or '')
+
+def _upload_error_response(request):
+    """The error for an upload the upload handler stopped (too large or not a PDF/PowerPoint file), if any."""
+    # The upload handler only runs once the body is parsed.
+    request.FILES
+    upload_error = getattr(request, 'upload_error', None)
+    if upload_error is None:
+        return None
+    status, message = upload_error
+    return JsonResponse({'error': message}, status=status)
+
+def _uploaded_source(request):
+    """
+    The uploaded file from either form field and its source type, routed by
+    the file's first bytes rather than its name or field. (None, None) when
+    there is no upload.
+    """
+    uploaded_file = request.FILES.get('pdf') or request.FILES.get('ppt')
+    if uploaded_file is None:
+        return None, None
+    file_type = uploads.uploaded_file_type(uploaded_file)
+    if file_type == uploads.FILE_TYPE_PDF:
+        return uploaded_file, GenerationJob.SOURCE_PDF
+    if file_type in (uploads.FILE_TYPE_PPT, uploads.FILE_TYPE_PPTX):
+        return uploaded_file, GenerationJob.SOURCE_PPT
+    raise ValueError("Unsupported file type. Please upload a PDF, .ppt or .pptx file.")
+
+def _create_generation_job(request, uploaded_file, source_type, url_input):
+    """Record a generation job for the request and spool its upload; returns (job, upload_path)."""
+    # Anonymous visitors need a session so they can poll the job they started.
+    if not request.user.is_authenticated and not request.session.session_key:
+        request.session.save()
+
+    upload_path = None
+    if uploaded_file:
+        quiz_title = uploaded_file.name if uploaded_file.name else "Untitled Quiz"
+        upload_path = jobs.spool_upload(uploaded_file)
     else:
-        quiz = get_object_or_404(Quiz, id=quiz_id, user__isnull=True)
-    return render(request, 'quiz_retake.html', {'quiz': quiz})
+        source_type = GenerationJob.SOURCE_URL
+        # Create a title from the URL (domain + path)
+        from urllib.parse import urlparse
+        parsed_url = urlparse(url_input)
+        quiz_title = f"Quiz from {parsed_url.netloc}"
+
+    job = GenerationJob.objects.create(
+        user=request.user if request.user.is_authenticated else None,
+        session_key='' if request.user.is_authenticated else request.session.session_key,
+        source_type=source_type,
+        source_url=url_input if source_type == GenerationJob.SOURCE_URL else '',
+        title=quiz_title
+    )
+    return job, upload_path
+
+def _job_urls(job):
+    return {
+        'job_id': str(job.id),
+        'status': job.status,
+        'status_url': reverse('generation-job-status', args=[job.id]),
+        'result_url': reverse('generation-job-result', args=[job.id]),
+    }
+
+def _parse_num_questions(request):
+    """The requested question count, or None unless it is an integer from 1 to QUIZ_MAX_QUESTIONS."""
+    try:
+        num_questions = int(request.POST.get('num_questions', 5))
+    except (TypeError, ValueError):
+        return None
+    return num_questions if 1 <= num_questions <= settings.QUIZ_MAX_QUESTIONS else None
 
 @require_http_methods(["POST"])
 def generate_quiz_view(request):
-    pdf_file = request.FILES.get('pdf')
-    ppt_file = request.FILES.get('ppt')
+    error_response = _upload_error_response(request)
+    if error_response is not None:
+        return error_response
+    try:
+        uploaded_file, source_type = _uploaded_source(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=415)
     url_input = request.POST.get('url')
-    num_questions = request.POST.get('num_questions', 5)
+    num_questions = _parse_num_questions(request)
     custom_instructions = request.POST.get('custom_instructions', '')
 
-    if not pdf_file and not ppt_file and not url_input:
+    if not uploaded_file and not url_input:
         return JsonResponse({'error': 'No PDF, PPT, or URL provided'}, status=400)
+    if num_questions is None:
+        return JsonResponse({'error': f'num_questions must be an integer from 1 to {settings.QUIZ_MAX_QUESTIONS}'}, status=400)
 
     try:
-        if pdf_file:
-            quiz_data = services.generate_quiz_from_pdf(pdf_file, num_questions, custom_instructions)
-            quiz_title = pdf_file.name if pdf_file.name else "Untitled Quiz"
-        elif ppt_file:
-            quiz_data = services.generate_quiz_from_ppt(ppt_file, num_questions, custom_instructions)
-            quiz_title = ppt_file.name if ppt_file.name else "Untitled Quiz"
-        else:
-            quiz_data = services.generate_quiz_from_url(url_input, num_questions, custom_instructions)
-            # Create a title from the URL (domain + path)
-            from urllib.parse import urlparse
-            parsed_url = urlparse(url_input)
-            quiz_title = f"Quiz from {parsed_url.netloc}"
-
-        print(f"Saving quiz with title: {quiz_title}")
-        
-        quiz = Quiz.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            title=quiz_title,
-            quiz_data=quiz_data
-        )
-
-        # Limit anonymous quizzes to 5 (Rolling Window)
-        if not request.user.is_authenticated:
-            anon_quizzes = Quiz.objects.filter(user__isnull=True).order_by('created_at')
-            if anon_quizzes.count() > 5:
-                # Delete the oldest ones to keep only 5
-                num_to_delete = anon_quizzes.count() - 5
-                # Slicing a queryset returns a new queryset, we need to iterate or delete
-                # Note: Django doesn't support delete() on sliced querysets directly in some DBs,
-                # so we fetch IDs first.
-                ids_to_delete = list(anon_quizzes.values_list('id', flat=True)[:num_to_delete])
-                Quiz.objects.filter(id__in=ids_to_delete).delete()
-
-        return JsonResponse({'quiz_id': str(quiz.id), 'questions': quiz_data})
+        job, upload_path = _create_generation_job(request, uploaded_file, source_type, url_input)
+        jobs.submit_generation_job(job, num_questions, custom_instructions, upload_path=upload_path)
+        return JsonResponse(_job_urls(job), status=202)
 
     except Exception as e:
         print(f"Error in generate_quiz_view: {e}")
         return JsonResponse({'error': f'An error occurred: {str(e)}'}, status=500)
 
+@never_cache
+@require_http_methods(["GET"])
+def generation_job_status_view(request, job_id):
+    job = jobs.expire_stale_job(_owned_job_or_404(request, job_id))
+    data = {'job_id': str(job.id), 'status': job.status}
+    if job.status == GenerationJob.STATUS_FAILED:
+        data['error'] = job.error
+    elif job.status == GenerationJob.STATUS_DONE and job.quiz_id:
+        data['quiz_id'] = str(job.quiz_id)
+    return JsonResponse(data)
+
+@never_cache
+@require_http_methods(["GET"])
+def generation_job_result_view(request, job_id):
+    job = jobs.expire_stale_job(_owned_job_or_404(request, job_id))
+    if job.status == GenerationJob.STATUS_FAILED:
+        return JsonResponse({'error': f'An error occurred: {job.error}'}, status=500)
+    if job.status != GenerationJob.STATUS_DONE:
+        return JsonResponse({'job_id': str(job.id), 'status': job.status}, status=202)
+    if job.quiz is None:
+        return JsonResponse({'error': 'The generated quiz no longer exists.'}, status=404)
+    return JsonResponse({'quiz_id': str(job.quiz.id), 'questions': job.quiz.quiz_data})
+
+@require_http_methods(["GET"])
+def estimate_generation_time_view(request):
+    """Expected generation time for the countdown, from the learned latency model."""
+    source_type = request.GET.get('source_type', GenerationJob.SOURCE_PDF)
+    if source_type not in dict(GenerationJob.SOURCE_CHOICES):
+        return JsonResponse({'error': 'Unknown source_type'}, status=400)
+    try:
+        num_questions = int(request.GET.get('num_questions', 5))
+        file_size = int(request.GET['file_size']) if request.GET.get('file_size') else None
+    except ValueError:
+        return JsonResponse({'error': 'num_questions and file_size must be integers'}, status=400)
+
+    estimated_min, estimated_max = telemetry.predict_generation_time(source_type, num_questions, source_bytes=file_size)
+    return JsonResponse({'min_seconds': estimated_min, 'max_seconds': estimated_max})
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@require_http_methods(["POST"])
+def generate_quiz_stream_view(request):
+    """
+    Generate a quiz and push each question to the browser as a Server-Sent Event.
+    The generation runs as a job on the worker pool, so this request only relays
+    its questions; comment lines keep the connection alive while none arrive,
+    and the job can still be polled if the connection drops. Only served with
+    QUIZ_STREAMING_ENABLED.
+    """
+    if not settings.QUIZ_STREAMING_ENABLED:
+        return JsonResponse({'error': 'Streaming is disabled'}, status=404)
+    error_response = _upload_error_response(request)
+    if error_response is not None:
+        return error_response
+    try:
+        uploaded_file, source_type = _uploaded_source(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=415)
+    url_input = request.POST.get('url')
+    num_questions = _parse_num_questions(request)
+    custom_instructions = request.POST.get('custom_instructions', '')
+
+    if not uploaded_file and not url_input:
+        return JsonResponse({'error': 'No PDF, PPT, or URL provided'}, status=400)
+    if num_questions is None:
+        return JsonResponse({'error': f'num_questions must be an integer from 1 to {settings.QUIZ_MAX_QUESTIONS}'}, status=400)
+
+    try:
+        job, upload_path = _create_generation_job(request, uploaded_file, source_type, url_input)
+        events = queue.Queue()
+        jobs.submit_generation_job(job, num_questions, custom_instructions, upload_path=upload_path, events=events)
+    except Exception as e:
+        print(f"Error in generate_quiz_stream_view: {e}")
+        return JsonResponse({'error': f'An error occurred: {str(e)}'}, status=500)
+
+    def event_stream():
+        yield _sse_event('job', _job_urls(job))
+        count = 0
+        while True:
+            try:
+                kind, payload = events.get(timeout=settings.SSE_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            if kind == 'question':
+                yield _sse_event('question', {'index': count, 'question': payload})
+                count += 1
+            elif kind == 'done':
+                yield _sse_event('done', {'quiz_id': str(payload.id), 'count': count})
+                return
+            else:
+                yield _sse_event('error', {'error': f'An error occurred: {payload}'})
+                return
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @require_http_methods(["POST"])
 def update_quiz_title_view(request):
     try:
@@ -208,10 +389,7 @@ def update_quiz_title_view(request):
         if not quiz_id or not new_title:
             return JsonResponse({'error': 'Missing quiz_id or new_title'}, status=400)
 
-        if request.user.is_authenticated:
-            quiz = get_object_or_404(Quiz, id=quiz_id, user=request.user)
-        else:
-            quiz = get_object_or_404(Quiz, id=quiz_id, user__isnull=True)
+        quiz = get_object_or_404(_owned_quizzes(request), id=quiz_id)
         
         quiz.title = new_title
         quiz.save()
@@ -233,21 +411,10 @@ def save_quiz_attempt(request):
         if not quiz_id or score is None or user_answers is None:
             return JsonResponse({'error': 'Missing required fields'}, status=400)
 
-        if request.user.is_authenticated:
-            quiz = get_object_or_404(Quiz, id=quiz_id, user=request.user)
-            user = request.user
-        else:
-            # For anonymous users, we might still want to save it if we have the quiz ID
-            # But typically we only save history for logged-in users or if the quiz exists
-            quiz = get_object_or_404(Quiz, id=quiz_id)
-            user = None
-
-        QuizAttempt.objects.create(
-            quiz=quiz,
-            user=user,
-            score=score,
-            user_answers=user_answers
-        )
+        quiz = get_object_or_404(_owned_quizzes(request).only('id', 'question_count'), id=quiz_id)
+        user = request.user if request.user.is_authenticated else None
+
+        progress.record_attempt(quiz, user, int(score), user_answers)
 
         return JsonResponse({'success': True})
 
@@ -264,10 +431,7 @@ def delete_quiz_view(request):
         if not quiz_id:
             return JsonResponse({'error': 'Missing quiz_id'}, status=400)
 
-        if request.user.is_authenticated:
-            quiz = get_object_or_404(Quiz, id=quiz_id, user=request.user)
-        else:
-            quiz = get_object_or_404(Quiz, id=quiz_id, user__isnull=True)
+        quiz = get_object_or_404(_owned_quizzes(request), id=quiz_id)
         
         quiz.delete()
 
@@ -330,11 +494,9 @@ def settings_view(request):
 @login_required(login_url='login')
 @no_cache
 def progress_view(request):
-    attempts = QuizAttempt.objects.filter(user=request.user).select_related('quiz').order_by('timestamp')
-    
-    total_attempts = attempts.count()
-    
-    if total_attempts == 0:
+    stats = UserProgressStats.objects.filter(user=request.user).first()
+
+    if stats is None or stats.total_attempts == 0:
         context = {
             'total_attempts': 0,
             'average_score': 0,
@@ -343,74 +505,32 @@ def progress_view(request):
         }
         return render(request, 'progress.html', context)
 
-    total_percentage = 0
-    total_correct = 0
-    total_questions_all = 0
-    
+    # Prepare data for stacked bar chart, one bar per day
+    chart_labels = []
     correct_data = []
     incorrect_data = []
-    chart_labels = []
-    
-    highest_score = 0
-    perfect_quizzes = 0
-
-    for attempt in attempts:
-        # Calculate percentage for this attempt
-        # We need to know the total number of questions in the quiz
-        # quiz_data is a list of questions
-        try:
-            total_questions = len(attempt.quiz.quiz_data)
-            if total_questions > 0:
-                percentage = (attempt.score / total_questions) * 100
-            else:
-                percentage = 0
-            
-            total_correct += attempt.score
-            total_questions_all += total_questions
-            
-            if percentage > highest_score:
-                highest_score = percentage
-            
-            if percentage == 100 and total_questions > 0:
-                perfect_quizzes += 1
-            
-            # Prepare data for stacked bar chart
-            correct_data.append(attempt.score)
-            incorrect_count = total_questions - attempt.score
-            incorrect_data.append(max(0, incorrect_count))
-            
-        except Exception:
-            percentage = 0
-            correct_data.append(0)
-            incorrect_data.append(0)
-        
-        total_percentage += percentage
-        
+    for day in progress.daily_results(request.user, settings.PROGRESS_CHART_DAYS):
         # Format date for chart label (e.g., "Nov 20")
-        chart_labels.append(attempt.timestamp.strftime('%b %d'))
-
-    average_score = round(total_percentage / total_attempts, 1)
-    total_incorrect = total_questions_all - total_correct
+        chart_labels.append(day['day'].strftime('%b %d'))
+        correct_data.append(day['correct'])
+        incorrect_data.append(max(0, day['questions'] - day['correct']))
 
     context = {
-        'total_attempts': total_attempts,
-        'average_score': average_score,
+        'total_attempts': stats.total_attempts,
+        'average_score': round(stats.percentage_sum / stats.total_attempts, 1),
         'chart_labels': json.dumps(chart_labels),
         'correct_data': json.dumps(correct_data),
         'incorrect_data': json.dumps(incorrect_data),
-        'total_correct': total_correct,
-        'total_incorrect': total_incorrect,
-        'highest_score': round(highest_score, 1),
-        'perfect_quizzes': perfect_quizzes,
-        'total_questions_all': total_questions_all
+        'total_correct': stats.total_correct,
+        'total_incorrect': stats.total_questions - stats.total_correct,
+        'highest_score': round(stats.best_percentage, 1),
+        'perfect_quizzes': stats.perfect_count,
+        'total_questions_all': stats.total_questions
     }
     return render(request, 'progress.html', context)
 
 def download_quiz_pdf(request, quiz_id):
-    if request.user.is_authenticated:
-        quiz = get_object_or_404(Quiz, id=quiz_id, user=request.user)
-    else:
-        quiz = get_object_or_404(Quiz, id=quiz_id, user__isnull=True)
+    quiz = get_object_or_404(_owned_quizzes(request), id=quiz_id)
 
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
@@ -472,10 +592,7 @@ def download_quiz_pdf(request, quiz_id):
 
 @no_cache
 def flashcards_view(request, quiz_id):
-    if request.user.is_authenticated:
-        quiz = get_object_or_404(Quiz, id=quiz_id, user=request.user)
-    else:
-        quiz = get_object_or_404(Quiz, id=quiz_id, user__isnull=True)
+    quiz = get_object_or_404(_owned_quizzes(request), id=quiz_id)
     
     return render(request, 'flashcards.html', {'quiz': quiz})
 
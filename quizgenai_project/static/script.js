@@ -196,8 +196,8 @@ document.addEventListener('DOMContentLoaded', () => {
         const numQuestions = parseInt(questionCountSlider ? questionCountSlider.value : '5');
         const formData = new FormData();
         
-        let estimatedMin = 15;
-        let estimatedMax = 25;
+        let sourceType = 'pdf';
+        let fileSize = null;
 
         if (activeTab === 'pdf-tab') {
             const file = pdfInput.files[0];
@@ -206,10 +206,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
             formData.append('pdf', file);
-            
-            const fileSizeMB = file.size / (1024 * 1024);
-            estimatedMin += Math.ceil(fileSizeMB * 5);
-            estimatedMax += Math.ceil(fileSizeMB * 8);
+            fileSize = file.size;
         } else if (activeTab === 'ppt-tab') {
             const file = pptInput.files[0];
             if (!file) {
@@ -217,10 +214,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
             formData.append('ppt', file);
-            
-            const fileSizeMB = file.size / (1024 * 1024);
-            estimatedMin += Math.ceil(fileSizeMB * 5);
-            estimatedMax += Math.ceil(fileSizeMB * 8);
+            sourceType = 'ppt';
+            fileSize = file.size;
         } else if (activeTab === 'url-tab') {
             const url = urlInput.value.trim();
             if (!url) {
@@ -228,18 +223,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
             formData.append('url', url);
-            // Estimate for URL (assume average page size)
-            estimatedMin += 5;
-            estimatedMax += 10;
+            sourceType = 'url';
         }
         
-        estimatedMin += (numQuestions * 3);
-        estimatedMax += (numQuestions * 5);
-        
-        estimatedMin = Math.min(estimatedMin, 180);
-        estimatedMax = Math.min(estimatedMax, 180);
-        
-        const countdownSeconds = Math.ceil((estimatedMin + estimatedMax) / 2);
+        // Learned from past generations on the server
+        const estimate = await fetchGenerationEstimate(sourceType, fileSize, numQuestions);
+        const countdownSeconds = Math.ceil((estimate.min_seconds + estimate.max_seconds) / 2);
         
         uploadContainer.classList.add('hidden');
         loadingContainer.classList.remove('hidden');
@@ -291,6 +280,12 @@ document.addEventListener('DOMContentLoaded', () => {
         formData.append('custom_instructions', customInstructionsInput ? customInstructionsInput.value : '');
 
         try {
+            // Stream questions in as they are generated when the browser supports it
+            if (API_URLS.generateQuizStream && window.ReadableStream && window.TextDecoder) {
+                await generateQuizStreamed(formData);
+                return;
+            }
+
             // UPDATED: Use dynamic API URL from index.html
             const response = await fetch(API_URLS.generateQuiz, {
                 method: 'POST',
@@ -321,7 +316,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(errorMessage);
             }
 
-            const responseData = await response.json();
+            let responseData = await response.json();
+
+            // Generation runs as a background job; poll until it finishes
+            if (responseData.job_id) {
+                responseData = await waitForGenerationJob(responseData);
+            }
             
             // Handle both old format (array) and new format (object with quiz_id)
             let data;
@@ -366,10 +366,108 @@ document.addEventListener('DOMContentLoaded', () => {
                 clearInterval(countdownInterval);
             }
             loadingContainer.classList.add('hidden');
+            quizContainer.classList.add('hidden');
+            document.body.classList.remove('scrollable');
             uploadContainer.classList.remove('hidden');
         }
     });
 
+    async function generateQuizStreamed(formData) {
+        const submitBtn = quizContainer.querySelector('.submit-btn');
+        quizData = [];
+        currentQuizId = null;
+        quizForm.innerHTML = '';
+        if (submitBtn) submitBtn.disabled = true;
+
+        try {
+            const result = await streamQuiz(formData, (question) => {
+                if (quizData.length === 0) {
+                    // First question is in: swap the countdown for the quiz
+                    clearInterval(countdownInterval);
+                    loadingContainer.classList.add('hidden');
+                    quizContainer.classList.remove('hidden');
+                    document.body.classList.add('scrollable');
+                }
+                quizForm.appendChild(renderQuestion(question, quizData.length, 0));
+                quizData.push(question);
+            });
+            currentQuizId = result.quiz_id;
+        } finally {
+            if (submitBtn) submitBtn.disabled = false;
+        }
+    }
+
+    async function streamQuiz(formData, onQuestion) {
+        const response = await fetch(API_URLS.generateQuizStream, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+            },
+            body: formData,
+        });
+
+        if (!response.ok) {
+            throw new Error(await readErrorMessage(response));
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let job = null;
+        let received = 0;
+
+        while (true) {
+            let chunk;
+            try {
+                chunk = await reader.read();
+            } catch (error) {
+                if (!job) throw error;
+                break;
+            }
+            if (chunk.done) break;
+            buffer += decoder.decode(chunk.value, { stream: true });
+
+            // Server-Sent Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const event = parseServerSentEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+
+                if (event.type === 'job') {
+                    job = event.data;
+                } else if (event.type === 'question') {
+                    onQuestion(event.data.question);
+                    received++;
+                } else if (event.type === 'done') {
+                    return event.data;
+                } else if (event.type === 'error') {
+                    throw new Error(event.data.error || 'Quiz generation failed.');
+                }
+            }
+        }
+
+        if (!job) {
+            throw new Error('The connection closed before the quiz was complete.');
+        }
+        // The connection dropped but the job carries on; collect the rest of its questions
+        const result = await waitForGenerationJob(job);
+        result.questions.slice(received).forEach(onQuestion);
+        return { quiz_id: result.quiz_id, count: result.questions.length };
+    }
+
+    function parseServerSentEvent(rawEvent) {
+        let type = 'message';
+        const dataLines = [];
+        rawEvent.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                type = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        return { type, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : {} };
+    }
+
     quizForm.addEventListener('submit', async (event) => {
         event.preventDefault();
         const score = calculateScore();
@@ -430,54 +528,58 @@ document.addEventListener('DOMContentLoaded', () => {
 
         quizForm.innerHTML = '';
         questions.forEach((q, index) => {
-            const questionBlock = document.createElement('div');
-            questionBlock.classList.add('question-block', 'animate-fade-in');
-            questionBlock.style.animationDelay = `${index * 0.1}s`;
-            questionBlock.style.opacity = '0'; // Start invisible so animation can fade it in
-
-            const questionText = document.createElement('p');
-            questionText.classList.add('question-text');
-            questionText.textContent = `${index + 1}. ${q.question}`;
-
-            const optionsList = document.createElement('ul');
-            optionsList.classList.add('options-list');
-
-            if (q.options && Array.isArray(q.options)) {
-                q.options.forEach((option, optionIndex) => {
-                    const optionItem = document.createElement('li');
-                    optionItem.classList.add('option');
-
-                    const radioInput = document.createElement('input');
-                    radioInput.type = 'radio';
-                    radioInput.name = `question-${index}`;
-                    radioInput.value = optionIndex;
-                    radioInput.id = `q${index}-o${optionIndex}`;
-                    radioInput.required = true;
-
-                    const optionLabel = document.createElement('label');
-                    optionLabel.textContent = option;
-                    optionLabel.htmlFor = `q${index}-o${optionIndex}`;
-
-                    optionItem.appendChild(radioInput);
-                    optionItem.appendChild(optionLabel);
-
-                    optionItem.addEventListener('click', () => {
-                        radioInput.checked = true;
-                        
-                        // Visual selection state
-                        const siblings = optionsList.querySelectorAll('.option');
-                        siblings.forEach(sib => sib.classList.remove('selected'));
-                        optionItem.classList.add('selected');
-                    });
+            quizForm.appendChild(renderQuestion(q, index, index * 0.1));
+        });
+    }
 
-                    optionsList.appendChild(optionItem);
+    function renderQuestion(q, index, animationDelay) {
+        const questionBlock = document.createElement('div');
+        questionBlock.classList.add('question-block', 'animate-fade-in');
+        questionBlock.style.animationDelay = `${animationDelay}s`;
+        questionBlock.style.opacity = '0'; // Start invisible so animation can fade it in
+
+        const questionText = document.createElement('p');
+        questionText.classList.add('question-text');
+        questionText.textContent = `${index + 1}. ${q.question}`;
+
+        const optionsList = document.createElement('ul');
+        optionsList.classList.add('options-list');
+
+        if (q.options && Array.isArray(q.options)) {
+            q.options.forEach((option, optionIndex) => {
+                const optionItem = document.createElement('li');
+                optionItem.classList.add('option');
+
+                const radioInput = document.createElement('input');
+                radioInput.type = 'radio';
+                radioInput.name = `question-${index}`;
+                radioInput.value = optionIndex;
+                radioInput.id = `q${index}-o${optionIndex}`;
+                radioInput.required = true;
+
+                const optionLabel = document.createElement('label');
+                optionLabel.textContent = option;
+                optionLabel.htmlFor = `q${index}-o${optionIndex}`;
+
+                optionItem.appendChild(radioInput);
+                optionItem.appendChild(optionLabel);
+
+                optionItem.addEventListener('click', () => {
+                    radioInput.checked = true;
+                    
+                    // Visual selection state
+                    const siblings = optionsList.querySelectorAll('.option');
+                    siblings.forEach(sib => sib.classList.remove('selected'));
+                    optionItem.classList.add('selected');
                 });
-            }
 
-            questionBlock.appendChild(questionText);
-            questionBlock.appendChild(optionsList);
-            quizForm.appendChild(questionBlock);
-        });
+                optionsList.appendChild(optionItem);
+            });
+        }
+
+        questionBlock.appendChild(questionText);
+        questionBlock.appendChild(optionsList);
+        return questionBlock;
     }
 
     function calculateScore() {
@@ -574,6 +676,59 @@ document.addEventListener('DOMContentLoaded', () => {
         return answers;
     }
 
+    async function fetchGenerationEstimate(sourceType, fileSize, numQuestions) {
+        const params = new URLSearchParams({ source_type: sourceType, num_questions: numQuestions });
+        if (fileSize !== null) {
+            params.append('file_size', fileSize);
+        }
+        try {
+            const response = await fetch(`${API_URLS.estimateTime}?${params}`);
+            if (response.ok) {
+                return await response.json();
+            }
+        } catch (error) {
+            console.error('Error fetching the time estimate:', error);
+        }
+        // The countdown is only a guide; fall back to a typical duration.
+        return { min_seconds: 20, max_seconds: 40 };
+    }
+
+    async function readErrorMessage(response) {
+        try {
+            const data = await response.json();
+            return data.error || 'Something went wrong on the server.';
+        } catch (e) {
+            return 'Something went wrong on the server.';
+        }
+    }
+
+    async function waitForGenerationJob(job) {
+        const pollIntervalMs = 2000;
+
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, pollIntervalMs));
+
+            const statusResponse = await fetch(job.status_url, { cache: 'no-store' });
+            if (!statusResponse.ok) {
+                throw new Error(await readErrorMessage(statusResponse));
+            }
+
+            const status = await statusResponse.json();
+            if (status.status === 'failed') {
+                throw new Error(status.error || 'Quiz generation failed.');
+            }
+            if (status.status === 'done') {
+                break;
+            }
+        }
+
+        const resultResponse = await fetch(job.result_url, { cache: 'no-store' });
+        if (!resultResponse.ok) {
+            throw new Error(await readErrorMessage(resultResponse));
+        }
+        return resultResponse.json();
+    }
+
     function getCookie(name) {
         let cookieValue = null;
         if (document.cookie && document.cookie !== '') {